@@ -0,0 +1,37 @@
+# polars engine settings shared by the analysis
+# queries run on polars' streaming engine so snapshots are processed in batches instead of
+# being materialized whole. ANALYSIS_MEMORY_MB is a rough memory budget (e.g. 4096 on a 7 GB
+# GitHub runner): it sizes the streaming batches so every thread's batch fits in a share of
+# it. ANALYSIS_ENGINE=in-memory switches back to the default engine for comparison.
+# POLARS_MAX_THREADS has to be set before polars is imported, so it's set by the caller.
+
+import logging
+import os
+import polars as pl
+
+engine = os.environ.get("ANALYSIS_ENGINE", "streaming")
+memory_budget_mb = int(os.environ.get("ANALYSIS_MEMORY_MB", "0")) or None
+
+# a generous per-row estimate for a catalog record with its resources, tags and extras
+row_bytes = 16 * 1024
+# the budget is split between threads, and each batch is copied a few times on its way through a query
+batch_copies = 4
+
+# size the streaming batches for a memory budget; returns the rows per batch
+def configure(memory_mb: int = memory_budget_mb) -> int:
+    if not memory_mb:
+        return None
+    rows = memory_mb * 1024 * 1024 // (row_bytes * batch_copies * pl.thread_pool_size())
+    rows = max(1000, min(rows, 100000))
+    pl.Config.set_streaming_chunk_size(rows)
+    logging.debug(f"streaming batches of {rows} rows for a {memory_mb} MB budget")
+    return rows
+
+def collect(frame: pl.LazyFrame) -> pl.DataFrame:
+    return frame.collect(engine=engine)
+
+# several queries at once, sharing their common scans
+def collect_all(frames: list[pl.LazyFrame]) -> list[pl.DataFrame]:
+    return pl.collect_all(frames, engine=engine)
+
+configure()
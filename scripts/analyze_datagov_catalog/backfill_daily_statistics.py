@@ -0,0 +1,205 @@
+# %%
+# regenerate the daily statistics for many cycles at once
+# every snapshot is converted and indexed exactly once, the day pairs are then split into
+# contiguous runs across a process pool, and each worker keeps the indexes it has loaded in
+# a memory-bounded LRU cache so the sliding window never loads a snapshot twice.
+# days whose output already exists with the current statistics_version are skipped.
+
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+import polars as pl
+
+# every script folder on the import path (see script_paths.py one folder up)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import script_paths  # noqa: F401
+
+from catalog_statistics import (
+    build_daily_statistics,
+    get_archive,
+    get_recent_snapshots,
+    get_statistics_file_name,
+    statistics_version,
+    sync_catalog_folders,
+    write_daily_statistics,
+    write_run_metrics
+)
+from organization_dimension import load_organization_dimension
+from run_metrics import RunMetrics
+from snapshot_index import index_file_name, load_snapshot_index
+from snapshot_resources import load_snapshot_resources, resources_file_name
+from snapshot_store import get_snapshot_folder
+from statistics_store import open_store, update_store
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s.%(msecs)03d %(levelname)-8s| %(message)s",
+    datefmt="%H:%M:%S"
+)
+
+local_config = {
+    "input": {
+        "data_folder": "../../data/data_gov_catalog_ndjson",
+        "parquet_folder": "../../data/data_gov_catalog_parquet"
+    },
+    "output": {
+        "statistics_folder": "../../data/daily_statistics",
+        "statistics_store": "../../data/statistics.sqlite"
+    }
+}
+
+# %%
+# functions
+
+# keeps loaded snapshot indexes until their estimated size exceeds the budget
+class SnapshotCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, folder: str, parquet_folder: str):
+        if folder in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(folder)
+            return self.entries[folder][0]
+
+        self.misses += 1
+        value = load_snapshot_index(folder, parquet_folder)
+        size = sum(frame.estimated_size() for frame in value)
+        self.entries[folder] = (value, size)
+        self.size += size
+        # always keep the newest entry, even if it alone is over budget
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+        return value
+
+# an existing output is up to date if it was built by the same statistics version and is
+# newer than the snapshot indexes and resources tables it was computed from
+def is_output_current(folder: str, older_folder: str, statistics_folder: str, parquet_folder: str) -> bool:
+    filename = get_statistics_file_name(statistics_folder, folder)
+    if not os.path.exists(filename):
+        return False
+    with open(filename, "r") as file:
+        if json.load(file).get("version") != statistics_version:
+            return False
+    output_time = os.path.getmtime(filename)
+    for snapshot in (folder, older_folder):
+        for file_name in (index_file_name, resources_file_name):
+            path = os.path.join(get_snapshot_folder(snapshot, parquet_folder), file_name)
+            if not os.path.exists(path) or os.path.getmtime(path) > output_time:
+                return False
+    return True
+
+# convert, index and explode the resources of one snapshot; run once per folder before
+# any pairs are compared
+def prepare_snapshot(folder: str, parquet_folder: str) -> str:
+    load_snapshot_index(folder, parquet_folder)
+    load_snapshot_resources(folder, parquet_folder)
+    return folder
+
+# compute a contiguous run of (folder, older_folder) pairs with a worker-local cache
+def process_pairs(pairs: list[tuple[str, str]], parquet_folder: str, statistics_folder: str,
+                  dimension: pl.DataFrame, cache_bytes: int) -> list[str]:
+    cache = SnapshotCache(cache_bytes)
+    written = []
+    for folder, older_folder in pairs:
+        metrics = RunMetrics(job="backfill", run=os.path.basename(folder))
+        result = build_daily_statistics(folder, older_folder, parquet_folder, dimension=dimension,
+                                        load_index=cache.load, metrics=metrics, statistics_folder=statistics_folder)
+        written.append(write_daily_statistics(result, statistics_folder))
+        write_run_metrics(metrics, folder, parquet_folder)
+        logging.info(f"wrote {written[-1]}")
+    logging.debug(f"cache hits: {cache.hits}, misses: {cache.misses}")
+    return written
+
+# split pairs into at most `chunks` contiguous runs of roughly equal length
+def split_pairs(pairs: list, chunks: int) -> list[list]:
+    chunks = max(1, min(chunks, len(pairs)))
+    size, remainder = divmod(len(pairs), chunks)
+    runs = []
+    begin = 0
+    for i in range(chunks):
+        end = begin + size + (1 if i < remainder else 0)
+        runs.append(pairs[begin:end])
+        begin = end
+    return runs
+
+def backfill(cycles: int = None, workers: int = os.cpu_count(), cache_mb: int = 1024, force: bool = False,
+             archive_url: str = None, memory_mb: int = None) -> list[str]:
+    data_folder = local_config["input"]["data_folder"]
+    parquet_folder = local_config["input"]["parquet_folder"]
+    statistics_folder = local_config["output"]["statistics_folder"]
+    os.makedirs(statistics_folder, exist_ok=True)
+    dimension = load_organization_dimension()
+
+    archive = get_archive(archive_url)
+    if archive:
+        sync_catalog_folders(data_folder, archive, cycles=cycles)
+
+    folders = get_recent_snapshots(data_folder, parquet_folder, cycles=cycles)
+    pairs = list(zip(folders[:-1], folders[1:]))
+
+    # spawned workers size their streaming batches from ANALYSIS_MEMORY_MB (see analysis_engine.py)
+    if memory_mb:
+        os.environ["ANALYSIS_MEMORY_MB"] = str(max(1, memory_mb // max(1, workers)))
+
+    # polars' thread pool doesn't survive fork, so workers are spawned
+    mp_context = multiprocessing.get_context("spawn")
+
+    # make sure each snapshot is indexed first so all indexes exist when outputs are checked
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool:
+        list(pool.map(prepare_snapshot, folders, [parquet_folder] * len(folders)))
+
+    if not force:
+        pending = [p for p in pairs if not is_output_current(p[0], p[1], statistics_folder, parquet_folder)]
+        logging.info(f"skipping {len(pairs) - len(pending)} of {len(pairs)} days that are up to date")
+        pairs = pending
+
+    # the budget is shared between workers
+    written = []
+    cache_bytes = cache_mb * 1024 * 1024 // max(1, workers)
+    if pairs:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool:
+            futures = [
+                pool.submit(process_pairs, run, parquet_folder, statistics_folder, dimension, cache_bytes)
+                for run in split_pairs(pairs, workers)
+            ]
+            written = [filename for future in futures for filename in future.result()]
+
+    # the time-series store has a single writer, so the new files are ingested here
+    connection = open_store(local_config["output"]["statistics_store"])
+    days = update_store(connection, statistics_folder)
+    connection.close()
+    logging.info(f"ingested {len(days)} days into the statistics store")
+    return written
+
+# %%
+# run the backfill
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Regenerate the daily statistics for many cycles.")
+    parser.add_argument("--cycles", type=int, default=None, help="number of cycles to go back (default: all snapshots)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--cache-mb", type=int, default=1024, help="memory budget for cached snapshot indexes across all workers")
+    parser.add_argument("--memory-mb", type=int, default=None, help="memory budget for the streaming queries across all workers")
+    parser.add_argument("--force", action="store_true", help="regenerate days whose output is already up to date")
+    parser.add_argument("--archive", default=None, help="storage url to pull snapshots from first (default: CATALOG_STORAGE if set)")
+    args = parser.parse_args()
+
+    _script_start = time.time()
+    written = backfill(cycles=args.cycles, workers=args.workers, cache_mb=args.cache_mb, force=args.force,
+                       archive_url=args.archive, memory_mb=args.memory_mb)
+
+    elapsed = time.time() - _script_start
+    formatted = time.strftime("%H:%M:%S", time.gmtime(elapsed))
+    logging.info(f"wrote {len(written)} files; elapsed time " + formatted)
@@ -0,0 +1,83 @@
+# single-pass diff between two catalog snapshots
+# every record is reduced to its id, organization id and one 64-bit hash per top-level field;
+# a single full outer join of the two hash frames then yields added, removed and modified
+# datasets, and for modified datasets the list of top-level fields that changed
+
+import polars as pl
+
+from analysis_engine import collect
+from catalog_extras import derived_columns
+
+# columns that identify a record rather than describe it, so they're never compared
+key_columns = ["id", "organization_id"]
+hash_seed = 0
+
+# get the top-level fields compared between snapshots; the columns pivoted out of "extras"
+# are covered by the "extras" field itself
+def get_compared_fields(catalog: pl.LazyFrame) -> list[str]:
+    return [c for c in catalog.collect_schema().names() if c not in key_columns and c not in derived_columns]
+
+# hash of one top-level field; polars can't hash lists of structs (resources, tags, groups,
+# extras), so every field is hashed through its json form
+def hash_field(field: str) -> pl.Expr:
+    return pl.struct(field).struct.json_encode().hash(seed=hash_seed).alias(field)
+
+# reduce a catalog to (id, organization_id, record_hash, <field hashes>, <extra columns>)
+def hash_catalog(catalog: pl.LazyFrame, fields: list[str], extra_columns: list[pl.Expr] = []) -> pl.LazyFrame:
+    return catalog \
+        .select(
+            *key_columns,
+            *[hash_field(f) for f in fields],
+            *extra_columns
+        ) \
+        .with_columns(pl.struct(fields).hash(seed=hash_seed).alias("record_hash"))
+
+# compare two snapshots in one pass: one row per added, removed or modified id with its
+# organization id, the change and the fields that changed, sorted by id
+def get_changes(older: pl.LazyFrame, newer: pl.LazyFrame) -> pl.LazyFrame:
+    fields = [f for f in get_compared_fields(newer) if f in get_compared_fields(older)]
+
+    return hash_catalog(newer, fields) \
+        .join(hash_catalog(older, fields), on="id", how="full", suffix="_older", coalesce=True) \
+        .filter(
+            pl.col("record_hash").is_null()
+            | pl.col("record_hash_older").is_null()
+            | (pl.col("record_hash") != pl.col("record_hash_older"))
+        ) \
+        .select(
+            "id",
+            pl.coalesce("organization_id", "organization_id_older").alias("organization_id"),
+            pl.when(pl.col("record_hash_older").is_null()).then(pl.lit("added"))
+                .when(pl.col("record_hash").is_null()).then(pl.lit("removed"))
+                .otherwise(pl.lit("modified"))
+                .alias("change"),
+            pl.concat_list([
+                pl.when(pl.col(f) != pl.col(f"{f}_older")).then(pl.lit(f)).otherwise(pl.lit(None, dtype=pl.String))
+                for f in fields
+            ]).list.drop_nulls().alias("changed_fields")
+        ) \
+        .sort("id")
+
+# only ids, organization ids and changed field names are returned
+def get_catalog_differences(older: pl.LazyFrame, newer: pl.LazyFrame) -> dict:
+    return format_differences(collect(get_changes(older, newer)))
+
+# field-level changes for a known set of modified ids (e.g. from the snapshot indexes)
+def get_changed_field_frame(older: pl.LazyFrame, newer: pl.LazyFrame, ids: list[str] | pl.Series) -> pl.DataFrame:
+    id_filter = pl.col("id").is_in(ids)
+    return collect(
+        get_changes(older=older.filter(id_filter), newer=newer.filter(id_filter))
+            .filter(pl.col("change") == "modified")
+            .select(*key_columns, "changed_fields")
+    )
+
+# split the joined change frame into the compact json layout
+def format_differences(changes: pl.DataFrame) -> dict:
+    def records(change: str, columns: list[str]) -> list[dict]:
+        return changes.filter(pl.col("change") == change).select(columns).to_dicts()
+
+    return {
+        "added": records("added", key_columns),
+        "removed": records("removed", key_columns),
+        "modified": records("modified", key_columns + ["changed_fields"])
+    }
@@ -0,0 +1,87 @@
+# flat columns pivoted out of each dataset's "extras" key/value list
+# the snapshot store adds one column per configured extras key when a snapshot is parsed, plus
+# publisher_path, the publisher hierarchy split into its levels. These columns are derived from
+# "extras", so they're not compared separately when diffing snapshots; counts by publisher or
+# by extras value are plain group-bys on them.
+
+import polars as pl
+
+from analysis_engine import collect, collect_all
+
+# column name -> extras key; values stay strings, as CKAN stores them
+extras_columns = {
+    "publisher_hierarchy": "publisher_hierarchy",
+    "publisher": "publisher",
+    "access_level": "accessLevel",
+    "bureau_code": "bureauCode",
+    "program_code": "programCode",
+    "harvest_source_id": "harvest_source_id",
+    "harvest_source_title": "harvest_source_title"
+}
+
+# columns whose value counts are included in the statistics
+counted_extras = ["access_level", "bureau_code", "harvest_source_title"]
+
+# "U.S. Government > Department of Commerce > Census Bureau"
+publisher_separator = ">"
+
+derived_columns = list(extras_columns) + ["publisher_path"]
+
+# the value of one extras key, or null if the dataset doesn't have it
+def get_extra(key: str) -> pl.Expr:
+    return pl.col("extras") \
+        .list.eval(
+            pl.element().filter(pl.element().struct.field("key") == key).struct.field("value")
+        ) \
+        .list.first()
+
+# the hierarchy as a list of levels; datasets without one fall back to their publisher
+publisher_path = pl.coalesce("publisher_hierarchy", "publisher") \
+    .str.split(publisher_separator) \
+    .list.eval(pl.element().str.strip_chars()) \
+    .list.eval(pl.element().filter(pl.element() != "")) \
+    .alias("publisher_path")
+
+# add the derived columns to a catalog in the snapshot layout
+def pivot_extras(catalog: pl.LazyFrame) -> pl.LazyFrame:
+    return catalog \
+        .with_columns([get_extra(key).alias(column) for column, key in extras_columns.items()]) \
+        .with_columns(publisher_path)
+
+# dataset counts for every node of the publisher hierarchy: dataset_count includes the
+# publisher's descendants, direct_count only the datasets listing it as their last level
+def publisher_counts(catalog: pl.LazyFrame) -> list[dict]:
+    depth = pl.col("publisher_path").list.len()
+    counts = catalog \
+        .filter(depth > 0) \
+        .group_by("publisher_path") \
+        .agg(pl.len().alias("direct_count")) \
+        .with_columns(pl.int_ranges(1, depth + 1).alias("depth")) \
+        .explode("depth") \
+        .select(
+            pl.col("publisher_path").list.head(pl.col("depth")).list.join(f" {publisher_separator} ").alias("path"),
+            pl.col("publisher_path").list.get(pl.col("depth") - 1).alias("publisher"),
+            "depth",
+            "direct_count",
+            (pl.col("depth") == depth).alias("is_leaf")
+        ) \
+        .group_by("path") \
+        .agg(
+            pl.col("publisher").first(),
+            pl.col("depth").first(),
+            pl.col("direct_count").sum().alias("dataset_count"),
+            pl.col("direct_count").filter(pl.col("is_leaf")).sum().alias("direct_count")
+        ) \
+        .sort("path")
+    return collect(counts).to_dicts()
+
+# dataset counts by value for each counted extras column; the group-bys run over one scan
+def extras_counts(catalog: pl.LazyFrame) -> dict:
+    counts = collect_all([
+        catalog
+            .group_by(pl.col(column).alias("value"))
+            .agg(pl.len().alias("dataset_count"))
+            .sort(["dataset_count", "value"], descending=[True, False], nulls_last=True)
+        for column in counted_extras
+    ])
+    return {column: frame.to_dicts() for column, frame in zip(counted_extras, counts)}
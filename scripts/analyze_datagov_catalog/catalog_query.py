@@ -0,0 +1,490 @@
+# %%
+# cross-snapshot queries over the parquet snapshot store and the daily change files
+# questions like "which datasets from this organization were removed in the last 30 days" or
+# "when did this id first appear" are answered from files the daily analysis already writes:
+#   change_log/         one parquet file per day of dataset changes (from the statistics files
+#                       and their delta ndjson files) next to them; a new day only adds its own
+#                       file, date filters only open the files of the days in range, and each
+#                       file is sorted like the snapshot store by organization and id so
+#                       organization and id filters skip most row groups
+#   index.arrow         each snapshot's id-sorted index, memory mapped; an id is a binary search
+#   catalog.parquet     full records, read with the organization and id filters pushed down
+# query results are kept in an LRU cache that's dropped whenever a new statistics file or
+# snapshot index shows up. `serve` answers the same queries as a local JSON service.
+#
+#   python catalog_query.py changes --organization <name or id> --change removed --days 30
+#   python catalog_query.py history <dataset id>
+#   python catalog_query.py serve --port 8765
+
+import argparse
+from collections import OrderedDict
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlparse
+
+import polars as pl
+
+from analysis_engine import collect
+from snapshot_index import index_file_name, organizations_file_name
+from snapshot_store import snapshot_file_name, write_snapshot_frame
+from statistics_store import get_delta_organization, open_store, query_metric
+
+change_log_folder_name = "change_log"
+cache_size = 256        # query results kept in memory
+index_cache_size = 64   # snapshot indexes kept memory mapped
+refresh_seconds = 60    # how often the service looks for new statistics and snapshots
+
+change_log_schema = {
+    "snapshot": pl.String,
+    "change": pl.String,
+    "id": pl.String,
+    "organization_id": pl.String,
+    "changed_fields": pl.List(pl.String)
+}
+
+# %%
+# the change log
+
+def get_change_log_folder(statistics_folder: str) -> str:
+    return os.path.join(statistics_folder, change_log_folder_name)
+
+def get_change_log_part(statistics_folder: str, day: str) -> str:
+    return os.path.join(get_change_log_folder(statistics_folder), f"{day}.parquet")
+
+# a day's part is current if it's newer than the day's statistics file and its delta file
+def is_change_log_part_current(statistics_folder: str, day: str) -> bool:
+    path = get_change_log_part(statistics_folder, day)
+    if not os.path.exists(path):
+        return False
+    sources = [os.path.join(statistics_folder, f"{day}.json"), os.path.join(statistics_folder, "deltas", f"{day}.ndjson")]
+    return all(os.path.getmtime(f) <= os.path.getmtime(path) for f in sources if os.path.exists(f))
+
+# one statistics file's dataset changes in the change log layout; older files list them inline
+def scan_statistics_changes(file_path: str) -> pl.LazyFrame:
+    with open(file_path, "r") as file:
+        result = json.load(file)
+    delta_file = (result.get("delta_files") or {}).get("datasets")
+    schema = {c: t for c, t in change_log_schema.items() if c != "snapshot"}
+    if delta_file:
+        delta_path = os.path.join(os.path.dirname(file_path), delta_file)
+        # a day without changes leaves an empty file
+        changes = pl.scan_ndjson(delta_path, schema=schema) if os.path.getsize(delta_path) else pl.LazyFrame(schema=schema)
+    else:
+        rows = [
+            {
+                "change": change,
+                "id": record["id"],
+                "organization_id": get_delta_organization(record),
+                "changed_fields": record.get("changed_fields") if isinstance(record.get("changed_fields"), list) else None
+            }
+            for change, records in result["deltas"].items() if isinstance(records, list)
+            for record in records
+        ]
+        changes = pl.LazyFrame(rows, schema=schema)
+    return changes.select(pl.lit(result["date"]).alias("snapshot"), *schema)
+
+# write the parts of new or changed statistics files and drop the parts of removed ones;
+# returns the parts by day, oldest first
+def update_change_log(statistics_folder: str) -> dict[str, str]:
+    days = sorted(os.path.basename(f)[:-len(".json")] for f in glob.glob(os.path.join(statistics_folder, "*.json")))
+    parts = {}
+    for day in days:
+        path = get_change_log_part(statistics_folder, day)
+        if not is_change_log_part_current(statistics_folder, day):
+            file_path = os.path.join(statistics_folder, f"{day}.json")
+            try:
+                changes = scan_statistics_changes(file_path)
+            except (json.JSONDecodeError, KeyError, OSError) as e:
+                logging.warning(f"skipping {file_path}: {e!r}")
+                continue
+            logging.info(f"writing the changes of {file_path} to {path}...")
+            write_snapshot_frame(changes.sort(["organization_id", "id"]), path)
+        parts[day] = path
+    for path in glob.glob(os.path.join(get_change_log_folder(statistics_folder), "*.parquet")):
+        if path not in parts.values():
+            os.remove(path)
+    return parts
+
+# %%
+# query helpers
+
+# snapshots (by folder name) that have an index, oldest first
+def list_snapshots(parquet_root: str) -> list[str]:
+    if not os.path.isdir(parquet_root):
+        return []
+    return sorted(
+        f for f in os.listdir(parquet_root)
+        if not f.startswith(".") and os.path.exists(os.path.join(parquet_root, f, index_file_name))
+    )
+
+# date bounds as snapshot name prefixes; dates may be "2025-02-03", "20250203" or a full
+# timestamp, and days counts back from today
+def get_bounds(start: str = None, end: str = None, days: int = None) -> tuple[str, str]:
+    if days is not None:
+        start = (date.today() - timedelta(days=int(days))).isoformat()
+
+    def prefix(value: str) -> str:
+        if value is None:
+            return None
+        value = value.replace("-", "")
+        if not re.fullmatch(r"\d{8}(T\d{6})?", value):
+            raise ValueError(f"not a date or snapshot timestamp: {value}")
+        return value
+
+    return prefix(start), prefix(end)
+
+# a snapshot name within the bounds; the end bound includes every snapshot of that day
+def in_range(snapshot: str, start: str = None, end: str = None) -> bool:
+    return (start is None or snapshot >= start) and (end is None or snapshot[:len(end)] <= end)
+
+# the row of an id-sorted index for one dataset, or None
+def find_row(index: pl.DataFrame, dataset_id: str) -> dict:
+    ids = index.get_column("id")
+    position = ids.search_sorted(dataset_id)
+    if position < index.height and ids[position] == dataset_id:
+        return index.row(position, named=True)
+    return None
+
+
+# least-recently-used cache with hit and miss counts
+class QueryCache:
+    def __init__(self, max_size: int = cache_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            self._items[key] = value
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def summary(self) -> dict:
+        return {"size": len(self._items), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+# %%
+# queries
+
+class CatalogQuery:
+    # store_path is the statistics store (see statistics_store.py), only needed for metric()
+    def __init__(self, parquet_root: str, statistics_folder: str, store_path: str = None, cache_size: int = cache_size):
+        self.parquet_root = parquet_root
+        self.statistics_folder = statistics_folder
+        self.store_path = store_path
+        self.cache = QueryCache(cache_size)
+        self.indexes = QueryCache(index_cache_size)
+        self.snapshots = []
+        self.change_log = {}
+        self._state = None
+        self._checked = 0
+        self._lock = threading.Lock()
+        self.refresh(force=True)
+
+    # rebuild the change log when there are new statistics and pick up new snapshot indexes;
+    # cached results are dropped when either changed. checks at most every refresh_seconds
+    def refresh(self, force: bool = False) -> bool:
+        with self._lock:
+            if not force and time.time() - self._checked < refresh_seconds:
+                return False
+            self._checked = time.time()
+            change_log = update_change_log(self.statistics_folder)
+            snapshots = list_snapshots(self.parquet_root)
+            state = (
+                tuple((day, os.path.getmtime(path)) for day, path in change_log.items()),
+                tuple(os.path.getmtime(os.path.join(self.parquet_root, s, index_file_name)) for s in snapshots)
+            )
+            if state == self._state:
+                return False
+            self._state = state
+            self.snapshots = snapshots
+            self.change_log = change_log
+            self.cache.clear()
+            self.indexes.clear()
+            logging.debug(f"{len(snapshots)} indexed snapshots")
+            return True
+
+    def cached(self, name: str, compute, **params):
+        return self.cache.get((name, tuple(sorted(params.items()))), compute)
+
+    def load_index(self, snapshot: str) -> pl.DataFrame:
+        path = os.path.join(self.parquet_root, snapshot, index_file_name)
+        return self.indexes.get(snapshot, lambda: pl.read_ipc(path, memory_map=True).set_sorted("id"))
+
+    def latest_snapshot(self) -> str:
+        if not self.snapshots:
+            raise LookupError(f"no indexed snapshots in {self.parquet_root}")
+        return self.snapshots[-1]
+
+    # an organization id for an id or a name, from the latest snapshot; unknown values are kept
+    # as given so organizations that have since disappeared can still be queried by id
+    def resolve_organization(self, organization: str) -> str:
+        def compute():
+            path = os.path.join(self.parquet_root, self.latest_snapshot(), organizations_file_name)
+            matches = pl.read_ipc(path, memory_map=True) \
+                .filter((pl.col("id") == organization) | (pl.col("name") == organization)) \
+                .get_column("id")
+            return matches[0] if len(matches) else organization
+        return self.cached("organization", compute, organization=organization)
+
+    def snapshot_names(self, start: str = None, end: str = None, days: int = None) -> list[str]:
+        start, end = get_bounds(start, end, days)
+        return [s for s in self.snapshots if in_range(s, start, end)]
+
+    # dataset changes, newest first; only the days in range are scanned and every other filter
+    # is pushed down to their scan
+    def changes(self, organization: str = None, change: str = None, id: str = None, start: str = None,
+                end: str = None, days: int = None, limit: int = None) -> list[dict]:
+        start, end = get_bounds(start, end, days)
+
+        def compute():
+            filters = []
+            if organization:
+                filters.append(pl.col("organization_id") == self.resolve_organization(organization))
+            if change:
+                filters.append(pl.col("change") == change)
+            if id:
+                filters.append(pl.col("id") == id)
+            parts = [path for day, path in self.change_log.items() if in_range(day, start, end)]
+            if not parts:
+                return []
+            changes = pl.scan_parquet(parts)
+            if filters:
+                changes = changes.filter(pl.all_horizontal(filters))
+            changes = changes.sort(["snapshot", "id"], descending=[True, False])
+            if limit:
+                changes = changes.head(int(limit))
+            return collect(changes).to_dicts()
+
+        return self.cached("changes", compute, organization=organization, change=change, id=id,
+                           start=start, end=end, limit=limit)
+
+    # one dataset's versions across the indexed snapshots: the first snapshot of each record
+    # hash, with a null hash for the snapshots it went missing from
+    def history(self, dataset_id: str, start: str = None, end: str = None, days: int = None) -> dict:
+        start, end = get_bounds(start, end, days)
+
+        def compute():
+            versions = []
+            present = []
+            for snapshot in self.snapshots:
+                if not in_range(snapshot, start, end):
+                    continue
+                row = find_row(self.load_index(snapshot), dataset_id)
+                record_hash = row["record_hash"] if row else None
+                if row:
+                    present.append(snapshot)
+                if (versions and versions[-1]["record_hash"] == record_hash) or (not versions and row is None):
+                    continue
+                versions.append({
+                    "snapshot": snapshot,
+                    "record_hash": record_hash,
+                    "organization_id": row["organization_id"] if row else None
+                })
+            if not versions:
+                return None
+            return {
+                "id": dataset_id,
+                "first_seen": present[0],
+                "last_seen": present[-1],
+                "versions": versions
+            }
+
+        return self.cached("history", compute, dataset_id=dataset_id, start=start, end=end)
+
+    # a dataset's full record in a snapshot (default: the newest snapshot that has it); the
+    # index gives its organization, so the scan only reads that organization's row groups
+    def record(self, dataset_id: str, snapshot: str = None) -> dict:
+        def compute():
+            candidates = [snapshot] if snapshot else reversed(self.snapshots)
+            for candidate in candidates:
+                if candidate not in self.snapshots:
+                    raise LookupError(f"no indexed snapshot {candidate}")
+                row = find_row(self.load_index(candidate), dataset_id)
+                if row is None:
+                    continue
+                records = collect(
+                    pl.scan_parquet(os.path.join(self.parquet_root, candidate, snapshot_file_name))
+                        .filter(pl.col("organization_id").eq_missing(row["organization_id"]) & (pl.col("id") == dataset_id))
+                        .head(1)
+                ).to_dicts()
+                if records:
+                    return {"snapshot": candidate, **records[0]}
+            return None
+
+        return self.cached("record", compute, dataset_id=dataset_id, snapshot=snapshot)
+
+    # an organization's datasets in a snapshot (default: the newest), from its index
+    def datasets(self, organization: str, snapshot: str = None) -> list[dict]:
+        def compute():
+            candidate = snapshot or self.latest_snapshot()
+            if candidate not in self.snapshots:
+                raise LookupError(f"no indexed snapshot {candidate}")
+            organization_id = self.resolve_organization(organization)
+            return self.load_index(candidate) \
+                .filter(pl.col("organization_id") == organization_id) \
+                .drop("record_hash") \
+                .to_dicts()
+
+        return self.cached("datasets", compute, organization=organization, snapshot=snapshot)
+
+    # one metric's history from the statistics store
+    def metric(self, metric: str, organization: str = None, start: str = None, end: str = None,
+               period: str = "day") -> list[dict]:
+        if not self.store_path:
+            raise LookupError("no statistics store configured")
+
+        def compute():
+            connection = open_store(self.store_path)
+            try:
+                rows = query_metric(connection, metric, organization, start, end, period)
+            finally:
+                connection.close()
+            return [{"date": day, "value": value} for day, value in rows]
+
+        return self.cached("metric", compute, metric=metric, organization=organization, start=start, end=end, period=period)
+
+    def status(self) -> dict:
+        return {
+            "snapshots": len(self.snapshots),
+            "first_snapshot": self.snapshots[0] if self.snapshots else None,
+            "latest_snapshot": self.snapshots[-1] if self.snapshots else None,
+            "cache": self.cache.summary(),
+            "indexes": self.indexes.summary()
+        }
+
+
+# %%
+# the local JSON service; requests are answered one at a time from the caches and indexes
+
+# /snapshots, /changes, /datasets/<id>, /datasets/<id>/history, /organizations/<org>/datasets,
+# /metrics/<metric> and /status; query parameters are passed to the CatalogQuery method as is
+def route(query: CatalogQuery, parts: list[str], params: dict):
+    match parts:
+        case ["snapshots"]:
+            return query.snapshot_names(**params)
+        case ["changes"]:
+            return query.changes(**params)
+        case ["datasets", dataset_id]:
+            return query.record(dataset_id, **params)
+        case ["datasets", dataset_id, "history"]:
+            return query.history(dataset_id, **params)
+        case ["organizations", organization, "datasets"]:
+            return query.datasets(organization, **params)
+        case ["metrics", metric]:
+            return query.metric(metric, **params)
+        case ["status"]:
+            return query.status()
+    raise LookupError(f"no route /{'/'.join(parts)}")
+
+def make_handler(query: CatalogQuery):
+    class QueryHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [unquote(part) for part in url.path.split("/") if part]
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            started = time.time()
+            try:
+                query.refresh()
+                result = route(query, parts, params)
+                status = 200 if result is not None else 404
+                body = result if result is not None else {"error": "not found"}
+            except LookupError as e:
+                status, body = 404, {"error": str(e)}
+            except (TypeError, ValueError) as e:
+                status, body = 400, {"error": str(e)}
+            except Exception as e:
+                logging.exception(f"query {self.path} failed")
+                status, body = 500, {"error": repr(e)}
+
+            payload = json.dumps(body, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            logging.info(f"{status} {self.path} in {time.time() - started:.3f}s")
+
+        def log_message(self, format, *args):
+            pass
+
+    return QueryHandler
+
+def serve(query: CatalogQuery, host: str = "127.0.0.1", port: int = 8765):
+    server = HTTPServer((host, port), make_handler(query))
+    logging.info(f"serving {len(query.snapshots)} snapshots on http://{host}:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+# %%
+# query from the command line or start the service
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s.%(msecs)03d %(levelname)-8s| %(message)s",
+        datefmt="%H:%M:%S"
+    )
+    parser = argparse.ArgumentParser(description="Query the archived catalog across snapshots.")
+    parser.add_argument("--parquet-folder", default="../../data/data_gov_catalog_parquet", help="parquet snapshot store")
+    parser.add_argument("--statistics-folder", default="../../data/daily_statistics", help="folder of daily statistics files")
+    parser.add_argument("--store", default="../../data/statistics.sqlite", help="path of the statistics store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    changes = commands.add_parser("changes", help="list dataset changes")
+    changes.add_argument("--organization", help="organization id or name")
+    changes.add_argument("--change", choices=["added", "removed", "modified"])
+    changes.add_argument("--id", help="dataset id")
+    changes.add_argument("--start", help="first date, YYYY-MM-DD")
+    changes.add_argument("--end", help="last date, YYYY-MM-DD")
+    changes.add_argument("--days", type=int, help="only the last this many days")
+    changes.add_argument("--limit", type=int)
+    history = commands.add_parser("history", help="the versions of one dataset across snapshots")
+    history.add_argument("dataset_id")
+    record = commands.add_parser("record", help="a dataset's full record")
+    record.add_argument("dataset_id")
+    record.add_argument("--snapshot", help="snapshot timestamp (default: the newest that has the dataset)")
+    datasets = commands.add_parser("datasets", help="an organization's datasets in a snapshot")
+    datasets.add_argument("organization")
+    datasets.add_argument("--snapshot", help="snapshot timestamp (default: the newest)")
+    service = commands.add_parser("serve", help="answer queries as a local JSON service")
+    service.add_argument("--host", default="127.0.0.1")
+    service.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    query = CatalogQuery(args.parquet_folder, args.statistics_folder, store_path=args.store)
+    if args.command == "serve":
+        serve(query, args.host, args.port)
+    elif args.command == "changes":
+        for row in query.changes(args.organization, args.change, args.id, args.start, args.end, args.days, args.limit):
+            print(json.dumps(row))
+    elif args.command == "history":
+        print(json.dumps(query.history(args.dataset_id), indent=2))
+    elif args.command == "record":
+        print(json.dumps(query.record(args.dataset_id, args.snapshot), indent=2, default=str))
+    else:
+        for row in query.datasets(args.organization, args.snapshot):
+            print(json.dumps(row, default=str))
@@ -0,0 +1,349 @@
+# shared functions for the daily catalog statistics
+# used by daily_statistics_polars.py and the backfill so both produce identical output
+
+import glob
+import json
+import logging
+import os
+import polars as pl
+
+from analysis_engine import collect
+from catalog_diff import format_differences, get_changed_field_frame
+from catalog_extras import extras_counts, publisher_counts
+from organization_dimension import add_organizations, describe_organizations, get_excluded_ids, join_organization_key
+from snapshot_details import details_counts, get_details_summary, load_snapshot_details
+from snapshot_index import build_organizations, counts_from_index, index_changes, load_snapshot_index
+from snapshot_resources import diff_resources, get_resource_changes, load_snapshot_resources, resource_counts
+from snapshot_store import get_snapshot_folder, get_snapshot_path, scan_ndjson_snapshot, scan_snapshot, write_snapshot_frame
+from run_metrics import RunMetrics
+
+# bump when the statistics logic changes so the backfill regenerates older days
+statistics_version = 7
+
+# changes per day are written next to the statistics as ndjson files under this folder
+delta_folder_name = "deltas"
+change_types = ["added", "removed", "modified"]
+
+# prefix of the harvested ndjson snapshots in the archive
+archive_prefix = "Catalog/data_gov_catalog_ndjson"
+
+# the archive named by url or CATALOG_STORAGE (see catalog_storage.py); None when the
+# analysis should only read what's already in the local data folder
+def get_archive(url: str = None):
+    url = url or os.environ.get("CATALOG_STORAGE")
+    if not url:
+        return None
+    from catalog_storage import get_storage
+    return get_storage(url)
+
+# copy the most recent snapshot folders from the archive into the local data folder;
+# only files that are missing locally (or differ in size) are downloaded, many at a time.
+# days packed into the content-addressed record archive (see record_archive.py) are rebuilt
+# as a single records.ndjson file in their folder, unless the folder already has a copy.
+# before skips the days from that timestamp on, e.g. a run that's still being harvested
+def sync_catalog_folders(root_catalog_folder: str, archive, cycles: int = 1, before: str = None) -> list[str]:
+    from record_archive import RecordArchive
+    record_archive = RecordArchive(archive, cache_dir=os.path.join(root_catalog_folder, ".record_chunks"))
+
+    folders = {os.path.basename(f): f for f in archive.list_folders(archive_prefix)}
+    packed_days = set(record_archive.list_days())
+    days = sorted(set(folders) | packed_days, reverse=True)
+    if before:
+        days = [day for day in days if day < before]
+    downloaded = []
+    synced = []
+    for day in days:
+        # an incremental run is applied to the snapshot before it, so keep going back until
+        # the oldest synced day is a full snapshot
+        if cycles is not None and len(synced) > cycles and not is_delta_folder(synced[-1]):
+            break
+        local_folder = os.path.join(root_catalog_folder, day)
+        if day not in packed_days:
+            downloaded += archive.mirror(folders[day], local_folder)
+        else:
+            if not get_json_file_list(local_folder):
+                path = os.path.join(local_folder, "records.ndjson")
+                record_archive.write_ndjson(day, path)
+                downloaded.append(path)
+            # package_show details are kept next to the snapshot either way
+            if day in folders:
+                downloaded += archive.mirror(f"{folders[day]}/details", os.path.join(local_folder, "details"))
+        synced.append(local_folder)
+        logging.debug(f"synced {day}")
+    logging.info(f"downloaded {len(downloaded)} files from {len(synced)} archived snapshots")
+    return downloaded
+
+# get the most recent catalog folders going back the specified number of cycles
+# cycles usually means days but that's not a strict rule; cycles=None returns every snapshot
+# incremental harvests are listed too; see get_recent_snapshots for folders ready to compare
+def get_recent_catalog_folders(root_catalog_folder: str = None, cycles: int = 1) -> str:
+    if root_catalog_folder:
+        folders = [
+            os.path.join(root_catalog_folder, f) for f in os.listdir(root_catalog_folder)
+            if os.path.isdir(os.path.join(root_catalog_folder, f)) and not f.startswith(".")
+        ]
+        folders.sort(key=lambda x: os.path.basename(x), reverse=True)
+        if folders:
+            return folders if cycles is None else folders[:cycles+1]
+    return None
+
+# an incremental harvest writes its records under delta/ instead of the folder root
+def is_delta_folder(path: str = None) -> bool:
+    return os.path.isdir(os.path.join(path, "delta")) and not get_json_file_list(path)
+
+# get the list of delta ndjson files and the id listing files of an incremental harvest
+def get_delta_file_list(path: str = None) -> list:
+    if path:
+        return sorted(glob.glob(f"{path}/delta/*.ndjson"))
+    return []
+
+def get_id_listing_file_list(path: str = None) -> list:
+    if path:
+        return glob.glob(f"{path}/ids/*.txt")
+    return []
+
+def get_date_from_folder_name(folder_name: str = None) -> str:
+    if folder_name:
+        return os.path.basename(folder_name)
+
+# get the list of json files in the folder
+def get_json_file_list(path: str = None) -> list:
+    if path:
+        return sorted(glob.glob(f"{path}/*.ndjson"))
+    return []
+
+# filter the catalog to remove excluded organizations; snapshots from the parquet
+# store are already de-duplicated by id and carry a flat organization_id column, so this is
+# a predicate on that one column that the parquet scan can push down to its row groups
+def filter_catalog(catalog: pl.LazyFrame, excluded_organizations: list[str] = []) -> pl.LazyFrame:
+    if not excluded_organizations:
+        return catalog
+    return catalog \
+        .filter(
+            ~pl.col("organization_id").is_in(excluded_organizations)
+        )
+
+# collect statistics on the catalog; assumes any filtering has already been done
+# the group-by only sees the integer organization key; the organization metadata comes from
+# the dimension (see load_organization_dimension), plus the catalog's own records for any
+# organization it doesn't list
+def collect_catalog_info(catalog: pl.LazyFrame, dimension: pl.DataFrame = None) -> dict:
+    dimension = add_organizations(dimension, collect(build_organizations(catalog)))
+
+    catalog_counts_by_organization = collect(
+        catalog
+            .select("organization_id", pl.col("resources").list.len().alias("resource_count"))
+            .pipe(join_organization_key, dimension)
+            .group_by("organization_key")
+            .agg([
+                pl.len().alias("catalog_count"),
+                pl.col("resource_count").sum()
+            ])
+    )
+
+    return {
+        "total_records": catalog_counts_by_organization.get_column("catalog_count").sum(),
+        "total_resources": catalog_counts_by_organization.get_column("resource_count").sum(),
+        "organizations": describe_organizations(catalog_counts_by_organization, dimension).to_dicts(),
+        "publishers": publisher_counts(catalog),
+        "extras": extras_counts(catalog)
+    }
+
+# scan the id listing files of an incremental harvest as a single id column; a key range
+# without datasets leaves an empty file
+def scan_id_listing(id_listing_files: list[str]) -> pl.LazyFrame:
+    id_listing_files = [f for f in id_listing_files if os.path.getsize(f)]
+    if not id_listing_files:
+        return pl.LazyFrame(schema={"id": pl.String})
+    return pl.scan_csv(id_listing_files, has_header=False, new_columns=["id"], schema_overrides={"id": pl.String})
+
+# %%
+# incremental harvests
+
+# the parquet snapshot of an incremental harvest: the snapshot before it with the delta's
+# records added or replaced and, when the run listed every id, the removed datasets dropped.
+# without an id listing removals can't be seen, so the earlier records are carried over
+def write_delta_snapshot(folder: str, older_folder: str, parquet_folder: str) -> str:
+    catalog = scan_snapshot(older_folder, parquet_folder)
+    delta_files = get_delta_file_list(folder)
+    if delta_files:
+        delta = scan_ndjson_snapshot(delta_files)
+        catalog = pl.concat([
+            delta,
+            catalog.join(delta.select("id"), on="id", how="anti").select(delta.collect_schema().names())
+        ])
+    id_files = get_id_listing_file_list(folder)
+    if id_files:
+        catalog = catalog.join(scan_id_listing(id_files), on="id", how="semi")
+    else:
+        logging.warning(f"{folder} has no id listing; datasets removed since {older_folder} are carried over")
+
+    path = get_snapshot_path(folder, parquet_folder)
+    logging.debug(f"applying {len(delta_files)} delta files to {older_folder} in {path}...")
+    return write_snapshot_frame(catalog.sort(["organization_id", "id"]), path)
+
+# current if it's newer than the delta, the id listing and the snapshot it was applied to
+def is_delta_snapshot_current(folder: str, older_folder: str, parquet_folder: str) -> bool:
+    path = get_snapshot_path(folder, parquet_folder)
+    older_path = get_snapshot_path(older_folder, parquet_folder)
+    if not (os.path.exists(path) and os.path.exists(older_path)):
+        return False
+    sources = get_delta_file_list(folder) + get_id_listing_file_list(folder) + [older_path]
+    return all(os.path.getmtime(f) <= os.path.getmtime(path) for f in sources)
+
+# apply every incremental harvest in a list of folders (newest first) to the snapshot before
+# it; oldest first, so a run of deltas builds on itself. deltas with no earlier snapshot
+# are left out of the returned list
+def prepare_delta_snapshots(folders: list[str], parquet_folder: str) -> list[str]:
+    prepared = []
+    for folder in reversed(folders):
+        if is_delta_folder(folder):
+            if not prepared:
+                logging.warning(f"no earlier snapshot to apply {folder} to; skipping it")
+                continue
+            if not is_delta_snapshot_current(folder, prepared[-1], parquet_folder):
+                write_delta_snapshot(folder, prepared[-1], parquet_folder)
+        prepared.append(folder)
+    return prepared[::-1]
+
+# the most recent snapshots ready to be compared, incremental harvests included; only the
+# requested cycles are prepared, plus the folders back to the full snapshot the oldest of
+# them builds on
+def get_recent_snapshots(root_catalog_folder: str, parquet_folder: str, cycles: int = 1) -> list[str]:
+    folders = get_recent_catalog_folders(root_catalog_folder, cycles=None) or []
+    if cycles is not None:
+        window = cycles + 1
+        while window < len(folders) and is_delta_folder(folders[window - 1]):
+            window += 1
+        folders = folders[:window]
+    folders = prepare_delta_snapshots(folders, parquet_folder)
+    return folders if cycles is None else folders[:cycles+1]
+
+# stream a frame into an ndjson file, replacing any earlier copy atomically
+def write_ndjson_frame(frame: pl.LazyFrame, path: str) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    frame.sink_ndjson(temp_path)
+    os.replace(temp_path, path)
+    return path
+
+# write a day's dataset and resource changes under <statistics_folder>/deltas/; returns the
+# paths relative to the statistics folder as they're recorded in the summary
+def write_delta_files(changes: pl.DataFrame, resource_changes: pl.LazyFrame, statistics_folder: str, date: str) -> dict:
+    files = {
+        "datasets": f"{delta_folder_name}/{date}.ndjson",
+        "resources": f"{delta_folder_name}/{date}.resources.ndjson"
+    }
+    write_ndjson_frame(changes.lazy().select("change", "id", "organization_id", "changed_fields"),
+                       os.path.join(statistics_folder, files["datasets"]))
+    write_ndjson_frame(resource_changes.select("change", "resource_id", "dataset_id", "format"),
+                       os.path.join(statistics_folder, files["resources"]))
+    return files
+
+# {change: count} for a written changes file; a day without changes leaves an empty file
+def count_changes(path: str) -> dict:
+    if not os.path.getsize(path):
+        return {change: 0 for change in change_types}
+    counts = dict(collect(pl.scan_ndjson(path).group_by("change").len()).iter_rows())
+    return {change: counts.get(change, 0) for change in change_types}
+
+# generate the statistics for one snapshot compared against the prior cycle; the organization
+# dimension (see load_organization_dimension) describes the organizations and flags the
+# excluded ones. load_index can be swapped for a cached loader when many days are processed and
+# metrics collects the scan, aggregate and diff timings. with a statistics_folder the
+# changes are streamed to ndjson files there (see write_delta_files) and the summary only
+# holds their counts; otherwise they're listed inline
+def build_daily_statistics(folder: str, older_folder: str, parquet_folder: str,
+                           dimension: pl.DataFrame = None, load_index=load_snapshot_index,
+                           metrics: RunMetrics = None, statistics_folder: str = None) -> dict:
+    metrics = metrics or RunMetrics()
+
+    # load the sidecar indexes for the current data and prior cycle; each snapshot is only
+    # parsed from ndjson and indexed the first time it's seen
+    with metrics.timer("scan", snapshot="current"):
+        index, organizations = load_index(folder, parquet_folder)
+    with metrics.timer("scan", snapshot="comparison"):
+        index_older, _ = load_index(older_folder, parquet_folder)
+    excluded_organizations = get_excluded_ids(dimension) if dimension is not None else []
+    with metrics.timer("filter"):
+        index = collect(filter_catalog(index.lazy(), excluded_organizations=excluded_organizations))
+        index_older = collect(filter_catalog(index_older.lazy(), excluded_organizations=excluded_organizations))
+    metrics.set_gauge("records", index.height, snapshot="current")
+    metrics.set_gauge("records", index_older.height, snapshot="comparison")
+
+    # counts and id-level changes come from the indexes; only the modified records are
+    # read back from the snapshots to find which fields changed
+    with metrics.timer("diff", step="index"):
+        changes = index_changes(older=index_older, newer=index)
+    with metrics.timer("diff", step="fields"):
+        changed_fields = get_changed_field_frame(
+            older=scan_snapshot(older_folder, parquet_folder),
+            newer=scan_snapshot(folder, parquet_folder),
+            ids=changes.filter(pl.col("change") == "modified").get_column("id")
+        )
+        changes = changes.join(changed_fields.select("id", "changed_fields"), on="id", how="left").sort("id")
+    change_counts = {change: changes.filter(pl.col("change") == change).height for change in change_types}
+    for change, count in change_counts.items():
+        metrics.set_gauge("changes", count, change=change)
+
+    with metrics.timer("aggregate"):
+        counts = counts_from_index(index, organizations, dimension)
+
+    # resource-level counts and changes come from each snapshot's exploded resources table
+    with metrics.timer("scan", snapshot="resources"):
+        resources = filter_catalog(load_snapshot_resources(folder, parquet_folder), excluded_organizations)
+        resources_older = filter_catalog(load_snapshot_resources(older_folder, parquet_folder), excluded_organizations)
+    with metrics.timer("aggregate", step="resources"):
+        resource_statistics = resource_counts(resources)
+    date = get_date_from_folder_name(folder)
+    result = {
+        "date": date,
+        "version": statistics_version,
+        "current_fileset": folder,
+        "comparison_fileset": older_folder,
+        "counts": counts
+    }
+    if is_delta_folder(folder):
+        # removals are only found when the incremental run also listed every id
+        result["incremental"] = {"id_listing": bool(get_id_listing_file_list(folder))}
+    if statistics_folder:
+        with metrics.timer("write", step="deltas"):
+            delta_files = write_delta_files(changes, get_resource_changes(older=resources_older, newer=resources),
+                                            statistics_folder, date)
+            resource_deltas = count_changes(os.path.join(statistics_folder, delta_files["resources"]))
+        result["deltas"] = change_counts
+        result["delta_files"] = delta_files
+    else:
+        with metrics.timer("diff", step="resources"):
+            resource_deltas = diff_resources(older=resources_older, newer=resources)
+        result["deltas"] = format_differences(changes)
+    result["resources"] = {
+        "counts": resource_statistics,
+        "deltas": resource_deltas
+    }
+
+    # package_show details are fetched after a day's statistics are written, so each day
+    # reports the details fetched for the comparison fileset's changes
+    with metrics.timer("scan", snapshot="details"):
+        details = load_snapshot_details(older_folder, parquet_folder)
+        if details is not None:
+            result["details"] = {
+                "fileset": older_folder,
+                **details_counts(filter_catalog(details, excluded_organizations), get_details_summary(older_folder))
+            }
+    return result
+
+# the analysis metrics for a day sit next to its parquet snapshot
+def write_run_metrics(metrics: RunMetrics, folder: str, parquet_folder: str, prometheus: bool = False) -> str:
+    return metrics.write(get_snapshot_folder(folder, parquet_folder), prometheus=prometheus)
+
+def get_statistics_file_name(statistics_folder: str, folder: str) -> str:
+    return os.path.join(statistics_folder, f"{get_date_from_folder_name(folder)}.json")
+
+# output the result
+def write_daily_statistics(result: dict, statistics_folder: str) -> str:
+    filename = get_statistics_file_name(statistics_folder, result["current_fileset"])
+    with open(filename, mode="w") as file:
+        json.dump(result, file)
+        logging.debug(f"saved statistics to {file.name}...")
+    return filename
@@ -1,9 +1,11 @@
 # %%
 # imports and initialization
+# streams the legacy json catalog folder one page file at a time and updates every
+# counter in a single pass, so memory is bounded by the largest page and the counters
+from collections import Counter
 import glob
 import json
 import logging
-import pydash as py_
 import os
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)-8s %(name)s: %(message)s")
@@ -29,10 +31,11 @@ def get_most_recent_catalog_folder(root_catalog_folder: str = None) -> str:
             return folders[0]
     return None
 
-# get the list of json files in the folder
+# get the list of json files in the folder, in name order so a duplicated record always
+# resolves to the same page
 def get_json_file_list(path: str = None) -> list:
     if path:
-        return glob.glob(f"{path}/*.json")
+        return sorted(glob.glob(f"{path}/*.json"))
     return []
 
 # get the list of error files in the folder
@@ -48,79 +51,120 @@ def get_json(file_path: str = None) -> list | dict:
             return json.load(file)
     return {}
 
-# %%
-# load the data to a local object
-json_data_folder = get_most_recent_catalog_folder(local_config["input"]["data_folder"])
-json_data_files = get_json_file_list(json_data_folder)
-json_data = []
+# yield every record in the files, one page file in memory at a time
+def iter_records(file_paths: list[str]):
+    for file_path in file_paths:
+        file_data = get_json(file_path)
+        if type(file_data) == list:
+            yield from file_data
+
+# find an entry in the "extras" key/value list (the first one with the key), or None
+def find_extra(entry: dict, key: str) -> dict:
+    for extra in entry.get("extras") or []:
+        if extra.get("key") == key:
+            return extra
+    return None
 
-for file in json_data_files:
-    file_data = get_json(file)
-    if type(file_data) == list:
-        json_data.extend(file_data)
+# running counters for the catalog statistics
+class CatalogStatistics:
+    def __init__(self):
+        self.seen_ids = set()
+        self.duplicate_count = 0
+        self.organization_dataset_count = Counter()
+        self.publisher_dataset_count = Counter()
+        self.group_ids = set()
+        self.group_dataset_count = Counter()
+        self.tag_ids = set()
+
+    def add(self, entry: dict):
+        # de-dupe any records (can happen if the catalog updates during the extraction process)
+        if entry["id"] in self.seen_ids:
+            self.duplicate_count += 1
+            return
+        self.seen_ids.add(entry["id"])
+
+        if entry.get("organization"):
+            self.organization_dataset_count[entry["organization"]["id"]] += 1
+
+        # "publisher_hierarchy" lives in "extras"; a record that has the key counts toward its
+        # value even when the value is empty
+        publisher_hierarchy = find_extra(entry, "publisher_hierarchy")
+        if publisher_hierarchy is not None:
+            self.publisher_dataset_count[publisher_hierarchy.get("value")] += 1
+
+        groups = entry.get("groups") or []
+        self.group_ids.update(group["id"] for group in groups)
+        if groups:
+            self.group_dataset_count[groups[0]["id"]] += 1
+
+        self.tag_ids.update(tag["id"] for tag in entry.get("tags") or [])
+
+    @property
+    def record_count(self) -> int:
+        return len(self.seen_ids)
+
+    @property
+    def organization_count(self) -> int:
+        return len(self.organization_dataset_count)
+
+    @property
+    def publisher_count(self) -> int:
+        return len(self.publisher_dataset_count)
+
+    @property
+    def group_count(self) -> int:
+        return len(self.group_ids)
+
+    @property
+    def tag_count(self) -> int:
+        return len(self.tag_ids)
 
 # %%
-# handle quality issues
+# stream the data through the counters
+json_data_folder = get_most_recent_catalog_folder(local_config["input"]["data_folder"])
+json_data_files = get_json_file_list(json_data_folder)
 
-# convert to a dict and de-dupe any records (can happen if the catalog updates during the extraction process)
-json_data_dict = py_.key_by(json_data, "id")
-if len(json_data_dict) != len(json_data):
-    logging.warning(f"de-duped {len(json_data) - len(json_data_dict)} records")
-json_data = py_.uniq_by(json_data, "id")
+statistics = CatalogStatistics()
+for entry in iter_records(json_data_files):
+    statistics.add(entry)
 
 # # filter out records with the specific group id
 # group_id_to_remove = "7d625e66-9e91-4b47-badd-44ec6f16b62b"
-# json_data = [record for record in json_data if not any(group["id"] == group_id_to_remove for group in record.get("groups", []))]
-
-
-# %%
-# structural changes
-# extract "Org Hierarchy" from "extras" and add it to the parent dict
-for entry in json_data:
-
-    # Extract the "publisher_hierarchy" value
-    publisher_hierarchy = py_.find(entry["extras"], lambda x: x["key"] == "publisher_hierarchy")
+# (skip them in CatalogStatistics.add if this is needed again)
 
-    # Assign to main dictionary if found
-    if publisher_hierarchy:
-        entry["publisher_hierarchy"] = publisher_hierarchy["value"]
+if statistics.duplicate_count:
+    logging.warning(f"de-duped {statistics.duplicate_count} records")
 
 # %%
 # calculate summary statistics
 
 # count the number of records
-record_count = len(json_data_dict)
+record_count = statistics.record_count
 logging.info(f"record count: {record_count}")
 
 # count the number of unique organizations
-organizations_dict = py_.key_by([d["organization"] for d in json_data if "organization" in d], "id")
-organization_count = len(organizations_dict)
+organization_count = statistics.organization_count
 logging.info(f"organization count: {organization_count}")
 
 # count the number of datasets per organization
-organization_dataset_count = py_.count_by([d["organization"]["id"] for d in json_data if "organization" in d])
+organization_dataset_count = dict(statistics.organization_dataset_count)
 
 # count the number of unique publishers
-publishers_dict = py_.key_by([d for d in json_data if "publisher_hierarchy" in d], "publisher_hierarchy")
-publisher_count = len(publishers_dict)
+publisher_count = statistics.publisher_count
 logging.info(f"publisher count: {publisher_count}")
 
 # count the number of datasets per publisher
-publisher_dataset_count = py_.count_by([d["publisher_hierarchy"] for d in json_data if "publisher_hierarchy" in d])
+publisher_dataset_count = dict(statistics.publisher_dataset_count)
 
 # count the number of unique groups
-groups_list = py_.flatten([d["groups"] for d in json_data if "groups" in d])
-groups_dict = py_.key_by(groups_list, "id")
-group_count = len(groups_dict)
+group_count = statistics.group_count
 logging.info(f"group count: {group_count}")
 
 # count the number of datasets per group
-group_dataset_count = py_.count_by([d["groups"][0]["id"] for d in json_data if "groups" in d and len(d["groups"]) > 0])
+group_dataset_count = dict(statistics.group_dataset_count)
 
 # count the number of unique tags
-tags_list = py_.flatten([d["tags"] for d in json_data if "tags" in d])
-tags_dict = py_.key_by(tags_list, "id")
-tag_count = len(tags_dict)
+tag_count = statistics.tag_count
 logging.info(f"tag count: {tag_count}")
 
 
@@ -1,13 +1,27 @@
 
 # %%
 # imports and initialization
-import glob
-import json
 import logging
-import polars as pl
 import os
+import sys
 import time
 
+# every script folder on the import path (see script_paths.py one folder up)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import script_paths  # noqa: F401
+
+from catalog_statistics import (
+    build_daily_statistics,
+    get_archive,
+    get_recent_snapshots,
+    sync_catalog_folders,
+    write_daily_statistics,
+    write_run_metrics
+)
+from organization_dimension import get_excluded_ids, load_organization_dimension
+from run_metrics import RunMetrics
+from statistics_store import ingest_statistics, open_store
+
 logging.basicConfig(
     level=logging.DEBUG,
     format="%(asctime)s.%(msecs)03d %(levelname)-8s| %(message)s",
@@ -22,133 +36,52 @@ logging.debug("startng up...")
 
 local_config = {
     "input": {
-        "data_folder": "../../data/data_gov_catalog_ndjson"
+        "data_folder": "../../data/data_gov_catalog_ndjson",
+        "parquet_folder": "../../data/data_gov_catalog_parquet"
     },
     "output": {
-        "statistics_folder": "../../data/daily_statistics"
+        "statistics_folder": "../../data/daily_statistics",
+        "statistics_store": "../../data/statistics.sqlite",
+        "prometheus": False  # also write run_metrics.prom next to run_metrics.json
     }
 }
 
-# load the list of excluded organizations
-with open("excluded_organizations.csv", "r", encoding="utf-8") as f:
-    excluded_organizations = f.read().splitlines()
+# load the organization dimension (organizations.csv, flagged from excluded_organizations.csv)
+dimension = load_organization_dimension()
 
-logging.debug(f"excluded organizations: {len(excluded_organizations)}")
-
-# %%
-# functions
-
-# get the most recent catalog folders going back the specified number of cycles
-# cycles usually means days but that's not a strict rule;
-def get_recent_catalog_folders(root_catalog_folder: str = None, cycles: int = 1) -> str:
-    if root_catalog_folder:
-        folders = [os.path.join(root_catalog_folder, f) for f in os.listdir(root_catalog_folder) if os.path.isdir(os.path.join(root_catalog_folder, f))]
-        folders.sort(key=lambda x: os.path.basename(x), reverse=True)
-        if folders:
-            return folders[:cycles+1]
-    return None
-
-def get_date_from_folder_name(folder_name: str = None) -> str:
-    if folder_name:
-        return os.path.basename(folder_name)
-
-# get the list of json files in the folder
-def get_json_file_list(path: str = None) -> list:
-    if path:
-        return glob.glob(f"{path}/*.ndjson")
-    return []
-
-# get the list of error files in the folder
-def get_error_file_list(path: str = None) -> list:
-    if path:
-        return glob.glob(f"{path}/errors/*.json")
-    return []
-
-# retrieve a json file and parse
-def get_json(file_path: str = None) -> list | dict:
-    if file_path:
-        with open(file_path, "r") as file:
-            return json.load(file)
-    return {}
-
-# filter the catalog to remove duplicates and excluded organizations
-def filter_catalog(catalog: pl.LazyFrame, excluded_organizations: list[str] = []) -> pl.LazyFrame:
-    return catalog \
-        .unique(subset=["id"]) \
-        .filter(
-            ~pl.col("organization").struct.field("id").is_in(excluded_organizations)
-        )
-
-# collect statistics on the catalog; assumes any filtering has already been done
-def collect_catalog_info(catalog: pl.LazyFrame) -> dict:
-    catalog_info = {}
-
-    catalog_counts_by_organization = catalog \
-        .group_by("organization") \
-        .agg([
-            pl.len().alias("catalog_count"),
-            pl.col("resources").list.len().sum().alias("resource_count")
-        ]) \
-        .collect()
-    
-    catalog_info["total_records"] = catalog_counts_by_organization.select("catalog_count").sum().item()
-    catalog_info["total_resources"] = catalog_counts_by_organization.select("resource_count").sum().item()
-    catalog_info["organizations"] = catalog_counts_by_organization.unnest("organization").to_dicts()
-
-    return catalog_info
-
-def get_catalog_differences(older: pl.LazyFrame, newer: pl.LazyFrame) -> dict:
-
-    # there is an alternate approach: full outer join + filtering, which only
-    # requires one pass through the data, but it may require more memory and time
-    added = newer \
-        .join(older, on="id", how="anti") \
-        .collect()
-    removed = older \
-        .join(newer, on="id", how="anti") \
-        .collect()
-
-    return {
-        "added": added.to_dicts(),
-        "removed": removed.to_dicts()
-    }
-
-logging.debug("functions loaded")
+logging.debug(f"organizations: {dimension.height}, excluded: {len(get_excluded_ids(dimension))}")
 
 # %%
 # get with the work and output the results
 
-# this function call supports a cycles parameter to go back further than the default 1
-folders = get_recent_catalog_folders(local_config["input"]["data_folder"])
+# with CATALOG_STORAGE set (e.g. s3://govex-us-data-archive) the snapshots are pulled from
+# the archive first; otherwise only the local data folder is used
+archive = get_archive()
+if archive:
+    sync_catalog_folders(local_config["input"]["data_folder"], archive)
+
+# this function call supports a cycles parameter to go back further than the default 1;
+# incremental harvests are applied to the snapshot before them on the way
+parquet_folder = local_config["input"]["parquet_folder"]
+folders = get_recent_snapshots(local_config["input"]["data_folder"], parquet_folder)
 
 os.makedirs(local_config["output"]["statistics_folder"], exist_ok=True)
+statistics_store = open_store(local_config["output"]["statistics_store"])
 
 for i in range(len(folders) - 1):
     logging.debug(f"processing {folders[i]}...")
-    ndjson_files = get_json_file_list(folders[i])
-    ndjson_older_files = get_json_file_list(folders[i + 1])
-
-    # initialize the lazyframes for the current data and prior cycle
-    catalog = filter_catalog(pl.scan_ndjson(ndjson_files, ignore_errors=True), excluded_organizations=excluded_organizations)
-    catalog_older = filter_catalog(pl.scan_ndjson(ndjson_older_files, ignore_errors=True), excluded_organizations=excluded_organizations)
-
-    datetimestring = get_date_from_folder_name(folders[i])
-
-    # generate the result object (this can take some time for each pass)
-    result = {
-        "date": datetimestring,
-        "current_fileset": folders[i],
-        "comparison_fileset": folders[i + 1],
-        "counts": collect_catalog_info(catalog),
-        "deltas": get_catalog_differences(older=catalog_older, newer=catalog)
-    }
-
-    # output the result
-    filename = os.path.join(local_config["output"]["statistics_folder"], f"{datetimestring}.json")
-    with open(filename, mode="w") as file:
-        json.dump(result, file)
-        logging.debug(f"saved statistics to {file.name}...")
 
+    # generate the result object and output it, with the stage timings next to the snapshot
+    metrics = RunMetrics(job="analysis", run=os.path.basename(folders[i]))
+    result = build_daily_statistics(folders[i], folders[i + 1], parquet_folder,
+                                    dimension=dimension, metrics=metrics,
+                                    statistics_folder=local_config["output"]["statistics_folder"])
+    with metrics.timer("write"):
+        filename = write_daily_statistics(result, local_config["output"]["statistics_folder"])
+        ingest_statistics(statistics_store, result, source=filename, modified=os.path.getmtime(filename))
+    write_run_metrics(metrics, folders[i], parquet_folder, prometheus=local_config["output"]["prometheus"])
+
+statistics_store.close()
 
 # %%
 # wrap up
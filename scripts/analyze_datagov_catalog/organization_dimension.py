@@ -0,0 +1,82 @@
+# organization dimension table
+# organizations.csv (plus any organization only seen in a snapshot) loaded once into a frame
+# keyed by organization id, with a dense UInt32 organization_key and an excluded flag from
+# excluded_organizations.csv. The dimension is loaded once per run; scans join it on
+# organization_id and group by the key, so the group-by hashes integers instead of uuids or the
+# wide organization struct, and the metadata is joined back onto the few aggregated rows.
+
+import os
+import polars as pl
+
+dimension_folder = os.path.dirname(os.path.abspath(__file__))
+organizations_file = os.path.join(dimension_folder, "organizations.csv")
+excluded_organizations_file = os.path.join(dimension_folder, "excluded_organizations.csv")
+
+organization_columns = [
+    "id", "name", "title", "type", "description", "image_url", "created",
+    "is_organization", "approval_status", "state"
+]
+
+# read the list of excluded organization ids, ignoring blank lines and duplicates
+def load_excluded_organizations(file_path: str = excluded_organizations_file) -> list[str]:
+    with open(file_path, "r", encoding="utf-8") as f:
+        return sorted({line.strip() for line in f if line.strip()})
+
+organization_schema = {c: pl.String for c in organization_columns} | {"is_organization": pl.Boolean}
+
+# organization records from older snapshots can be missing fields; those become null
+def select_organization_columns(organizations: pl.DataFrame) -> pl.DataFrame:
+    return organizations.select([
+        pl.col(c).cast(t) if c in organizations.columns else pl.lit(None, dtype=t).alias(c)
+        for c, t in organization_schema.items()
+    ])
+
+# build a dimension from organization frames; the first frame to list an id provides its metadata
+def get_organization_dimension(organizations: list[pl.DataFrame], excluded: list[str] = []) -> pl.DataFrame:
+    frames = [select_organization_columns(o) for o in organizations]
+    return pl.concat(frames) \
+        .filter(pl.col("id").is_not_null()) \
+        .unique(subset=["id"], keep="first", maintain_order=True) \
+        .sort("id") \
+        .with_row_index("organization_key") \
+        .with_columns(pl.col("id").is_in(excluded).alias("excluded"))
+
+# the dimension for organizations.csv; excluded ids missing from it get a row of their own so
+# they're still excluded when a snapshot lists them
+def load_organization_dimension(organizations_file: str = organizations_file,
+                                excluded_file: str = excluded_organizations_file) -> pl.DataFrame:
+    known = pl.read_csv(organizations_file, schema_overrides=organization_schema)
+    excluded = load_excluded_organizations(excluded_file) if excluded_file else []
+    return get_organization_dimension([known, pl.DataFrame({"id": excluded}, schema={"id": pl.String})], excluded)
+
+# add the organizations a snapshot lists but the dimension doesn't, with keys after the existing
+# ones; without a dimension, one is built from the snapshot's organizations alone
+def add_organizations(dimension: pl.DataFrame, organizations: pl.DataFrame) -> pl.DataFrame:
+    if dimension is None:
+        return get_organization_dimension([organizations])
+    added = select_organization_columns(organizations) \
+        .filter(pl.col("id").is_not_null() & ~pl.col("id").is_in(dimension.get_column("id"))) \
+        .unique(subset=["id"], keep="first") \
+        .sort("id")
+    if added.is_empty():
+        return dimension
+    added = added \
+        .with_row_index("organization_key", offset=dimension.height) \
+        .with_columns(pl.lit(False).alias("excluded"))
+    return pl.concat([dimension, added])
+
+def get_excluded_ids(dimension: pl.DataFrame) -> list[str]:
+    return dimension.filter(pl.col("excluded")).get_column("id").to_list()
+
+# add the organization_key of each row's organization_id; ids missing from the dimension get null
+def join_organization_key(frame: pl.LazyFrame | pl.DataFrame, dimension: pl.DataFrame) -> pl.LazyFrame | pl.DataFrame:
+    keys = dimension.select(pl.col("id").alias("organization_id"), "organization_key")
+    return frame.join(keys.lazy() if isinstance(frame, pl.LazyFrame) else keys, on="organization_id", how="left")
+
+# attach the organization metadata to rows aggregated by organization_key
+def describe_organizations(counts: pl.DataFrame, dimension: pl.DataFrame) -> pl.DataFrame:
+    return dimension \
+        .select("organization_key", *organization_columns) \
+        .join(counts, on="organization_key", how="inner") \
+        .drop("organization_key") \
+        .sort("id")
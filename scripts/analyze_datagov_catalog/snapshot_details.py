@@ -0,0 +1,71 @@
+# package_show records for a snapshot's changed datasets
+# get_datagov_catalog/get_package_details.py writes the full records of the datasets a daily diff
+# found added or modified under <snapshot>/details/. details.parquet holds them in the snapshot
+# layout (so the same scans, filters and counts work on them) plus record_json, the complete
+# record as fetched, for the fields the snapshot schema doesn't keep.
+
+import glob
+import json
+import logging
+import os
+import polars as pl
+
+from analysis_engine import collect
+from snapshot_store import catalog_schema, get_snapshot_folder, normalize_catalog, write_snapshot_frame
+
+details_file_name = "details.parquet"
+
+def get_details_files(ndjson_folder: str) -> list[str]:
+    return sorted(glob.glob(f"{ndjson_folder}/details/*.ndjson"))
+
+def get_details_path(ndjson_folder: str, parquet_root: str) -> str:
+    return os.path.join(get_snapshot_folder(ndjson_folder, parquet_root), details_file_name)
+
+# current if it's newer than every details file
+def is_details_current(ndjson_folder: str, parquet_root: str) -> bool:
+    path = get_details_path(ndjson_folder, parquet_root)
+    if not os.path.exists(path):
+        return False
+    return all(os.path.getmtime(f) <= os.path.getmtime(path) for f in get_details_files(ndjson_folder))
+
+# parse the details files into details.parquet; there are only as many records as the day
+# had changes, so the raw lines are read here and decoded by polars
+def write_snapshot_details(ndjson_folder: str, parquet_root: str) -> str:
+    path = get_details_path(ndjson_folder, parquet_root)
+    lines = []
+    for file_path in get_details_files(ndjson_folder):
+        with open(file_path, "r", encoding="utf-8") as file:
+            lines.extend(line.rstrip("\n") for line in file if line.strip())
+    logging.debug(f"writing {len(lines)} detail records to {path}...")
+
+    details = pl.LazyFrame({"record_json": lines}, schema={"record_json": pl.String}) \
+        .with_columns(pl.col("record_json").str.json_decode(pl.Struct(catalog_schema)).alias("record")) \
+        .unnest("record") \
+        .pipe(normalize_catalog)
+    return write_snapshot_frame(details, path)
+
+# scan a snapshot's detail records, building details.parquet first if needed;
+# None if no details were fetched for the snapshot
+def load_snapshot_details(ndjson_folder: str, parquet_root: str) -> pl.LazyFrame:
+    if not get_details_files(ndjson_folder):
+        return None
+    if not is_details_current(ndjson_folder, parquet_root):
+        write_snapshot_details(ndjson_folder, parquet_root)
+    return pl.scan_parquet(get_details_path(ndjson_folder, parquet_root))
+
+# the fetch summary written next to the details (requested, fetched, failed)
+def get_details_summary(ndjson_folder: str) -> dict:
+    path = os.path.join(ndjson_folder, "details", "details.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as file:
+        return json.load(file)
+
+# what a day's details add to its statistics: the fetch summary and how many records and
+# organizations the (already filtered) details hold
+def details_counts(details: pl.LazyFrame, summary: dict = None) -> dict:
+    counts = collect(details.select(
+        pl.len().alias("records"),
+        pl.col("organization_id").n_unique().alias("organizations")
+    ))
+    return {"fetch": summary, **counts.row(0, named=True)}
@@ -0,0 +1,127 @@
+# compact sidecar index for each parquet snapshot
+# index.arrow holds one row per dataset sorted by id: the id, a 64-bit content hash, the
+# organization id, the resource count and the columns pivoted out of extras; organizations.arrow
+# holds the organization metadata once per organization. Counts and id-level diffs are computed
+# from these files alone.
+
+import json
+import logging
+import os
+import polars as pl
+
+from analysis_engine import collect
+from catalog_diff import get_compared_fields, hash_catalog, hash_seed
+from catalog_extras import derived_columns, extras_counts, publisher_counts
+from organization_dimension import add_organizations, describe_organizations, join_organization_key
+from snapshot_store import get_snapshot_folder, get_snapshot_path, scan_snapshot
+
+index_file_name = "index.arrow"
+organizations_file_name = "organizations.arrow"
+index_info_file_name = "index.json"
+
+# polars only promises stable hashes within a version, so indexes record what built them
+# (how fields were hashed and which extras columns they carry)
+def get_index_info() -> dict:
+    return {"polars_version": pl.__version__, "hash_seed": hash_seed, "field_hash": "json", "extras_columns": derived_columns}
+
+# the index is current if it's newer than the snapshot and was hashed the same way
+def is_index_current(ndjson_folder: str, parquet_root: str) -> bool:
+    folder = get_snapshot_folder(ndjson_folder, parquet_root)
+    index_path = os.path.join(folder, index_file_name)
+    info_path = os.path.join(folder, index_info_file_name)
+    if not (os.path.exists(index_path) and os.path.exists(info_path)):
+        return False
+    if os.path.getmtime(index_path) < os.path.getmtime(get_snapshot_path(ndjson_folder, parquet_root)):
+        return False
+    with open(info_path, "r") as file:
+        return json.load(file) == get_index_info()
+
+# the index rows of a catalog in the snapshot layout; rows only depend on their own record,
+# so the index of a whole snapshot can also be built page by page
+def build_index(catalog: pl.LazyFrame) -> pl.LazyFrame:
+    resource_count = pl.col("resources").list.len().cast(pl.UInt32).alias("resource_count")
+    return hash_catalog(catalog, get_compared_fields(catalog), extra_columns=[resource_count, *derived_columns]) \
+        .select("id", "record_hash", "organization_id", "resource_count", *derived_columns) \
+        .sort("id")
+
+def build_organizations(catalog: pl.LazyFrame) -> pl.LazyFrame:
+    return catalog \
+        .select("organization_id", "organization") \
+        .unique(subset=["organization_id"]) \
+        .select("organization") \
+        .unnest("organization") \
+        .sort("id")
+
+# save the index files of a snapshot; write them after catalog.parquet so they count as current
+def save_snapshot_index(folder: str, index: pl.LazyFrame | pl.DataFrame, organizations: pl.DataFrame) -> str:
+    os.makedirs(folder, exist_ok=True)
+    # uncompressed so the files can be memory mapped
+    if isinstance(index, pl.LazyFrame):
+        index.sink_ipc(os.path.join(folder, index_file_name), compression=None)
+    else:
+        index.write_ipc(os.path.join(folder, index_file_name), compression="uncompressed")
+    organizations.write_ipc(os.path.join(folder, organizations_file_name), compression="uncompressed")
+    with open(os.path.join(folder, index_info_file_name), "w") as file:
+        json.dump(get_index_info(), file)
+    return folder
+
+# build and save the index files for one snapshot; the index is streamed straight to disk
+def write_snapshot_index(ndjson_folder: str, parquet_root: str) -> str:
+    catalog = scan_snapshot(ndjson_folder, parquet_root)
+    folder = get_snapshot_folder(ndjson_folder, parquet_root)
+    logging.debug(f"indexing {folder}...")
+    return save_snapshot_index(folder, build_index(catalog), collect(build_organizations(catalog)))
+
+# load (index, organizations) for a snapshot, building them first if needed
+def load_snapshot_index(ndjson_folder: str, parquet_root: str) -> tuple[pl.DataFrame, pl.DataFrame]:
+    if not is_index_current(ndjson_folder, parquet_root):
+        write_snapshot_index(ndjson_folder, parquet_root)
+    folder = get_snapshot_folder(ndjson_folder, parquet_root)
+    index = pl.read_ipc(os.path.join(folder, index_file_name), memory_map=True)
+    organizations = pl.read_ipc(os.path.join(folder, organizations_file_name), memory_map=True)
+    return index.set_sorted("id"), organizations
+
+# same layout as collect_catalog_info, computed from an index and grouped by organization key
+def counts_from_index(index: pl.DataFrame, organizations: pl.DataFrame, dimension: pl.DataFrame = None) -> dict:
+    dimension = add_organizations(dimension, organizations)
+    counts_by_organization = index \
+        .pipe(join_organization_key, dimension) \
+        .group_by("organization_key") \
+        .agg([
+            pl.len().alias("catalog_count"),
+            pl.col("resource_count").sum().cast(pl.Int64).alias("resource_count")
+        ])
+
+    return {
+        "total_records": index.height,
+        "total_resources": int(index.get_column("resource_count").sum()),
+        "organizations": describe_organizations(counts_by_organization, dimension).to_dicts(),
+        "publishers": publisher_counts(index.lazy()),
+        "extras": extras_counts(index.lazy())
+    }
+
+# id-level differences from a merge of the two sorted indexes: after merging on id, a dataset
+# present in both snapshots occupies two adjacent rows, so one shifted comparison finds every
+# added, removed and modified id. one row per change (id, organization_id, change), sorted by id
+def index_changes(older: pl.DataFrame, newer: pl.DataFrame) -> pl.DataFrame:
+    columns = ["id", "record_hash", "organization_id"]
+    merged = newer.select(columns).with_columns(pl.lit(True).alias("is_newer")) \
+        .merge_sorted(older.select(columns).with_columns(pl.lit(False).alias("is_newer")), key="id")
+
+    same_as_next = pl.col("id") == pl.col("id").shift(-1)
+    same_as_previous = pl.col("id") == pl.col("id").shift(1)
+    changed = (same_as_next & (pl.col("record_hash") != pl.col("record_hash").shift(-1))) \
+        | (same_as_previous & (pl.col("record_hash") != pl.col("record_hash").shift(1)))
+
+    paired = (same_as_next | same_as_previous).fill_null(False)
+    changed = changed.fill_null(False)
+
+    return merged \
+        .with_columns(
+            pl.when(pl.col("is_newer") & ~paired).then(pl.lit("added"))
+                .when(~pl.col("is_newer") & ~paired).then(pl.lit("removed"))
+                .when(pl.col("is_newer") & changed).then(pl.lit("modified"))
+                .alias("change")
+        ) \
+        .filter(pl.col("change").is_not_null()) \
+        .select("id", "organization_id", "change")
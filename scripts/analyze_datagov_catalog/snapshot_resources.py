@@ -0,0 +1,161 @@
+# normalized resources table for each parquet snapshot
+# resources.parquet holds one row per resource: the dataset and organization it belongs to,
+# its id, normalized format, url and url host, size, last modified date and a 64-bit hash of
+# the whole resource. It's exploded from the nested resources lists once per snapshot so
+# resource-level counts and day-to-day changes are plain vectorized group-bys and joins.
+
+import json
+import logging
+import os
+import polars as pl
+
+from analysis_engine import collect, collect_all
+from catalog_diff import hash_seed
+from snapshot_index import get_index_info
+from snapshot_store import get_snapshot_folder, get_snapshot_path, scan_snapshot, write_snapshot_frame
+
+resources_file_name = "resources.parquet"
+resources_info_file_name = "resources.json"
+top_hosts = 100  # hosts listed individually in the counts
+
+# scheme://[user@]host[:port]/... -> host, lowercased and without a leading www.
+url_host = pl.col("url") \
+    .str.extract(r"^[a-zA-Z][a-zA-Z0-9+.-]*://(?:[^@/?#]*@)?([^/?#:]+)", 1) \
+    .str.to_lowercase() \
+    .str.strip_prefix("www.") \
+    .alias("url_host")
+
+# formats are free text in CKAN ("csv", " CSV", ".csv"); empty formats become null
+resource_format = pl.col("format").str.strip_chars().str.strip_prefix(".").str.to_uppercase()
+resource_format = pl.when(resource_format == "").then(None).otherwise(resource_format).alias("format")
+
+def get_resources_path(ndjson_folder: str, parquet_root: str) -> str:
+    return os.path.join(get_snapshot_folder(ndjson_folder, parquet_root), resources_file_name)
+
+# the table is current if it's newer than the snapshot and was hashed the same way
+def is_resources_current(ndjson_folder: str, parquet_root: str) -> bool:
+    path = get_resources_path(ndjson_folder, parquet_root)
+    info_path = os.path.join(get_snapshot_folder(ndjson_folder, parquet_root), resources_info_file_name)
+    if not (os.path.exists(path) and os.path.exists(info_path)):
+        return False
+    if os.path.getmtime(path) < os.path.getmtime(get_snapshot_path(ndjson_folder, parquet_root)):
+        return False
+    with open(info_path, "r") as file:
+        return json.load(file) == get_index_info()
+
+# explode the snapshot's resources into resources.parquet
+def write_snapshot_resources(ndjson_folder: str, parquet_root: str) -> str:
+    catalog = scan_snapshot(ndjson_folder, parquet_root)
+    path = get_resources_path(ndjson_folder, parquet_root)
+    logging.debug(f"writing resources to {path}...")
+
+    resources = catalog \
+        .select(pl.col("id").alias("dataset_id"), "organization_id", "resources") \
+        .explode("resources") \
+        .filter(pl.col("resources").is_not_null()) \
+        .with_columns(pl.col("resources").hash(seed=hash_seed).alias("resource_hash")) \
+        .unnest("resources") \
+        .filter(pl.col("id").is_not_null()) \
+        .select(
+            "dataset_id",
+            "organization_id",
+            pl.col("id").alias("resource_id"),
+            resource_format,
+            "url",
+            url_host,
+            pl.col("size").cast(pl.Int64, strict=False).alias("size"),
+            "last_modified",
+            "resource_hash"
+        ) \
+        .sort(["organization_id", "resource_id"])
+
+    write_snapshot_frame(resources, path)
+    with open(os.path.join(get_snapshot_folder(ndjson_folder, parquet_root), resources_info_file_name), "w") as file:
+        json.dump(get_index_info(), file)
+    return path
+
+# scan the resources table of a snapshot, building it first if needed
+def load_snapshot_resources(ndjson_folder: str, parquet_root: str) -> pl.LazyFrame:
+    if not is_resources_current(ndjson_folder, parquet_root):
+        write_snapshot_resources(ndjson_folder, parquet_root)
+    return pl.scan_parquet(get_resources_path(ndjson_folder, parquet_root))
+
+# counts by format, host and organization, and urls shared by more than one dataset;
+# the group-bys run together over a single scan. A missing format or host has its own null
+# row in by_format and by_host but isn't counted in an organization's format or host count
+def resource_counts(resources: pl.LazyFrame) -> dict:
+    def counts_by(column: str) -> pl.LazyFrame:
+        return resources \
+            .group_by(column) \
+            .agg(
+                pl.len().alias("resource_count"),
+                pl.col("dataset_id").n_unique().alias("dataset_count")
+            ) \
+            .sort(["resource_count", column], descending=[True, False], nulls_last=True)
+
+    shared_urls = resources \
+        .filter(pl.col("url").is_not_null()) \
+        .group_by("url") \
+        .agg(pl.col("dataset_id").n_unique().alias("dataset_count")) \
+        .filter(pl.col("dataset_count") > 1)
+
+    by_organization = resources \
+        .group_by("organization_id") \
+        .agg(
+            pl.len().alias("resource_count"),
+            pl.col("format").drop_nulls().n_unique().alias("format_count"),
+            pl.col("url_host").drop_nulls().n_unique().alias("host_count")
+        ) \
+        .sort("organization_id")
+
+    totals, by_format, by_host, by_organization, shared_urls = collect_all([
+        resources.select(pl.len().alias("resources"), pl.col("dataset_id").n_unique().alias("datasets")),
+        counts_by("format"),
+        counts_by("url_host").head(top_hosts),
+        by_organization,
+        shared_urls.select(pl.len().alias("urls"), pl.col("dataset_count").sum().alias("datasets"))
+    ])
+
+    return {
+        "total_resources": totals.item(0, "resources"),
+        "datasets_with_resources": totals.item(0, "datasets"),
+        "by_format": by_format.to_dicts(),
+        "by_host": by_host.to_dicts(),
+        "by_organization": by_organization.to_dicts(),
+        "shared_urls": shared_urls.item(0, "urls"),
+        "datasets_sharing_urls": shared_urls.item(0, "datasets") or 0
+    }
+
+# resource-level adds, removes and modifications from one full join on resource id:
+# one row per changed resource with its dataset, format and change, sorted by resource id
+def get_resource_changes(older: pl.LazyFrame, newer: pl.LazyFrame) -> pl.LazyFrame:
+    columns = ["resource_id", "dataset_id", "format", "resource_hash"]
+    return newer.select(columns) \
+        .join(older.select(columns), on="resource_id", how="full", suffix="_older", coalesce=True) \
+        .filter(
+            pl.col("resource_hash").is_null()
+            | pl.col("resource_hash_older").is_null()
+            | (pl.col("resource_hash") != pl.col("resource_hash_older"))
+        ) \
+        .select(
+            "resource_id",
+            pl.coalesce("dataset_id", "dataset_id_older").alias("dataset_id"),
+            pl.coalesce("format", "format_older").alias("format"),
+            pl.when(pl.col("resource_hash_older").is_null()).then(pl.lit("added"))
+                .when(pl.col("resource_hash").is_null()).then(pl.lit("removed"))
+                .otherwise(pl.lit("modified"))
+                .alias("change")
+        ) \
+        .sort("resource_id")
+
+def diff_resources(older: pl.LazyFrame, newer: pl.LazyFrame) -> dict:
+    changes = collect(get_resource_changes(older, newer))
+
+    def records(change: str) -> list[dict]:
+        return changes.filter(pl.col("change") == change).select("resource_id", "dataset_id", "format").to_dicts()
+
+    return {
+        "added": records("added"),
+        "removed": records("removed"),
+        "modified": records("modified")
+    }
@@ -0,0 +1,160 @@
+# parquet snapshot store for harvested catalogs
+# each ndjson snapshot folder is parsed once into <parquet_root>/<timestamp>/catalog.parquet
+# with a fixed schema, de-duplicated by id and sorted by organization id so the row group
+# statistics let scans skip organizations they don't need; the configured extras keys are
+# pivoted into their own columns on the way in (see catalog_extras)
+
+import glob
+import logging
+import os
+import polars as pl
+
+from catalog_extras import derived_columns, pivot_extras
+
+snapshot_file_name = "catalog.parquet"
+row_group_size = 10000
+
+organization_schema = pl.Struct({
+    "id": pl.String,
+    "name": pl.String,
+    "title": pl.String,
+    "type": pl.String,
+    "description": pl.String,
+    "image_url": pl.String,
+    "created": pl.String,
+    "is_organization": pl.Boolean,
+    "approval_status": pl.String,
+    "state": pl.String
+})
+
+resource_schema = pl.Struct({
+    "id": pl.String,
+    "package_id": pl.String,
+    "name": pl.String,
+    "description": pl.String,
+    "format": pl.String,
+    "mimetype": pl.String,
+    "url": pl.String,
+    "url_type": pl.String,
+    "size": pl.String,
+    "created": pl.String,
+    "last_modified": pl.String,
+    "metadata_modified": pl.String,
+    "position": pl.Int64,
+    "state": pl.String
+})
+
+tag_schema = pl.Struct({
+    "id": pl.String,
+    "name": pl.String,
+    "display_name": pl.String,
+    "state": pl.String,
+    "vocabulary_id": pl.String
+})
+
+group_schema = pl.Struct({
+    "id": pl.String,
+    "name": pl.String,
+    "title": pl.String,
+    "display_name": pl.String,
+    "description": pl.String,
+    "image_display_url": pl.String
+})
+
+extra_schema = pl.Struct({
+    "key": pl.String,
+    "value": pl.String
+})
+
+# the subset of package_search fields the analysis relies on; anything else is dropped
+catalog_schema = pl.Schema({
+    "id": pl.String,
+    "name": pl.String,
+    "title": pl.String,
+    "notes": pl.String,
+    "type": pl.String,
+    "state": pl.String,
+    "private": pl.Boolean,
+    "license_id": pl.String,
+    "license_title": pl.String,
+    "maintainer": pl.String,
+    "maintainer_email": pl.String,
+    "author": pl.String,
+    "author_email": pl.String,
+    "url": pl.String,
+    "version": pl.String,
+    "owner_org": pl.String,
+    "metadata_created": pl.String,
+    "metadata_modified": pl.String,
+    "num_resources": pl.Int64,
+    "num_tags": pl.Int64,
+    "organization": organization_schema,
+    "resources": pl.List(resource_schema),
+    "tags": pl.List(tag_schema),
+    "groups": pl.List(group_schema),
+    "extras": pl.List(extra_schema)
+})
+
+# get the parquet folder that mirrors an ndjson snapshot folder
+def get_snapshot_folder(ndjson_folder: str, parquet_root: str) -> str:
+    return os.path.join(parquet_root, os.path.basename(os.path.normpath(ndjson_folder)))
+
+def get_snapshot_path(ndjson_folder: str, parquet_root: str) -> str:
+    return os.path.join(get_snapshot_folder(ndjson_folder, parquet_root), snapshot_file_name)
+
+# the files a snapshot folder's parquet copy depends on; an incremental harvest keeps its
+# records under delta/ and its id listing under ids/ instead of the folder root
+def get_source_files(ndjson_folder: str) -> list[str]:
+    return sorted(glob.glob(f"{ndjson_folder}/*.ndjson")) + \
+        sorted(glob.glob(f"{ndjson_folder}/delta/*.ndjson")) + \
+        sorted(glob.glob(f"{ndjson_folder}/ids/*.txt"))
+
+# the parquet copy is current if it's newer than every file it was built from and has
+# every derived extras column (copies written before a key was added are rebuilt)
+def is_snapshot_current(ndjson_folder: str, parquet_root: str) -> bool:
+    path = get_snapshot_path(ndjson_folder, parquet_root)
+    if not os.path.exists(path):
+        return False
+    if not all(os.path.getmtime(f) <= os.path.getmtime(path) for f in get_source_files(ndjson_folder)):
+        return False
+    return set(derived_columns) <= set(pl.read_parquet_schema(path))
+
+# parse raw records into the snapshot layout; shared by every writer of the store. A dataset
+# listed twice keeps the record read first, so the same files always give the same snapshot
+def normalize_catalog(catalog: pl.LazyFrame) -> pl.LazyFrame:
+    return catalog \
+        .unique(subset=["id"], keep="first", maintain_order=True) \
+        .with_columns(pl.col("organization").struct.field("id").alias("organization_id")) \
+        .pipe(pivot_extras) \
+        .sort(["organization_id", "id"])
+
+# write a parquet frame with the store's row group layout, replacing any earlier copy atomically
+def write_snapshot_frame(catalog: pl.LazyFrame, path: str) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    catalog.sink_parquet(temp_path, compression="zstd", statistics=True, row_group_size=row_group_size)
+    os.replace(temp_path, path)
+    return path
+
+# scan raw ndjson files (a snapshot or an incremental delta) in the snapshot layout
+def scan_ndjson_snapshot(ndjson_files: list[str]) -> pl.LazyFrame:
+    return normalize_catalog(pl.scan_ndjson(ndjson_files, schema=catalog_schema, ignore_errors=True))
+
+# parse an ndjson snapshot folder into the parquet store; an incremental harvest has no
+# snapshot of its own and has to be applied to the one before it instead (see
+# catalog_statistics.prepare_delta_snapshots)
+def write_snapshot(ndjson_folder: str, parquet_root: str) -> str:
+    ndjson_files = sorted(glob.glob(f"{ndjson_folder}/*.ndjson"))
+    if not ndjson_files:
+        kind = "an incremental harvest that hasn't been applied" if os.path.isdir(f"{ndjson_folder}/delta") else "not a snapshot"
+        raise ValueError(f"{ndjson_folder} has no ndjson files; it's {kind}")
+    path = get_snapshot_path(ndjson_folder, parquet_root)
+    logging.debug(f"writing {len(ndjson_files)} ndjson files to {path}...")
+
+    return write_snapshot_frame(scan_ndjson_snapshot(ndjson_files), path)
+
+# scan a snapshot from the parquet store, converting it from ndjson first if needed
+def scan_snapshot(ndjson_folder: str, parquet_root: str) -> pl.LazyFrame:
+    if not is_snapshot_current(ndjson_folder, parquet_root):
+        write_snapshot(ndjson_folder, parquet_root)
+    return pl.scan_parquet(get_snapshot_path(ndjson_folder, parquet_root))
@@ -0,0 +1,255 @@
+# time-series store for the daily statistics
+# every daily statistics file is flattened into (date, organization_id, metric, value) rows in
+# a single SQLite file, keyed so one organization's history for one metric is a single index
+# range read. Weekly and monthly rollups are recomputed for just the periods a day touches.
+# catalog-wide values use the organization id "_catalog".
+# ingesting is idempotent per day: a day's rows are replaced as a whole, so re-ingesting a
+# file (or a regenerated one, e.g. after a statistics_version bump) never double counts, and
+# no other day's rows are ever touched. Days are only ever added or replaced, never removed.
+
+# %%
+import argparse
+from datetime import date, datetime, timedelta, timezone
+import glob
+import json
+import logging
+import os
+import sqlite3
+
+catalog_key = "_catalog"
+rollup_periods = ["week", "month"]
+
+schema = """
+CREATE TABLE IF NOT EXISTS daily_metrics (
+    organization_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    date TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (organization_id, metric, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS daily_metrics_date ON daily_metrics (date);
+
+CREATE TABLE IF NOT EXISTS rollups (
+    period TEXT NOT NULL,
+    organization_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    period_start TEXT NOT NULL,
+    days INTEGER,
+    last REAL,
+    min REAL,
+    max REAL,
+    mean REAL,
+    sum REAL,
+    PRIMARY KEY (period, organization_id, metric, period_start)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS organizations (
+    organization_id TEXT PRIMARY KEY,
+    name TEXT,
+    title TEXT
+);
+CREATE INDEX IF NOT EXISTS organizations_name ON organizations (name);
+
+CREATE TABLE IF NOT EXISTS ingested (
+    source TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    version INTEGER,
+    modified REAL,
+    ingested_at TEXT
+);
+"""
+
+# %%
+# functions
+
+def open_store(path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(schema)
+    return connection
+
+# "20250203T030107" -> "2025-02-03"
+def get_day(statistics_date: str) -> str:
+    return datetime.strptime(statistics_date[:8], "%Y%m%d").date().isoformat()
+
+def get_period_range(period: str, day: str) -> tuple[str, str]:
+    current = date.fromisoformat(day)
+    if period == "week":
+        start = current - timedelta(days=current.weekday())
+        end = start + timedelta(days=6)
+    else:
+        start = current.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return start.isoformat(), end.isoformat()
+
+# older statistics files list whole records in their deltas, newer ones only ids
+def get_delta_organization(record: dict) -> str:
+    return record.get("organization_id") or (record.get("organization") or {}).get("id")
+
+# the change records of a statistics file: listed inline in older files, in an ndjson file
+# under the statistics folder (see delta_files) in newer ones
+def iter_delta_records(result: dict, kind: str, change: str, statistics_folder: str = None):
+    deltas = result["deltas"] if kind == "datasets" else result["resources"]["deltas"]
+    records = deltas.get(change)
+    if isinstance(records, list):
+        yield from records
+        return
+    path = (result.get("delta_files") or {}).get(kind)
+    if not path or statistics_folder is None:
+        return
+    with open(os.path.join(statistics_folder, path), "r", encoding="utf-8") as file:
+        for line in file:
+            record = json.loads(line)
+            if record.get("change") == change:
+                yield record
+
+# flatten one daily statistics result into (organization_id, metric, value) rows; an
+# organization can appear more than once (older files grouped by the whole organization record)
+def statistics_rows(result: dict, statistics_folder: str = None) -> list[tuple[str, str, float]]:
+    counts = result["counts"]
+    rows = [
+        (catalog_key, "dataset_count", counts["total_records"]),
+        (catalog_key, "resource_count", counts["total_resources"]),
+        (catalog_key, "organization_count", len({o["id"] for o in counts["organizations"]}))
+    ]
+    if "publishers" in counts:
+        rows.append((catalog_key, "publisher_count", len(counts["publishers"])))
+    for organization in counts["organizations"]:
+        rows.append((organization["id"], "dataset_count", organization["catalog_count"]))
+        rows.append((organization["id"], "resource_count", organization["resource_count"]))
+
+    def change_rows(deltas: dict, kind: str, get_organization):
+        for change, records in deltas.items():
+            if records is None:
+                continue
+            # newer files only hold the count; the records are read from the deltas file
+            rows.append((catalog_key, f"{kind}_{change}", records if isinstance(records, int) else len(records)))
+            if get_organization is None:
+                continue
+            by_organization = {}
+            for record in iter_delta_records(result, kind, change, statistics_folder):
+                organization_id = get_organization(record)
+                if organization_id:
+                    by_organization[organization_id] = by_organization.get(organization_id, 0) + 1
+            rows.extend((organization_id, f"{kind}_{change}", count) for organization_id, count in by_organization.items())
+
+    change_rows(result["deltas"], "datasets", get_delta_organization)
+
+    resources = result.get("resources")
+    if resources:
+        resource_counts = resources["counts"]
+        rows.append((catalog_key, "shared_urls", resource_counts["shared_urls"]))
+        rows.append((catalog_key, "datasets_sharing_urls", resource_counts["datasets_sharing_urls"]))
+        for organization in resource_counts["by_organization"]:
+            rows.append((organization["organization_id"], "format_count", organization["format_count"]))
+            rows.append((organization["organization_id"], "host_count", organization["host_count"]))
+        # resource changes only carry dataset ids; totals are enough for the trends
+        change_rows(resources["deltas"], "resources", None)
+    return rows
+
+# recompute the rollups of every period that contains one of the days
+def update_rollups(connection: sqlite3.Connection, days: list[str]):
+    for period in rollup_periods:
+        for start, end in sorted({get_period_range(period, day) for day in days}):
+            connection.execute("DELETE FROM rollups WHERE period = ? AND period_start = ?", (period, start))
+            connection.execute("""
+                INSERT INTO rollups (period, organization_id, metric, period_start, days, last, min, max, mean, sum)
+                SELECT ?, d.organization_id, d.metric, ?, COUNT(*),
+                    (SELECT l.value FROM daily_metrics l
+                     WHERE l.organization_id = d.organization_id AND l.metric = d.metric AND l.date BETWEEN ? AND ?
+                     ORDER BY l.date DESC LIMIT 1),
+                    MIN(d.value), MAX(d.value), AVG(d.value), SUM(d.value)
+                FROM daily_metrics d
+                WHERE d.date BETWEEN ? AND ?
+                GROUP BY d.organization_id, d.metric
+            """, (period, start, start, end, start, end))
+
+# add one day's statistics, replacing whatever that day had, and refresh its rollups in a
+# single transaction
+def ingest_statistics(connection: sqlite3.Connection, result: dict, source: str = None, modified: float = None) -> str:
+    day = get_day(result["date"])
+    organizations = [(o["id"], o.get("name"), o.get("title")) for o in result["counts"]["organizations"]]
+    with connection:
+        # a later run on the same day replaces that day's values
+        connection.execute("DELETE FROM daily_metrics WHERE date = ?", (day,))
+        connection.executemany(
+            "INSERT INTO daily_metrics (organization_id, metric, date, value) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT DO UPDATE SET value = value + excluded.value",
+            [(organization_id, metric, day, value) for organization_id, metric, value
+             in statistics_rows(result, os.path.dirname(source) if source else None)]
+        )
+        connection.executemany("INSERT OR REPLACE INTO organizations (organization_id, name, title) VALUES (?, ?, ?)", organizations)
+        update_rollups(connection, [day])
+        if source:
+            connection.execute(
+                "INSERT OR REPLACE INTO ingested (source, date, version, modified, ingested_at) VALUES (?, ?, ?, ?, ?)",
+                (os.path.basename(source), day, result.get("version"), modified,
+                 datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S"))
+            )
+    return day
+
+# ingest every statistics file that is new or changed since it was last ingested;
+# files are taken in date order so the same day is always resolved to its latest run
+def update_store(connection: sqlite3.Connection, statistics_folder: str) -> list[str]:
+    ingested = dict(connection.execute("SELECT source, modified FROM ingested").fetchall())
+    days = []
+    for file_path in sorted(glob.glob(os.path.join(statistics_folder, "*.json"))):
+        modified = os.path.getmtime(file_path)
+        if ingested.get(os.path.basename(file_path)) == modified:
+            continue
+        try:
+            with open(file_path, "r") as file:
+                result = json.load(file)
+            days.append(ingest_statistics(connection, result, source=file_path, modified=modified))
+            logging.debug(f"ingested {file_path}")
+        except (json.JSONDecodeError, KeyError, ValueError) as e:
+            logging.warning(f"skipping {file_path}: {e!r}")
+    return days
+
+# one metric's history for one organization (id or name; None for the whole catalog)
+def query_metric(connection: sqlite3.Connection, metric: str, organization: str = None, start: str = None,
+                 end: str = None, period: str = "day") -> list[tuple[str, float]]:
+    organization_id = catalog_key
+    if organization:
+        row = connection.execute(
+            "SELECT organization_id FROM organizations WHERE organization_id = ? OR name = ?", (organization, organization)
+        ).fetchone()
+        organization_id = row[0] if row else organization
+    bounds = (start or "0000-00-00", end or "9999-99-99")
+    if period == "day":
+        return connection.execute(
+            "SELECT date, value FROM daily_metrics WHERE organization_id = ? AND metric = ? AND date BETWEEN ? AND ? ORDER BY date",
+            (organization_id, metric, *bounds)
+        ).fetchall()
+    return connection.execute(
+        "SELECT period_start, last FROM rollups WHERE period = ? AND organization_id = ? AND metric = ? AND period_start BETWEEN ? AND ? ORDER BY period_start",
+        (period, organization_id, metric, *bounds)
+    ).fetchall()
+
+# %%
+# bring the store up to date with the statistics folder, or query it
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s.%(msecs)03d %(levelname)-8s| %(message)s",
+        datefmt="%H:%M:%S"
+    )
+    parser = argparse.ArgumentParser(description="Update or query the daily statistics time-series store.")
+    parser.add_argument("--statistics-folder", default="../../data/daily_statistics", help="folder of daily statistics files")
+    parser.add_argument("--store", default="../../data/statistics.sqlite", help="path of the SQLite store")
+    parser.add_argument("--metric", help="print this metric's history instead of updating the store")
+    parser.add_argument("--organization", default=None, help="organization id or name (default: the whole catalog)")
+    parser.add_argument("--period", choices=["day"] + rollup_periods, default="day", help="daily values or rollups")
+    parser.add_argument("--start", default=None, help="first date, YYYY-MM-DD")
+    parser.add_argument("--end", default=None, help="last date, YYYY-MM-DD")
+    args = parser.parse_args()
+
+    connection = open_store(args.store)
+    if args.metric:
+        for day, value in query_metric(connection, args.metric, args.organization, args.start, args.end, args.period):
+            print(f"{day}\t{value:g}")
+    else:
+        days = update_store(connection, args.statistics_folder)
+        logging.info(f"ingested {len(days)} days into {args.store}")
+    connection.close()
@@ -0,0 +1,330 @@
+# local stand-in for the catalog.data.gov package_search and package_show APIs
+# records are generated on demand from (seed, index), so catalogs of a million datasets cost
+# little more than their sorted id list. A revision of the catalog modifies, removes and adds
+# a fixed share of datasets so two revisions can be diffed like two nightly snapshots.
+# the server understands the parameters the harvesters send (start, rows, sort=id asc,
+# fq=id:[a TO b} AND metadata_modified:{x TO y], fl=id) and can inject latency, server errors
+# and 429s with Retry-After.
+
+# %%
+import argparse
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+import uuid
+
+organization_count = 200
+base_date = datetime(2020, 1, 1, tzinfo=timezone.utc)
+date_format = "%Y-%m-%dT%H:%M:%S.%f"
+
+formats = ["CSV", "JSON", "XML", "HTML", "PDF", "ZIP", "API", "XLSX", "KML", "GeoJSON"]
+access_levels = ["public", "public", "public", "restricted public", "non-public"]
+extra_keys = [
+    "accessLevel", "bureauCode", "programCode", "publisher", "publisher_hierarchy", "modified",
+    "identifier", "harvest_object_id", "harvest_source_id", "harvest_source_title", "resource-type",
+    "spatial", "temporal", "theme", "language", "catalog_conformsTo", "catalog_describedBy"
+]
+tag_words = [
+    "health", "transportation", "education", "finance", "environment", "energy", "census", "housing",
+    "agriculture", "water", "climate", "safety", "budget", "geospatial", "parcels", "elections"
+]
+
+# %%
+# synthetic catalog
+
+def make_uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+def make_organization(index: int) -> dict:
+    rng = random.Random(f"organization-{index}")
+    name = f"organization-{index:04d}"
+    return {
+        "id": make_uuid(rng),
+        "name": name,
+        "title": f"Organization {index}",
+        "type": "organization",
+        "description": "",
+        "image_url": "",
+        "created": base_date.strftime(date_format),
+        "is_organization": True,
+        "approval_status": "approved",
+        "state": "active"
+    }
+
+organizations = [make_organization(i) for i in range(organization_count)]
+
+
+class SyntheticCatalog:
+    # change_rate, remove_rate and add_rate are shares of the catalog touched per revision
+    def __init__(self, size: int, seed: int = 0, revision: int = 0,
+                 change_rate: float = 0.02, remove_rate: float = 0.005, add_rate: float = 0.01):
+        self.size = size
+        self.seed = seed
+        self.revision = revision
+        self.change_rate = change_rate
+        self.remove_rate = remove_rate
+        self.add_rate = add_rate
+
+        # indexes past size are datasets added by later revisions
+        added = int(size * add_rate) * revision
+        indexes = [i for i in range(size + added) if not self.is_removed(i)]
+        ids = [self.record_id(i) for i in indexes]
+        order = sorted(range(len(ids)), key=ids.__getitem__)
+        self.ids = [ids[i] for i in order]
+        self.indexes = [indexes[i] for i in order]
+
+    def record_id(self, index: int) -> str:
+        return make_uuid(random.Random(f"{self.seed}-id-{index}"))
+
+    # a dataset's fate in a revision only depends on (seed, index, revision)
+    def draw(self, index: int, revision: int, kind: str) -> float:
+        return random.Random(f"{self.seed}-{kind}-{index}-{revision}").random()
+
+    def is_removed(self, index: int) -> bool:
+        return any(self.draw(index, r, "remove") < self.remove_rate for r in range(1, self.revision + 1))
+
+    # the latest revision that modified the dataset, or 0
+    def last_change(self, index: int) -> int:
+        for r in range(self.revision, 0, -1):
+            if self.draw(index, r, "change") < self.change_rate:
+                return r
+        return 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def record(self, position: int) -> dict:
+        index = self.indexes[position]
+        rng = random.Random(f"{self.seed}-record-{index}")
+        dataset_id = self.ids[position]
+        organization = organizations[rng.randrange(organization_count)]
+        changed = self.last_change(index)
+        created = base_date + timedelta(minutes=rng.randrange(60 * 24 * 365 * 4))
+        added_in = max(0, (index - self.size) // max(1, int(self.size * self.add_rate)) + 1) if index >= self.size else 0
+        modified = created + timedelta(days=changed + added_in)
+
+        resources = []
+        for position_in_package in range(rng.randrange(0, 11)):
+            resource_format = rng.choice(formats)
+            resources.append({
+                "id": make_uuid(rng),
+                "package_id": dataset_id,
+                "name": f"Resource {position_in_package}",
+                "description": "",
+                "format": resource_format,
+                "mimetype": None,
+                "url": f"https://data.example.gov/{dataset_id}/{position_in_package}.{resource_format.lower()}",
+                "url_type": None,
+                "size": None,
+                "created": created.strftime(date_format),
+                "last_modified": None,
+                "metadata_modified": modified.strftime(date_format),
+                "position": position_in_package,
+                "state": "active"
+            })
+
+        tags = []
+        for word in rng.sample(tag_words, rng.randrange(0, 9)):
+            tags.append({"id": make_uuid(rng), "name": word, "display_name": word, "state": "active", "vocabulary_id": None})
+
+        extras = [{"key": key, "value": f"{key}-{rng.randrange(1000)}"} for key in rng.sample(extra_keys, rng.randrange(5, len(extra_keys) + 1))]
+        for extra in extras:
+            if extra["key"] == "accessLevel":
+                extra["value"] = rng.choice(access_levels)
+            elif extra["key"] == "publisher":
+                extra["value"] = organization["title"]
+
+        return {
+            "id": dataset_id,
+            "name": f"dataset-{index}",
+            "title": f"Dataset {index}" + (f" (revised {changed})" if changed else ""),
+            "notes": "Synthetic dataset for benchmarking. " * rng.randrange(1, 6),
+            "type": "dataset",
+            "state": "active",
+            "private": False,
+            "license_id": "us-pd",
+            "license_title": "us-pd",
+            "maintainer": f"Maintainer {index % 97}",
+            "maintainer_email": f"maintainer{index % 97}@example.gov",
+            "author": None,
+            "author_email": None,
+            "url": None,
+            "version": None,
+            "owner_org": organization["id"],
+            "metadata_created": created.strftime(date_format),
+            "metadata_modified": modified.strftime(date_format),
+            "num_resources": len(resources),
+            "num_tags": len(tags),
+            "organization": organization,
+            "resources": resources,
+            "tags": tags,
+            "groups": [],
+            "extras": extras
+        }
+
+    # positions of the ids in [lower, upper) with the solr-style inclusive flag for the lower bound
+    def id_range(self, lower: str = None, upper: str = None, inclusive_lower: bool = True) -> range:
+        begin = 0 if lower is None else (bisect_left if inclusive_lower else bisect_right)(self.ids, lower)
+        end = len(self.ids) if upper is None else bisect_left(self.ids, upper)
+        return range(begin, max(begin, end))
+
+# %%
+# package_search
+
+id_filter_pattern = re.compile(r'id:([\[{])(\*|"[^"]*") TO (\*|"[^"]*")([\]}])')
+modified_filter_pattern = re.compile(r'metadata_modified:([\[{])(\S+) TO (\S+)([\]}])')
+
+def parse_solr_date(value: str) -> str:
+    return None if value == "*" else datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ").strftime(date_format)
+
+def package_search(catalog: SyntheticCatalog, query: dict) -> dict:
+    start = int(query.get("start", 0))
+    rows = int(query.get("rows", 10))
+    filter_query = query.get("fq", "")
+
+    positions = range(len(catalog))
+    id_match = id_filter_pattern.search(filter_query)
+    if id_match:
+        lower = None if id_match.group(2) == "*" else id_match.group(2).strip('"')
+        upper = None if id_match.group(3) == "*" else id_match.group(3).strip('"')
+        positions = catalog.id_range(lower, upper, id_match.group(1) == "[")
+
+    modified_match = modified_filter_pattern.search(filter_query)
+    if modified_match:
+        since, until = parse_solr_date(modified_match.group(2)), parse_solr_date(modified_match.group(3))
+        positions = [
+            p for p in positions
+            if (since is None or catalog.record(p)["metadata_modified"] > since)
+            and (until is None or catalog.record(p)["metadata_modified"] <= until)
+        ]
+
+    page = positions[start:start + rows]
+    if query.get("fl") == "id":
+        results = [{"id": catalog.ids[p]} for p in page]
+    else:
+        results = [catalog.record(p) for p in page]
+    return {"count": len(positions), "results": results}
+
+# the full record for one id, or None if the catalog doesn't have it
+def package_show(catalog: SyntheticCatalog, query: dict) -> dict:
+    position = bisect_left(catalog.ids, query.get("id", ""))
+    if position < len(catalog.ids) and catalog.ids[position] == query.get("id"):
+        return catalog.record(position)
+    return None
+
+
+class MockCKANServer:
+    # latency is the mean seconds added to every response; error_rate and throttle_rate are
+    # the shares of requests answered with a 500 or a 429
+    def __init__(self, catalog: SyntheticCatalog, host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, error_rate: float = 0.0, throttle_rate: float = 0.0, retry_after: int = 1):
+        self.catalog = catalog
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(catalog.seed)
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/3/action"
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def respond(self, status: int, body: dict, headers: dict = {}):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+                with mock._lock:
+                    mock.requests += 1
+                    draw = mock._rng.random()
+                    delay = mock._rng.expovariate(1 / mock.latency) if mock.latency else 0.0
+                if delay:
+                    time.sleep(delay)
+
+                action = parsed.path.rsplit("/", 1)[-1]
+                if action not in ("package_search", "package_show"):
+                    self.respond(404, {"success": False, "error": {"message": "Not found"}})
+                elif draw < mock.throttle_rate:
+                    with mock._lock:
+                        mock.throttled += 1
+                    self.respond(429, {"success": False}, {"Retry-After": str(mock.retry_after)})
+                elif draw < mock.throttle_rate + mock.error_rate:
+                    with mock._lock:
+                        mock.errors += 1
+                    self.respond(500, {"success": False})
+                elif action == "package_show":
+                    result = package_show(mock.catalog, query)
+                    if result is None:
+                        self.respond(404, {"success": False, "error": {"message": "Not found"}})
+                    else:
+                        self.respond(200, {"success": True, "result": result})
+                else:
+                    self.respond(200, {"success": True, "result": package_search(mock.catalog, query)})
+
+        return Handler
+
+    def start(self) -> "MockCKANServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+# %%
+# run the server on its own, e.g. for CATALOG_API_URL=http://127.0.0.1:8765/api/3/action
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a synthetic catalog through a mock package_search API.")
+    parser.add_argument("--size", type=int, default=10000, help="number of datasets")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the generated catalog")
+    parser.add_argument("--revision", type=int, default=0, help="catalog revision; each one modifies, removes and adds datasets")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on")
+    parser.add_argument("--latency", type=float, default=0.0, help="mean seconds of latency added to each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered with a 429")
+    args = parser.parse_args()
+
+    catalog = SyntheticCatalog(args.size, seed=args.seed, revision=args.revision)
+    server = MockCKANServer(catalog, port=args.port, latency=args.latency,
+                            error_rate=args.error_rate, throttle_rate=args.throttle_rate)
+    print(f"🧪 Serving {len(catalog)} datasets at {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
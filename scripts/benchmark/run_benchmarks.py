@@ -0,0 +1,242 @@
+# %%
+# offline benchmarks for the harvest -> analyze pipeline
+# every stage runs in its own spawned process against a synthetic catalog, so its wall time,
+# throughput and peak RSS are measured in isolation:
+#   harvest         async keyset harvest from the mock CKAN server into a local archive
+#   ndjson_write    streaming two catalog revisions through the multipart ndjson writer
+#   parquet_write   converting both ndjson snapshots into the parquet snapshot store
+#   catalog_info    collect_catalog_info on the newer snapshot
+#   catalog_diff    get_catalog_differences between the two revisions
+# results are written to data/benchmarks/<timestamp>.json; with --baseline the run is compared
+# against an earlier result and exits non-zero if a stage got slower or bigger than --tolerance.
+# timings only mean something against a baseline from the same machine, so results are kept
+# out of the repository (data/benchmarks/ is ignored): run once on the base revision, then
+# again on the change with --baseline pointing at the first file
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+from datetime import datetime, timezone
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+# every script folder on the import path (see script_paths.py one folder up)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from script_paths import scripts_dir
+
+from mock_ckan import MockCKANServer, SyntheticCatalog
+
+results_folder = os.path.normpath(os.path.join(scripts_dir, "..", "data", "benchmarks"))
+stages = ["harvest", "ndjson_write", "parquet_write", "catalog_info", "catalog_diff"]
+batch_size = 1000
+
+# %%
+# stages; each returns (records processed, seconds spent on the measured work)
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on linux and bytes on macos
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def ndjson_folder(work_dir: str, revision: int) -> str:
+    return os.path.join(work_dir, "ndjson", f"2025010{revision + 1}T000000")
+
+def stage_harvest(config: dict, work_dir: str) -> tuple[int, float]:
+    # the harvester reads its api and storage from the environment when it's imported
+    os.environ["CATALOG_API_URL"] = config["api_url"]
+    os.environ["CATALOG_STORAGE"] = f"file://{os.path.join(work_dir, 'archive')}"
+    import asyncio
+    import get_datagov_catalog_async as harvester
+
+    harvester.rows = config["rows"]
+    harvester.max_retries = 8
+    started = time.perf_counter()
+    stats = asyncio.run(harvester.harvest(
+        concurrency=config["concurrency"],
+        pagination="keyset",
+        output_mode="multipart",
+        manifest_dir=os.path.join(work_dir, "manifests")
+    ))
+    return stats.records, time.perf_counter() - started
+
+def stage_ndjson_write(config: dict, work_dir: str) -> tuple[int, float]:
+    from catalog_storage import LocalStorage
+    from ndjson_multipart import MultipartNDJSONWriter
+
+    # generating the synthetic records isn't part of the measured work
+    written = 0
+    seconds = 0.0
+    for revision in (0, 1):
+        catalog = SyntheticCatalog(config["size"], seed=config["seed"], revision=revision)
+        folder = ndjson_folder(work_dir, revision)
+        storage = LocalStorage(folder)
+        started = time.perf_counter()
+        writer = MultipartNDJSONWriter(storage.client, storage.bucket, "", object_size=256 * 1024 * 1024)
+        seconds += time.perf_counter() - started
+        for begin in range(0, len(catalog), batch_size):
+            records = [catalog.record(p) for p in range(begin, min(begin + batch_size, len(catalog)))]
+            started = time.perf_counter()
+            written += writer.write_records(records)[0]
+            seconds += time.perf_counter() - started
+        started = time.perf_counter()
+        writer.close()
+        seconds += time.perf_counter() - started
+    return written, seconds
+
+def stage_parquet_write(config: dict, work_dir: str) -> tuple[int, float]:
+    import polars as pl
+    from snapshot_store import write_snapshot
+
+    started = time.perf_counter()
+    records = 0
+    for revision in (0, 1):
+        path = write_snapshot(ndjson_folder(work_dir, revision), os.path.join(work_dir, "parquet"))
+        records += pl.scan_parquet(path).select(pl.len()).collect().item()
+    return records, time.perf_counter() - started
+
+def stage_catalog_info(config: dict, work_dir: str) -> tuple[int, float]:
+    from catalog_statistics import collect_catalog_info
+    from snapshot_store import scan_snapshot
+
+    catalog = scan_snapshot(ndjson_folder(work_dir, 1), os.path.join(work_dir, "parquet"))
+    started = time.perf_counter()
+    records = collect_catalog_info(catalog)["total_records"]
+    return records, time.perf_counter() - started
+
+def stage_catalog_diff(config: dict, work_dir: str) -> tuple[int, float]:
+    import polars as pl
+    from catalog_diff import get_catalog_differences
+    from snapshot_store import scan_snapshot
+
+    older = scan_snapshot(ndjson_folder(work_dir, 0), os.path.join(work_dir, "parquet"))
+    newer = scan_snapshot(ndjson_folder(work_dir, 1), os.path.join(work_dir, "parquet"))
+    started = time.perf_counter()
+    get_catalog_differences(older=older, newer=newer)
+    seconds = time.perf_counter() - started
+    return pl.concat([older.select(pl.len()), newer.select(pl.len())]).sum().collect().item(), seconds
+
+# runs in a fresh process so the peak RSS belongs to this stage alone; a failure is returned
+# as a string, since not every exception (e.g. a polars panic) can be pickled back
+def run_stage(name: str, config: dict, work_dir: str) -> dict:
+    stage = globals()[f"stage_{name}"]
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            records, seconds = stage(config, work_dir)
+    except BaseException as e:
+        return {"error": f"{type(e).__name__}: {e}", "peak_rss_mb": round(peak_rss_mb(), 1)}
+    return {
+        "seconds": round(seconds, 3),
+        "records": records,
+        "records_per_second": round(records / seconds, 1) if seconds > 0 else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1)
+    }
+
+# %%
+# comparing runs
+
+# stages that got slower or bigger than the tolerance allows, as readable messages
+def find_regressions(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, stage in result["stages"].items():
+        before = baseline.get("stages", {}).get(name)
+        if "error" in stage:
+            regressions.append(f"{name}: failed with {stage['error']}")
+            continue
+        if not before or "error" in before:
+            continue
+        if before.get("records_per_second") and stage["records_per_second"] < before["records_per_second"] * (1 - tolerance):
+            regressions.append(f"{name}: {stage['records_per_second']} records/s, was {before['records_per_second']}")
+        if stage["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {stage['peak_rss_mb']} MB, was {before['peak_rss_mb']}")
+    return regressions
+
+def run_benchmarks(size: int = 10000, seed: int = 0, rows: int = 1000, concurrency: int = 8, latency: float = 0.0,
+                   error_rate: float = 0.0, throttle_rate: float = 0.0, selected: list[str] = stages,
+                   work_dir: str = None) -> dict:
+    work_dir = work_dir or tempfile.mkdtemp(prefix="catalog_benchmark_")
+    config = {
+        "size": size, "seed": seed, "rows": rows, "concurrency": concurrency,
+        "latency": latency, "error_rate": error_rate, "throttle_rate": throttle_rate
+    }
+    result = {
+        "timestamp": datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S"),
+        "python": sys.version.split()[0],
+        "config": config,
+        "stages": {}
+    }
+
+    server = None
+    if "harvest" in selected:
+        server = MockCKANServer(SyntheticCatalog(size, seed=seed), latency=latency,
+                                error_rate=error_rate, throttle_rate=throttle_rate).start()
+        config["api_url"] = server.url
+
+    # polars' thread pool doesn't survive fork, so stages are spawned
+    mp_context = multiprocessing.get_context("spawn")
+    try:
+        for name in stages:
+            if name not in selected:
+                continue
+            with ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as pool:
+                stage = pool.submit(run_stage, name, config, work_dir).result()
+            result["stages"][name] = stage
+            if "error" in stage:
+                print(f"❌ {name} failed: {stage['error']}")
+            else:
+                print(f"⏱️ {name}: {stage['seconds']}s, {stage['records_per_second']} records/s, peak RSS {stage['peak_rss_mb']} MB")
+    finally:
+        if server is not None:
+            result["server"] = {"requests": server.requests, "errors": server.errors, "throttled": server.throttled}
+            server.stop()
+        config.pop("api_url", None)
+    return result
+
+# %%
+# run the benchmarks
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the harvest and analysis stages against a synthetic catalog.")
+    parser.add_argument("--size", type=int, default=10000, help="number of datasets in the synthetic catalog")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the generated catalog")
+    parser.add_argument("--rows", type=int, default=1000, help="rows per package_search page")
+    parser.add_argument("--concurrency", type=int, default=8, help="maximum requests in flight while harvesting")
+    parser.add_argument("--latency", type=float, default=0.0, help="mean seconds of latency added by the mock server")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests the mock server fails with a 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests the mock server answers with a 429")
+    parser.add_argument("--stages", nargs="+", choices=stages, default=stages, help="stages to run (later stages need the earlier ones' output)")
+    parser.add_argument("--work-dir", default=None, help="folder for the intermediate files (default: a temporary folder)")
+    parser.add_argument("--keep", action="store_true", help="keep the intermediate files")
+    parser.add_argument("--baseline", default=None, help="earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown or memory growth before a stage counts as a regression")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="catalog_benchmark_")
+    try:
+        result = run_benchmarks(size=args.size, seed=args.seed, rows=args.rows, concurrency=args.concurrency,
+                                latency=args.latency, error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                                selected=args.stages, work_dir=work_dir)
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    os.makedirs(results_folder, exist_ok=True)
+    result_file = os.path.join(results_folder, f"{result['timestamp']}.json")
+    with open(result_file, "w") as file:
+        json.dump(result, file, indent=4)
+    print(f"📄 Results saved to {result_file}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            regressions = find_regressions(result, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"🔻 {regression}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against the baseline")
+    if any("error" in stage for stage in result["stages"].values()):
+        sys.exit(1)
@@ -0,0 +1,259 @@
+# storage backends shared by the harvesters and the analysis
+# CATALOG_STORAGE picks where the archive lives:
+#   s3://<bucket>        the archive bucket (the default is s3://govex-us-data-archive)
+#   file://<path>        a local directory laid out like the bucket, e.g. for offline runs
+# S3_ENDPOINT_URL points the s3 backend at an S3-compatible endpoint such as a local MinIO.
+# every backend exposes `client`, a boto3-style S3 client created on first use (so importing
+# a script never needs credentials), with a connection pool sized for the bulk helpers below
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import io
+import os
+import shutil
+import threading
+import uuid
+
+default_storage = "s3://govex-us-data-archive"
+max_pool_connections = 32  # keep-alive connections per client; matches the largest bulk fan-out
+bulk_workers = 16           # concurrent transfers in put_many/get_many/mirror
+
+
+# common helpers; backends only need to provide `client`, `bucket` and `uri`
+class CatalogStorage:
+    bucket = None
+
+    def put(self, key: str, body: bytes | str):
+        self.client.put_object(Body=body, Bucket=self.bucket, Key=key)
+
+    def get(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+    # a file-like body to read an object in pieces, for objects too large to hold in memory
+    def open(self, key: str):
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except Exception:
+            return False
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    # yield {"Key", "Size", "LastModified"} for every object under the prefix
+    def list_objects(self, prefix: str):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            yield from page.get("Contents", [])
+
+    def list_keys(self, prefix: str) -> list[str]:
+        return [item["Key"] for item in self.list_objects(prefix)]
+
+    # the "folders" directly under a prefix
+    def list_folders(self, prefix: str) -> list[str]:
+        prefix = prefix.rstrip("/") + "/"
+        paginator = self.client.get_paginator("list_objects_v2")
+        folders = []
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter="/"):
+            folders.extend(item["Prefix"].rstrip("/") for item in page.get("CommonPrefixes", []))
+        return folders
+
+    # upload many (key, body) pairs concurrently; returns the keys in order
+    def put_many(self, items: list[tuple[str, bytes | str]], workers: int = bulk_workers) -> list[str]:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda item: self.put(*item), items))
+        return [key for key, _ in items]
+
+    # download many keys concurrently into a {key: bytes} dict
+    def get_many(self, keys: list[str], workers: int = bulk_workers) -> dict[str, bytes]:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return dict(zip(keys, pool.map(self.get, keys)))
+
+    # copy every object under the prefix into local_folder, skipping files that are already
+    # there with the same size; files are written to a temp name first so a failed run never
+    # leaves a truncated copy behind. returns the local paths that were downloaded
+    def mirror(self, prefix: str, local_folder: str, workers: int = bulk_workers) -> list[str]:
+        prefix = prefix.rstrip("/") + "/"
+
+        def download(item) -> str:
+            path = os.path.join(local_folder, item["Key"][len(prefix):])
+            if os.path.exists(path) and os.path.getsize(path) == item["Size"]:
+                return None
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(temp_path, "wb") as file:
+                body = self.client.get_object(Bucket=self.bucket, Key=item["Key"])["Body"]
+                shutil.copyfileobj(body, file, 1024 * 1024)
+            os.replace(temp_path, path)
+            return path
+
+        items = [item for item in self.list_objects(prefix) if not item["Key"].endswith("/")]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return [path for path in pool.map(download, items) if path]
+
+
+class S3Storage(CatalogStorage):
+    def __init__(self, bucket: str, endpoint_url: str = None, region: str = None,
+                 max_pool_connections: int = max_pool_connections):
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.max_pool_connections = max_pool_connections
+        self._client = None
+        self._lock = threading.Lock()
+
+    # boto3 clients are thread safe, so one pooled client is shared by every thread
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+                    from botocore.config import Config
+
+                    # credentials come from AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY (or any
+                    # other source boto3 knows about)
+                    # You can create an access key here: https://us-east-1.console.aws.amazon.com/iam/home?region=us-east-1#/security_credentials?section=IAM_credentials
+                    self._client = boto3.client(
+                        "s3",
+                        endpoint_url=self.endpoint_url,
+                        region_name=self.region,
+                        config=Config(
+                            max_pool_connections=self.max_pool_connections,
+                            retries={"max_attempts": 5, "mode": "adaptive"}
+                        )
+                    )
+        return self._client
+
+    def uri(self, key: str) -> str:
+        return f"s3://{self.bucket}/{key}"
+
+
+class LocalStorage(CatalogStorage):
+    def __init__(self, root: str):
+        self.root = root
+        self.bucket = os.path.basename(os.path.normpath(root))
+        self.client = LocalS3Client(root)
+
+    def uri(self, key: str) -> str:
+        return self.client.path(key)
+
+
+# the subset of the boto3 S3 client the scripts use, backed by a local directory;
+# keys map to paths under the root and the bucket name is ignored
+class LocalS3Client:
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self, root: str):
+        self.root = root
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def _write(self, key: str, chunks: list[bytes]):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as file:
+            for chunk in chunks:
+                file.write(chunk)
+        os.replace(temp_path, path)
+
+    def put_object(self, Body, Bucket: str, Key: str, **kwargs):
+        self._write(Key, [Body.encode("utf-8") if isinstance(Body, str) else Body])
+        return {}
+
+    def get_object(self, Bucket: str, Key: str, **kwargs):
+        try:
+            with open(self.path(Key), "rb") as file:
+                return {"Body": io.BytesIO(file.read())}
+        except FileNotFoundError:
+            raise self.exceptions.NoSuchKey(Key)
+
+    def head_object(self, Bucket: str, Key: str, **kwargs):
+        if not os.path.isfile(self.path(Key)):
+            raise self.exceptions.NoSuchKey(Key)
+        return {"ContentLength": os.path.getsize(self.path(Key))}
+
+    def delete_object(self, Bucket: str, Key: str, **kwargs):
+        if os.path.exists(self.path(Key)):
+            os.remove(self.path(Key))
+        return {}
+
+    # the whole listing in one page; ContinuationToken is never needed
+    def list_objects_v2(self, Bucket: str, Prefix: str = "", Delimiter: str = None, **kwargs):
+        contents = []
+        prefixes = set()
+        for root, dirs, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if not key.startswith(Prefix):
+                    continue
+                if Delimiter and Delimiter in key[len(Prefix):]:
+                    prefixes.add(Prefix + key[len(Prefix):].split(Delimiter)[0] + Delimiter)
+                    continue
+                contents.append({
+                    "Key": key,
+                    "Size": os.path.getsize(path),
+                    "LastModified": datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+                })
+        response = {"Contents": sorted(contents, key=lambda item: item["Key"]), "IsTruncated": False}
+        if Delimiter:
+            response["CommonPrefixes"] = [{"Prefix": prefix} for prefix in sorted(prefixes)]
+        return response
+
+    def get_paginator(self, operation_name: str):
+        client = self
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                yield getattr(client, operation_name)(**kwargs)
+
+        return Paginator()
+
+    # multipart uploads keep their parts in memory until they're completed
+    def create_multipart_upload(self, Bucket: str, Key: str, **kwargs):
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Body: bytes, Bucket: str, Key: str, UploadId: str, PartNumber: int, **kwargs):
+        with self._lock:
+            self._uploads[UploadId][PartNumber] = Body
+        return {"ETag": f'"{UploadId}-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: dict, **kwargs):
+        with self._lock:
+            parts = self._uploads.pop(UploadId)
+        self._write(Key, [parts[part["PartNumber"]] for part in MultipartUpload["Parts"]])
+        return {"Key": Key}
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str, **kwargs):
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+        return {}
+
+
+# build the backend named by a storage url, CATALOG_STORAGE or the default archive bucket
+def get_storage(url: str = None) -> CatalogStorage:
+    url = url or os.environ.get("CATALOG_STORAGE") or default_storage
+    if url.startswith("s3://"):
+        return S3Storage(
+            url[len("s3://"):].strip("/"),
+            endpoint_url=os.environ.get("S3_ENDPOINT_URL"),
+            region=os.environ.get("AWS_REGION")
+        )
+    if url.startswith("file://"):
+        url = url[len("file://"):]
+    return LocalStorage(url)
@@ -0,0 +1,638 @@
+# %%
+import argparse
+import asyncio
+from datetime import datetime, timezone
+import functools
+import hashlib
+import json
+import os
+import sys
+import time
+from urllib.parse import urlencode
+
+import aiohttp
+
+# every script folder on the import path (see script_paths.py one folder up)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import script_paths  # noqa: F401
+
+from catalog_storage import get_storage
+from harvest_manifest import HarvestManifest, manifest_file_name
+from ndjson_multipart import MultipartNDJSONWriter
+from record_archive import pack_snapshot
+from request_scheduler import AdaptiveScheduler, parse_retry_after, throttle_statuses
+from run_metrics import RunMetrics
+
+# the archive lives in S3 unless CATALOG_STORAGE points somewhere else (see catalog_storage.py);
+# the client is only created when the first object is written
+storage = get_storage()
+bucket_name = storage.bucket
+
+# fetch, serialize and upload timings, request counts and bytes; saved as run_metrics.json
+metrics = RunMetrics(job="harvest")
+
+# %%
+# defining parameters
+start = 0               # Start index
+rows = 1000             # Number of rows to fetch per request
+end_limit = 310000      # Maximum number of rows to fetch
+request_timeout = 60    # Timeout in seconds
+max_retries = 5         # Maximum number of retries
+concurrency = 16        # Maximum number of package_search requests in flight
+initial_concurrency = 4 # Requests in flight at the start; the scheduler adjusts it from there
+upload_workers = 4      # Number of concurrent S3 uploads
+upload_queue_size = 16  # Pages buffered between fetching and uploading
+pagination = "offset"   # "offset" pages with start=; "keyset" pages by id cursor
+key_ranges = 16         # Number of disjoint id ranges walked in parallel in keyset mode
+id_listing_days = 7     # Days between full id listings in incremental mode (used to detect deletions)
+output_mode = "pages"   # "pages" writes one object per page; "multipart" streams into a few large objects
+part_size = 16 * 1024 * 1024  # Bytes per S3 multipart part in multipart mode
+compression = None      # None, "gzip" or "zstd" in multipart mode
+
+# output folder
+output_base = "data_gov_catalog_ndjson"
+# Create a folder named with the current ISO8601 timestamp
+timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+run_folder = os.path.join(output_base, timestamp)
+
+# CATALOG_API_URL points the harvest at another CKAN instance, e.g. the mock server in scripts/benchmark
+catalog_api = os.environ.get("CATALOG_API_URL", "https://catalog.data.gov/api/3/action")
+search_url = f"{catalog_api}/package_search"
+
+# incremental runs start from the high-water mark of the last successful run
+state_key = f"Catalog/{output_base}/harvest_state.json"
+solr_date_format = "%Y-%m-%dT%H:%M:%SZ"
+
+# %%
+# functions
+
+# it's a function because it can happen in several places
+# error_name identifies the page in the errors folder; details describe how to refetch it
+def log_error_to_s3(url, error, error_name, **details):
+    error_details = {
+        "timestamp": datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S"),
+        "url": url,
+        "error": str(error),
+        **details
+    }
+    error_file = f"{run_folder}/errors/error_{error_name}.json"
+    try:
+        storage.put(f"Catalog/{error_file}", json.dumps(error_details, indent=4))
+        print(f"🚨 Error log saved to S3: {error_file}")
+    except Exception as e:
+        print(f"❌ Failed to log error to S3: {e}")
+
+# serialize a page of packages to ndjson, dropping records that would break the line format
+def to_ndjson(package_list: list) -> str:
+    valid_lines = []
+    for i, data in enumerate(package_list):
+        json_object = json.dumps(data)
+        # checking for cases where we have invalid newline delimiters
+        if len(json_object.splitlines()) == 1:
+            valid_lines.append(json_object)
+        else:
+            print(f'Error in id = {data["id"]} at line number = {i}')
+    return "\n".join(valid_lines)
+
+# running totals so the async run can be compared against the serial script
+class HarvestStats:
+    def __init__(self):
+        self.started = time.time()
+        self.pages_fetched = 0
+        self.pages_uploaded = 0
+        self.uploads_failed = 0
+        self.pages_failed = 0
+        self.records = 0
+
+    def summary(self) -> str:
+        elapsed = time.time() - self.started
+        pages_per_second = self.pages_fetched / elapsed if elapsed > 0 else 0.0
+        return (
+            f"{self.pages_fetched} pages fetched, {self.pages_uploaded} uploaded, "
+            f"{self.pages_failed} failed, {self.records} records in {elapsed:.2f} seconds "
+            f"({pages_per_second:.2f} pages/sec)"
+        )
+
+# a 404 is final (e.g. a dataset deleted after it was listed), so it isn't retried
+def is_not_found(error: Exception) -> bool:
+    return isinstance(error, aiohttp.ClientResponseError) and error.status == 404
+
+# fetch one API url, backing off as the scheduler directs; returns the result object or None
+async def fetch_result(session: aiohttp.ClientSession, scheduler: AdaptiveScheduler, fetch_url: str,
+                       error_name: str, error_details: dict) -> dict:
+    print(f"Fetching: {fetch_url}")
+
+    for attempt in range(max_retries):
+        throttled = False
+        retry_after = None
+        try:
+            async with scheduler.slot():
+                request_start = time.monotonic()
+                try:
+                    async with session.get(fetch_url) as response:
+                        metrics.increment("requests_total", status=response.status)
+                        if response.status in throttle_statuses:
+                            throttled = True
+                            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                            scheduler.on_throttle(retry_after)
+                        response.raise_for_status()
+                        body = await response.read()
+                        metrics.increment("response_bytes_total", len(body))
+                        server_response = json.loads(body)
+                except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+                    metrics.increment("request_errors_total", error=type(e).__name__)
+                    if not throttled and not is_not_found(e):
+                        scheduler.on_error(time.monotonic() - request_start)
+                    raise
+                scheduler.on_success(time.monotonic() - request_start)
+            return server_response.get('result', {})
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"⚠️ Attempt {attempt+1} failed for {error_name}: {e!r}")
+            if is_not_found(e):
+                await asyncio.to_thread(log_error_to_s3, fetch_url, e, error_name, **error_details)
+                return None
+            if attempt < max_retries - 1:
+                metrics.increment("retries_total")
+                retry_delay = scheduler.retry_delay(attempt, retry_after)
+                print(f"Retrying in {retry_delay:.1f} seconds...")
+                await asyncio.sleep(retry_delay)
+            else:
+                await asyncio.to_thread(log_error_to_s3, fetch_url, e, error_name, **error_details)
+
+        except json.JSONDecodeError as e:
+            print(f"❌ Error parsing JSON: {e}")
+            if attempt < max_retries - 1:
+                metrics.increment("retries_total")
+                print("Retrying...")
+            else:
+                await asyncio.to_thread(log_error_to_s3, fetch_url, e, error_name, **error_details)
+
+    return None
+
+# fetch a single package_search page
+async def fetch_page(session: aiohttp.ClientSession, scheduler: AdaptiveScheduler, params: dict,
+                     error_name: str, error_details: dict) -> dict:
+    return await fetch_result(session, scheduler, f"{search_url}?{urlencode(params)}", error_name, error_details)
+
+# fetch one offset page under the scheduler's limit and hand it to the upload queue;
+# returns False if the page couldn't be fetched
+async def harvest_page(session, scheduler, upload_queue, stats, start, rows, manifest=None, page_folder=""):
+    page_name = f"{start:06d}_{start+rows:06d}"
+    params = {"start": start, "rows": rows}
+    error_details = {"mode": "offset", "page_folder": page_folder, **params}
+    result = await fetch_page(session, scheduler, params, page_name, error_details)
+
+    if result is None:
+        stats.pages_failed += 1
+        if manifest:
+            manifest.update_page(page_name, "failed", **params)
+        return False
+    stats.pages_fetched += 1
+
+    package_list = result.get('results', [])
+    if package_list:
+        if manifest:
+            manifest.update_page(page_name, "fetched", **params)
+        description = f"Rows {start} - {start+rows} of {result.get('count', 0)}"
+        await upload_queue.put((f"{page_folder}download_{page_name}.ndjson", description, package_list, page_name))
+    else:
+        if manifest:
+            manifest.update_page(page_name, "done", records=0, **params)
+        print(f"🟡 No data to save for rows {start} - {start+rows}; skipping")
+    return True
+
+# split the id key space into disjoint [lower, upper) ranges on hex prefixes;
+# catalog ids are uuids so the ranges come out roughly the same size
+def split_key_space(ranges: int) -> list[tuple[str, str]]:
+    bounds = [None] + [f"{i * 256 // ranges:02x}" for i in range(1, ranges)] + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+# build the solr filter for one id range; the lower bound is exclusive once a cursor exists
+def keyset_filter(lower: str, upper: str, inclusive_lower: bool) -> str:
+    lower_term = f'"{lower}"' if lower else "*"
+    upper_term = f'"{upper}"' if upper else "*"
+    lower_bracket = "[" if inclusive_lower or not lower else "{"
+    upper_bracket = "}" if upper else "]"
+    return f"id:{lower_bracket}{lower_term} TO {upper_term}{upper_bracket}"
+
+# walk one id range in sort order until it is exhausted; every page is a cheap start=0 query
+# each page goes to handle_page(page_name, description, package_list); extra_filter narrows
+# the range (e.g. to recently modified datasets) and fields limits the columns returned.
+# resume_from=(cursor, inclusive, page_index) picks a range up part way through.
+# returns False if the range stopped on a page that couldn't be fetched
+async def harvest_key_range(session, scheduler, stats, range_index, lower, upper, rows,
+                            handle_page, page_prefix="keyset", extra_filter=None, fields=None,
+                            manifest=None, resume_from=None, page_folder=""):
+    cursor, inclusive, page_index = resume_from or (lower, True, 0)
+
+    while True:
+        page_name = f"{page_prefix}_{range_index:02d}_{page_index:05d}"
+        filter_query = keyset_filter(cursor, upper, inclusive)
+        if extra_filter:
+            filter_query = f"{filter_query} AND {extra_filter}"
+        params = {
+            "q": "*:*",
+            "fq": filter_query,
+            "sort": "id asc",
+            "start": 0,
+            "rows": rows
+        }
+        if fields:
+            params["fl"] = fields
+        page_details = {"range_index": range_index, "page_index": page_index, "cursor": cursor, "inclusive": inclusive}
+        error_details = {
+            "mode": "keyset", **page_details, "upper": upper, "rows": rows, "page_prefix": page_prefix,
+            "extra_filter": extra_filter, "fields": fields, "page_folder": page_folder
+        }
+        result = await fetch_page(session, scheduler, params, page_name, error_details)
+
+        if result is None:
+            # the cursor can't advance past a failed page; the error log records where to resume
+            stats.pages_failed += 1
+            if manifest:
+                manifest.update_page(page_name, "failed", **page_details)
+            return False
+        stats.pages_fetched += 1
+
+        package_list = result.get('results', [])
+        last_id = package_list[-1]["id"] if package_list else cursor
+        if manifest:
+            manifest.update_page(page_name, "fetched" if package_list else "done", last_id=last_id, **page_details)
+        if package_list:
+            description = f"Range {range_index} page {page_index} ({len(package_list)} rows after {cursor or 'start'})"
+            await handle_page(page_name, description, package_list)
+
+        if len(package_list) < rows:
+            print(f"🏁 Range {range_index} exhausted after {page_index + 1} pages")
+            if manifest:
+                manifest.mark_range_exhausted(f"{page_prefix}_{range_index:02d}")
+            return True
+
+        cursor = last_id
+        inclusive = False
+        page_index += 1
+
+# read the harvest state left by the last successful run; None if there isn't one yet
+def read_harvest_state() -> dict:
+    try:
+        return json.loads(storage.get(state_key))
+    except storage.client.exceptions.NoSuchKey:
+        return None
+
+def write_harvest_state(state: dict):
+    storage.put(state_key, json.dumps(state, indent=4))
+    print(f"📌 High-water mark advanced to {state['high_water_mark']}")
+
+# a full id listing is due if there has never been one or the last is older than id_listing_days
+def id_listing_due(state: dict, now: datetime, listing_days: int) -> bool:
+    last_listing = state.get("last_id_listing") if state else None
+    if not last_listing:
+        return True
+    last_listing_time = datetime.strptime(last_listing, "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc)
+    return (now - last_listing_time).days >= listing_days
+
+# the blocking halves of the upload stage, timed separately
+def serialize_page(package_list: list) -> bytes:
+    with metrics.timer("serialize"):
+        return to_ndjson(package_list).encode("utf-8")
+
+def timed_write_records(writer: MultipartNDJSONWriter, package_list: list, page_name: str) -> tuple[int, int, str]:
+    with metrics.timer("serialize"):
+        return writer.write_records(package_list, page_name)
+
+def upload_page_body(key: str, body: bytes):
+    with metrics.timer("upload", kind="page"):
+        storage.put(key, body)
+
+# drain the upload queue, running the blocking boto3 calls in worker threads;
+# with a multipart writer the pages are streamed into its open object instead.
+# on_records(package_list) is awaited for every saved page, e.g. to feed a downstream stage
+async def upload_worker(upload_queue, stats, writer=None, manifest=None, on_records=None):
+    while True:
+        item = await upload_queue.get()
+        if item is None:
+            upload_queue.task_done()
+            return
+        page_file, description, package_list, page_name = item
+        try:
+            if writer is not None:
+                records, page_bytes, checksum = await asyncio.to_thread(timed_write_records, writer, package_list, page_name)
+                metrics.increment("bytes_written_total", page_bytes)
+                body = None
+                if manifest and page_name:
+                    # done once the object holding the page is completed
+                    manifest.update_page(page_name, "buffered", records=records, bytes=page_bytes, sha256=checksum)
+            else:
+                body = await asyncio.to_thread(serialize_page, package_list)
+            if body is not None:
+                file_name = f'{run_folder}/{page_file}'
+                await asyncio.to_thread(upload_page_body, f"Catalog/{file_name}", body)
+                metrics.increment("bytes_written_total", len(body))
+                if manifest and page_name:
+                    manifest.update_page(page_name, "done", records=len(package_list), bytes=len(body),
+                                         sha256=hashlib.sha256(body).hexdigest(), object=f"Catalog/{file_name}")
+            stats.pages_uploaded += 1
+            stats.records += len(package_list)
+            print(f"✅ Success: {description} written to AWS")
+            if on_records is not None:
+                await on_records(package_list)
+        except Exception as e:
+            stats.uploads_failed += 1
+            if manifest and page_name:
+                manifest.update_page(page_name, "failed", error=str(e))
+            print(f"❌ Error saving {description} to S3: {e}")
+        finally:
+            if manifest:
+                await asyncio.to_thread(manifest.checkpoint)
+            upload_queue.task_done()
+
+# the run's manifest lives in its S3 folder unless a local folder is given
+def open_manifest(manifest_dir: str = None) -> HarvestManifest:
+    if manifest_dir:
+        local_path = os.path.join(manifest_dir, timestamp, manifest_file_name)
+        return HarvestManifest(run_folder, local_path=local_path)
+    return HarvestManifest(run_folder, s3=storage.client, bucket=bucket_name, key=f"Catalog/{run_folder}/{manifest_file_name}")
+
+# list the error logs a run left behind, with their parsed details
+def list_error_logs() -> list[tuple[str, dict]]:
+    error_keys = storage.list_keys(f"Catalog/{run_folder}/errors/")
+    return [(key, json.loads(body)) for key, body in storage.get_many(error_keys).items()]
+
+async def harvest(concurrency: int = concurrency, initial_concurrency: int = initial_concurrency,
+                  upload_workers: int = upload_workers,
+                  pagination: str = pagination, key_ranges: int = key_ranges,
+                  incremental: bool = False, id_listing_days: int = id_listing_days,
+                  output_mode: str = output_mode, part_size: int = part_size, compression: str = compression,
+                  resume: bool = False, repair: bool = False, manifest_dir: str = None,
+                  prometheus: bool = False, pack: bool = False, prune: bool = False,
+                  on_records=None) -> HarvestStats:
+    stats = HarvestStats()
+    metrics.labels["run"] = timestamp
+    scheduler = AdaptiveScheduler(initial_concurrency=min(initial_concurrency, concurrency), max_concurrency=concurrency)
+    upload_queue = asyncio.Queue(maxsize=upload_queue_size)
+
+    manifest = open_manifest(manifest_dir)
+    if resume or repair:
+        manifest.load()
+        print(f"📋 Loaded manifest for {run_folder}: {manifest.summary()}")
+    settings = manifest.settings
+
+    if settings:
+        # a resumed or repaired run keeps the mode and bounds it was started with
+        pagination = settings["pagination"]
+        key_ranges = settings["key_ranges"]
+        incremental = settings["incremental"]
+        run_started = datetime.strptime(settings["run_started"], solr_date_format).replace(tzinfo=timezone.utc)
+        state = settings["previous_state"]
+        list_ids = settings["list_ids"]
+    else:
+        # the run's upper bound becomes the next high-water mark; anything modified after it
+        # is picked up by the next incremental run
+        run_started = datetime.now(timezone.utc)
+        state = read_harvest_state() if incremental else None
+        if incremental and not state:
+            print("🟡 No high-water mark found; running a full harvest instead")
+            incremental = False
+        list_ids = incremental and id_listing_due(state, run_started, id_listing_days)
+        settings.update({
+            "pagination": pagination,
+            "key_ranges": key_ranges,
+            "rows": rows,
+            "incremental": incremental,
+            "run_started": run_started.strftime(solr_date_format),
+            "previous_state": state,
+            "list_ids": list_ids
+        })
+    page_folder = "delta/" if incremental else ""
+
+    writer = None
+    if output_mode == "multipart":
+        # objects from a resumed or repaired run get their own names so earlier ones are kept
+        file_prefix = "part" if not (resume or repair) else f"part_{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}"
+        writer = MultipartNDJSONWriter(storage.client, bucket_name, f"Catalog/{run_folder}/{page_folder}".rstrip("/"),
+                                       part_size=part_size, compression=compression, file_prefix=file_prefix,
+                                       on_object_complete=manifest.complete_object, metrics=metrics)
+
+    async def upload_page(page_name, description, package_list):
+        await upload_queue.put((f"{page_folder}download_{page_name}.ndjson", description, package_list, page_name))
+
+    # one pooled keep-alive connection per in-flight request
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency)
+    timeout = aiohttp.ClientTimeout(total=request_timeout)
+    repaired_error_logs = []
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        uploaders = [
+            asyncio.create_task(upload_worker(upload_queue, stats, writer, manifest, on_records))
+            for _ in range(upload_workers)
+        ]
+        key_space = list(enumerate(split_key_space(key_ranges)))
+        modified_filter = None
+        if incremental:
+            modified_filter = f"metadata_modified:{{{state['high_water_mark']} TO {run_started.strftime(solr_date_format)}]"
+
+        # walk every key range, skipping ranges (or the parts of them) a resumed run already has
+        async def harvest_key_space(extra_filter=None):
+            tasks = []
+            for range_index, (lower, upper) in key_space:
+                resume_from = manifest.range_resume_point("keyset", range_index, lower) if resume else None
+                if resume and resume_from is None:
+                    continue
+                tasks.append(harvest_key_range(session, scheduler, stats, range_index, lower, upper, rows,
+                                               upload_page, extra_filter=extra_filter, manifest=manifest,
+                                               resume_from=resume_from, page_folder=page_folder))
+            await asyncio.gather(*tasks)
+
+        if repair:
+            # refetch exactly the pages recorded under errors/
+            async def repair_page(error_key, details):
+                if details.get("mode") == "keyset":
+                    if details["page_prefix"] != "keyset":
+                        print(f"🟡 Skipping {error_key}; id listings are rebuilt by the next incremental run")
+                        return
+                    repaired = await harvest_key_range(
+                        session, scheduler, stats, details["range_index"], details["cursor"], details["upper"],
+                        details["rows"], upload_page, extra_filter=details.get("extra_filter"), manifest=manifest,
+                        resume_from=(details["cursor"], details["inclusive"], details["page_index"]),
+                        page_folder=details.get("page_folder", "")
+                    )
+                else:
+                    repaired = await harvest_page(session, scheduler, upload_queue, stats, details["start"], details["rows"],
+                                                  manifest=manifest, page_folder=details.get("page_folder", ""))
+                if repaired:
+                    repaired_error_logs.append(error_key)
+
+            error_logs = await asyncio.to_thread(list_error_logs)
+            print(f"🔧 Repairing {len(error_logs)} failed pages")
+            await asyncio.gather(*[repair_page(error_key, details) for error_key, details in error_logs])
+
+        elif incremental:
+            # only datasets modified since the last successful run, walked by id cursor
+            print(f"Harvesting datasets with {modified_filter}")
+            await harvest_key_space(extra_filter=modified_filter)
+
+            # every few days list all ids so deletions show up without a full download
+            if list_ids:
+                id_ranges = [[] for _ in key_space]
+
+                async def collect_ids(range_index, page_name, description, package_list):
+                    id_ranges[range_index].extend(package["id"] for package in package_list)
+
+                await asyncio.gather(*[
+                    harvest_key_range(session, scheduler, stats, range_index, lower, upper, rows,
+                                      functools.partial(collect_ids, range_index),
+                                      page_prefix="ids", fields="id")
+                    for range_index, (lower, upper) in key_space
+                ])
+                # a listing with holes would look like mass deletions downstream, so only keep a complete one
+                if stats.pages_failed == 0:
+                    id_files = [
+                        (f"Catalog/{run_folder}/ids/ids_{range_index:02d}.txt", "\n".join(ids))
+                        for range_index, ids in enumerate(id_ranges)
+                    ]
+                    try:
+                        await asyncio.to_thread(storage.put_many, id_files, upload_workers)
+                        print(f"✅ Success: id listing written in {len(id_files)} files")
+                    except Exception as e:
+                        stats.uploads_failed += 1
+                        list_ids = False
+                        print(f"❌ Error saving the id listing: {e}")
+                else:
+                    list_ids = False
+                    print("🟡 Id listing incomplete; not saving it")
+
+            # describe the delta so the analysis can tell it apart from a full snapshot
+            delta_details = {
+                "since": state["high_water_mark"],
+                "until": run_started.strftime(solr_date_format),
+                "previous_run": state.get("last_run"),
+                "id_listing": list_ids
+            }
+            await asyncio.to_thread(storage.put, f"Catalog/{run_folder}/delta/delta.json", json.dumps(delta_details, indent=4))
+
+        elif pagination == "keyset":
+            # no end_limit: each range stops when the catalog runs out of ids in it
+            await harvest_key_space()
+        else:
+            await asyncio.gather(*[
+                harvest_page(session, scheduler, upload_queue, stats, page_start, rows, manifest=manifest)
+                for page_start in range(start, end_limit, rows)
+                if not (resume and manifest.is_done(f"{page_start:06d}_{page_start+rows:06d}"))
+            ])
+
+        for _ in uploaders:
+            await upload_queue.put(None)
+        await asyncio.gather(*uploaders)
+
+    if writer is not None:
+        try:
+            await asyncio.to_thread(writer.close)
+        except Exception as e:
+            stats.uploads_failed += 1
+            print(f"❌ Error completing multipart upload: {e}")
+            writer.abort()
+
+    await asyncio.to_thread(manifest.save)
+    print(f"📋 Manifest: {manifest.summary()}")
+
+    # repaired pages no longer need their error logs
+    if repair and stats.uploads_failed == 0:
+        for error_key in repaired_error_logs:
+            await asyncio.to_thread(storage.delete, error_key)
+        print(f"🔧 Repaired {len(repaired_error_logs)} pages")
+
+    # only a run without holes may move the high-water mark forward; a repair leaves it alone
+    if repair:
+        print("🔧 Repair run; the high-water mark is unchanged")
+    elif stats.pages_failed == 0 and stats.uploads_failed == 0:
+        write_harvest_state({
+            "high_water_mark": run_started.strftime(solr_date_format),
+            "last_run": timestamp,
+            "last_run_mode": "incremental" if incremental else "full",
+            "last_id_listing": timestamp if (list_ids or not incremental) else state.get("last_id_listing")
+        })
+    else:
+        print("🟡 Run had failed pages; leaving the high-water mark where it was")
+
+    print(f"📈 Scheduler: {scheduler.summary()}")
+
+    # add a complete full snapshot to the content-addressed record archive; with prune only
+    # the packed copy is kept
+    if pack and incremental:
+        print("🟡 Incremental runs hold a delta, not a snapshot; not packing")
+    elif pack and stats.pages_failed == 0 and stats.uploads_failed == 0:
+        try:
+            with metrics.timer("pack"):
+                packed = await asyncio.to_thread(pack_snapshot, storage, timestamp, prune)
+            metrics.set_gauge("new_record_versions", packed["new_versions"])
+            print(f"📦 Packed {packed['records']} records, {packed['new_versions']} new versions in {packed['chunks']} chunks")
+        except Exception as e:
+            print(f"❌ Error packing the snapshot: {e}")
+    elif pack:
+        print("🟡 Run had failed pages; not packing it (repair it, then run record_archive.py pack)")
+
+    # the run's metrics sit next to its output; resumed and repaired runs get their own copy
+    metrics.add_histogram("fetch_seconds", scheduler.histogram)
+    for name in ("pages_fetched", "pages_uploaded", "pages_failed", "uploads_failed", "records"):
+        metrics.set_gauge(name, getattr(stats, name))
+    metrics.set_gauge("peak_concurrency", int(scheduler.peak_limit))
+    metrics.set_gauge("throttled_responses", scheduler.throttled)
+    metrics_prefix = f"Catalog/{run_folder}"
+    if resume or repair:
+        metrics_prefix += f"/reruns/{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}"
+    try:
+        metrics_key = await asyncio.to_thread(metrics.write_to_storage, storage, metrics_prefix, prometheus)
+        print(f"📊 Run metrics saved to {metrics_key}")
+    except Exception as e:
+        print(f"❌ Failed to save run metrics: {e}")
+    return stats
+
+# %%
+# run the harvest
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Harvest the catalog.data.gov package_search API concurrently.")
+    parser.add_argument("--concurrency", type=int, default=concurrency, help="maximum number of requests in flight")
+    parser.add_argument("--initial-concurrency", type=int, default=initial_concurrency, help="requests in flight before the scheduler adapts")
+    parser.add_argument("--upload-workers", type=int, default=upload_workers, help="number of concurrent S3 uploads")
+    parser.add_argument("--pagination", choices=["offset", "keyset"], default=pagination, help="page with start= offsets or an id cursor")
+    parser.add_argument("--key-ranges", type=int, default=key_ranges, help="number of id ranges walked in parallel in keyset mode")
+    parser.add_argument("--incremental", action="store_true", help="only fetch datasets modified since the last successful run")
+    parser.add_argument("--id-listing-days", type=int, default=id_listing_days, help="days between full id listings in incremental mode")
+    parser.add_argument("--output", choices=["pages", "multipart"], default=output_mode, help="one object per page or a few large multipart objects")
+    parser.add_argument("--part-size-mb", type=int, default=part_size // (1024 * 1024), help="multipart part size in MiB (minimum 5)")
+    parser.add_argument("--compression", choices=["gzip", "zstd"], default=compression, help="compress multipart output")
+    parser.add_argument("--resume", metavar="TIMESTAMP", help="continue an interrupted run, fetching only pages its manifest lacks")
+    parser.add_argument("--repair", metavar="TIMESTAMP", help="refetch the pages recorded in a run's errors/ folder")
+    parser.add_argument("--manifest-dir", help="keep the run manifest in this local folder instead of S3")
+    parser.add_argument("--prometheus", action="store_true", help="also save the run metrics in the Prometheus text format")
+    parser.add_argument("--pack", action="store_true", help="add the snapshot to the content-addressed record archive")
+    parser.add_argument("--prune", action="store_true", help="with --pack, delete the full ndjson copy once it's packed")
+    args = parser.parse_args()
+
+    # resumed and repaired runs write into the folder of the run they continue
+    if args.resume or args.repair:
+        timestamp = args.resume or args.repair
+        run_folder = os.path.join(output_base, timestamp)
+
+    stats = asyncio.run(harvest(
+        concurrency=args.concurrency,
+        initial_concurrency=args.initial_concurrency,
+        upload_workers=args.upload_workers,
+        pagination=args.pagination,
+        key_ranges=args.key_ranges,
+        incremental=args.incremental,
+        id_listing_days=args.id_listing_days,
+        output_mode=args.output,
+        part_size=args.part_size_mb * 1024 * 1024,
+        compression=args.compression,
+        resume=bool(args.resume),
+        repair=bool(args.repair),
+        manifest_dir=args.manifest_dir,
+        prometheus=args.prometheus,
+        pack=args.pack,
+        prune=args.prune
+    ))
+
+    # done
+    print(f"✅ Completed: {stats.summary()}")
@@ -5,31 +5,21 @@ import time
 import requests
 from datetime import datetime
 import json
-import boto3
 from requests.exceptions import RequestException
 import dask
-import boto3
-import os
+import sys
+
+# every script folder on the import path (see script_paths.py one folder up)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import script_paths  # noqa: F401
+
+from catalog_storage import get_storage
+from request_scheduler import AdaptiveScheduler, parse_retry_after, throttle_statuses
 
-# Connecting to AWS S3
-# ADD THE FOLLOWING CREDENTIALS TO YOUR .ENV FILE
-'''
-You can create an access key here: https://us-east-1.console.aws.amazon.com/iam/home?region=us-east-1#/security_credentials?section=IAM_credentials
-Or message Ben about it.
-'''
-aws_access_key = os.environ["AWS_ACCESS_KEY_ID"]
-aws_secret_key = os.environ["AWS_SECRET_ACCESS_KEY"]
-aws_region = os.environ["AWS_REGION"]
-
-# Initialize Boto3 client using environment variables
-s3 = boto3.client(
-    "s3",
-    aws_access_key_id=aws_access_key,
-    aws_secret_access_key=aws_secret_key,
-    region_name=aws_region
-)
-
-bucket_name = "govex-us-data-archive"
+# the archive lives in S3 unless CATALOG_STORAGE points somewhere else (see catalog_storage.py);
+# the client is only created when the first object is written
+storage = get_storage()
+bucket_name = storage.bucket
 
 # %%
 # defining parameters
@@ -39,7 +29,10 @@ end_limit = 306000
 num_iterations = end_limit // rows
 
 max_retries = 4
-retry_delay = 2  # Wait time in seconds between retries
+
+# dask runs the tasks on a thread pool; the shared scheduler decides how many may be in
+# flight and how long to back off, instead of a constant retry delay
+scheduler = AdaptiveScheduler(initial_concurrency=4, max_concurrency=16)
 
 # output folder
 output_base = "data_gov_catalog"
@@ -47,14 +40,28 @@ output_base = "data_gov_catalog"
 timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
 run_folder = os.path.join(output_base, timestamp)
 
+# CATALOG_API_URL points the harvest at another CKAN instance, e.g. the mock server in scripts/benchmark
+catalog_api = os.environ.get("CATALOG_API_URL", "https://catalog.data.gov/api/3/action")
+
 # Function to fetch and upload data (with retries)
 @dask.delayed
-def fetch_and_upload_data(start, rows, max_retries, retry_delay):
-    base_url = f"https://catalog.data.gov/api/3/action/package_search?start={start}&rows={rows}"
+def fetch_and_upload_data(start, rows, max_retries):
+    base_url = f"{catalog_api}/package_search?start={start}&rows={rows}"
     success = False
     for attempt in range(max_retries):
+        retry_after = None
         try:
-            response = requests.get(base_url, timeout=30)
+            with scheduler.request_slot():
+                request_start = time.monotonic()
+                response = requests.get(base_url, timeout=30)
+                latency = time.monotonic() - request_start
+            if response.status_code in throttle_statuses:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                scheduler.on_throttle(retry_after)
+            elif response.ok:
+                scheduler.on_success(latency)
+            else:
+                scheduler.on_error(latency)
             response.raise_for_status()  # Check for HTTP errors
 
             # Parse JSON response
@@ -64,11 +71,7 @@ def fetch_and_upload_data(start, rows, max_retries, retry_delay):
             file_name = f'{run_folder}/download_{start:06d}_{start+rows:06d}.json'
 
             # Upload to S3 (Success)
-            s3.put_object(
-                Body=json.dumps(package_list),
-                Bucket=bucket_name,
-                Key=f"Catalog/{file_name}"
-            )
+            storage.put(f"Catalog/{file_name}", json.dumps(package_list))
 
             print(f"✅ Success: Rows {start} - {start+rows}")
             success = True
@@ -76,8 +79,11 @@ def fetch_and_upload_data(start, rows, max_retries, retry_delay):
 
         except Exception as e:
             print(f"⚠️ Attempt {attempt+1} failed: {e}")
+            if getattr(e, "response", None) is None:
+                scheduler.on_error()
             if attempt < max_retries - 1:
-                print(f"Retrying in {retry_delay} seconds...")
+                retry_delay = scheduler.retry_delay(attempt, retry_after)
+                print(f"Retrying in {retry_delay:.1f} seconds...")
                 time.sleep(retry_delay)
             else:
                 print("❌ Max retries reached. Logging error.")
@@ -93,17 +99,14 @@ def fetch_and_upload_data(start, rows, max_retries, retry_delay):
                 error_file = f"{run_folder}/errors/error_{start:06d}_{start+rows:06d}.json"
 
                 # Upload error log to S3
-                s3.put_object(
-                    Body=json.dumps(error_details, indent=4),
-                    Bucket=bucket_name,
-                    Key=f"Catalog/{error_file}"
-                )
+                storage.put(f"Catalog/{error_file}", json.dumps(error_details, indent=4))
                 print(f"🚨 Error log saved to S3: {error_file}")
 
                 return False  # Return failure flag
 
 # Prepare a list of tasks for Dask
-tasks = [fetch_and_upload_data(start + i * rows, rows, max_retries, retry_delay)
+tasks = [fetch_and_upload_data(start + i * rows, rows, max_retries)
          for i in range(num_iterations)]
 
-dask.compute(tasks)
\ No newline at end of file
+dask.compute(tasks)
+print(f"📈 Scheduler: {scheduler.summary()}")
\ No newline at end of file
@@ -1,32 +1,26 @@
 # %%
-import boto3
 from datetime import datetime, timezone
 import json
 import pandas as pd
 import os
 import requests
 from requests.exceptions import RequestException
+import sys
 import time
 
-# Connecting to AWS S3
-# ADD THE FOLLOWING CREDENTIALS TO YOUR .ENV FILE
-'''
-You can create an access key here: https://us-east-1.console.aws.amazon.com/iam/home?region=us-east-1#/security_credentials?section=IAM_credentials
-Or message Ben about it.
-'''
-aws_access_key = os.environ["AWS_ACCESS_KEY_ID"]
-aws_secret_key = os.environ["AWS_SECRET_ACCESS_KEY"]
-aws_region = os.environ["AWS_REGION"]
-
-# Initialize Boto3 client using environment variables
-s3 = boto3.client(
-    "s3",
-    aws_access_key_id=aws_access_key,
-    aws_secret_access_key=aws_secret_key,
-    region_name=aws_region
-)
-
-bucket_name = "govex-us-data-archive"
+# every script folder on the import path (see script_paths.py one folder up)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import script_paths  # noqa: F401
+
+from catalog_storage import get_storage
+from ndjson_multipart import MultipartNDJSONWriter
+from request_scheduler import AdaptiveScheduler, parse_retry_after, throttle_statuses
+from run_metrics import RunMetrics
+
+# the archive lives in S3 unless CATALOG_STORAGE points somewhere else (see catalog_storage.py);
+# the client is only created when the first object is written
+storage = get_storage()
+bucket_name = storage.bucket
 
 # %%
 # defining parameters
@@ -36,6 +30,9 @@ end_limit = 310000  # Maximum number of rows to fetch
 num_iterations = end_limit // rows  # Number of iterations
 request_timeout = 60 # Timeout in seconds
 max_retries = 5     # Maximum number of retries
+output_mode = "pages"  # "pages" writes one object per page; "multipart" streams into a few large objects
+part_size = 16 * 1024 * 1024  # Bytes per S3 multipart part (multipart output only)
+compression = None  # None, "gzip" or "zstd" (multipart output only; the analysis scripts read uncompressed ndjson)
 
 # output folder
 output_base = "data_gov_catalog_ndjson"
@@ -43,6 +40,9 @@ output_base = "data_gov_catalog_ndjson"
 timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
 run_folder = os.path.join(output_base, timestamp)
 
+# CATALOG_API_URL points the harvest at another CKAN instance, e.g. the mock server in scripts/benchmark
+catalog_api = os.environ.get("CATALOG_API_URL", "https://catalog.data.gov/api/3/action")
+
 # %% 
 # Serial Implementation
 import time
@@ -50,6 +50,20 @@ import time
 all_start = time.time()
 results = []
 
+# one request at a time, but Retry-After pauses, jittered backoff and latencies come from the shared scheduler
+scheduler = AdaptiveScheduler(initial_concurrency=1, max_concurrency=1)
+
+# fetch, serialize and upload timings, request counts and bytes; saved as run_metrics.json
+metrics = RunMetrics(job="harvest", run=timestamp)
+
+# with multipart output, records are streamed into a few large objects instead of one object per page
+writer = None
+if output_mode == "multipart":
+    writer = MultipartNDJSONWriter(storage.client, bucket_name, f"Catalog/{run_folder}", part_size=part_size,
+                                   compression=compression, metrics=metrics)
+pages_written = 0
+records_written = 0
+
 # it's a function because it can happen in several places
 def log_error_to_s3(url, error, start, rows):
     error_details = {
@@ -61,11 +75,7 @@ def log_error_to_s3(url, error, start, rows):
     }
     error_file = f"{run_folder}/errors/error_{start:06d}_{start+rows:06d}.json"
     try:
-        s3.put_object(
-            Body=json.dumps(error_details, indent=4),
-            Bucket=bucket_name,
-            Key=f"Catalog/{error_file}"
-        )
+        storage.put(f"Catalog/{error_file}", json.dumps(error_details, indent=4))
         print(f"🚨 Error log saved to S3: {error_file}")
     except Exception as e:
         print(f"❌ Failed to log error to S3: {e}")
@@ -73,14 +83,27 @@ def log_error_to_s3(url, error, start, rows):
 
 while start < end_limit:
     start_time = time.time()
-    fetch_url = f"https://catalog.data.gov/api/3/action/package_search?start={start}&rows={rows}"
+    fetch_url = f"{catalog_api}/package_search?start={start}&rows={rows}"
     print(f"Fetching: {fetch_url}")
 
     # Retry logic
     success = False
     for attempt in range(max_retries):
+        retry_after = None
         try:
-            response = requests.get(fetch_url, timeout=request_timeout)
+            with scheduler.request_slot():
+                request_start = time.monotonic()
+                response = requests.get(fetch_url, timeout=request_timeout)
+                latency = time.monotonic() - request_start
+            metrics.increment("requests_total", status=response.status_code)
+            metrics.increment("response_bytes_total", len(response.content))
+            if response.status_code in throttle_statuses:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                scheduler.on_throttle(retry_after)
+            elif response.ok:
+                scheduler.on_success(latency)
+            else:
+                scheduler.on_error(latency)
             response.raise_for_status()
             server_response = response.json()
             total_packages = server_response.get('result', {}).get('count', 0)
@@ -90,9 +113,13 @@ while start < end_limit:
 
         except RequestException as e:
             print(f"⚠️ Attempt {attempt+1} failed: {e}")
+            metrics.increment("request_errors_total", error=type(e).__name__)
+            if e.response is None:
+                scheduler.on_error()  # connection errors and timeouts never got a response
             if attempt < max_retries - 1:
-                retry_delay = 2 ** attempt  # Exponential backoff
-                print(f"Retrying in {retry_delay} seconds...")
+                metrics.increment("retries_total")
+                retry_delay = scheduler.retry_delay(attempt, retry_after)  # Retry-After or exponential backoff
+                print(f"Retrying in {retry_delay:.1f} seconds...")
                 time.sleep(retry_delay)
             else:
                 log_error_to_s3(fetch_url, e, start, rows)
@@ -102,6 +129,7 @@ while start < end_limit:
         except json.JSONDecodeError as e:
             print(f"❌ Error parsing JSON: {e}")
             if attempt < max_retries - 1:
+                metrics.increment("retries_total")
                 print("Retrying...")
             else:
                 log_error_to_s3(fetch_url, e, start, rows)
@@ -111,30 +139,32 @@ while start < end_limit:
     if success:
         if package_list:
             try:
-                valid_lines = []
-                error_lines = []
-
-                for i, data in enumerate(package_list):
-                    json_object = json.dumps(data)
-                    check_length = len(json_object.splitlines())
-                    
-                    # checking for cases where we have invalid newline delimiters
-                    if check_length == 1:
-                        valid_lines.append(json_object)
+                with metrics.timer("serialize"):
+                    if writer:
+                        written, page_bytes, _ = writer.write_records(package_list)
                     else:
-                        # error if we have more than 1 new line breaks in an object
-                        print(f'Error in id = {data["id"]} at line number = {i}')
-                        error_lines.append(json_object)
-
-                # creating an ndjson object
-                clean_ndjson_object = "\n".join(valid_lines)
-                file_name = f'{run_folder}/download_{start:06d}_{start+rows:06d}.ndjson'
-
-                s3.put_object(
-                    Body=clean_ndjson_object,
-                    Bucket=bucket_name,
-                    Key=f"Catalog/{file_name}"
-                )
+                        valid_lines = []
+
+                        for i, data in enumerate(package_list):
+                            json_object = json.dumps(data)
+                            check_length = len(json_object.splitlines())
+
+                            # checking for cases where we have invalid newline delimiters
+                            if check_length == 1:
+                                valid_lines.append(json_object)
+                            else:
+                                # error if we have more than 1 new line breaks in an object
+                                print(f'Error in id = {data["id"]} at line number = {i}')
+
+                        # creating an ndjson object
+                        clean_ndjson_object = "\n".join(valid_lines)
+                        file_name = f'{run_folder}/download_{start:06d}_{start+rows:06d}.ndjson'
+                        storage.put(f"Catalog/{file_name}", clean_ndjson_object)
+                        written, page_bytes = len(valid_lines), len(clean_ndjson_object.encode("utf-8"))
+                        pages_written += 1
+                records_written += written
+                metrics.increment("bytes_written_total", page_bytes)
+                metrics.increment("records_total", len(package_list))
 
                 end_time = time.time()
                 print(f"✅ Success: Rows {start} - {start+rows} of {total_packages} written to AWS: ({end_time - start_time:.2f} seconds)")
@@ -147,7 +177,16 @@ while start < end_limit:
 
 # %%
 # done
-print(f"✅ Completed: {time.time() - start_time:.2f} seconds")
+objects_written = len(writer.close()) if writer else pages_written
+print(f"📈 Scheduler: {scheduler.summary()}")
+
+metrics.add_histogram("fetch_seconds", scheduler.histogram)
+metrics.set_gauge("objects_written", objects_written)
+try:
+    print(f"📊 Run metrics saved to {metrics.write_to_storage(storage, f'Catalog/{run_folder}')}")
+except Exception as e:
+    print(f"❌ Failed to save run metrics: {e}")
+print(f"✅ Completed: {records_written} records in {objects_written} objects, {time.time() - all_start:.2f} seconds")
 
 ## %% 
 ## For details
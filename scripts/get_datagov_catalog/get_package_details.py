@@ -0,0 +1,165 @@
+# %%
+# fetch full package_show records for the datasets a daily diff found added or modified
+# package_search results are enough for the catalog-wide counts, but package_show is the
+# complete record; fetching it for ~300k ids a day is out of the question, fetching it for
+# the day's few thousand changes takes minutes. The ids come from a daily statistics file
+# (see analyze_datagov_catalog/daily_statistics_polars.py) and the records are written next to
+# that day's snapshot, under details/, where the analysis adds them to the parquet snapshot store.
+# requests share the async harvester's scheduler, retries, backoff and error logging.
+
+import argparse
+import asyncio
+from datetime import datetime, timezone
+import glob
+import json
+import os
+import sys
+import time
+from urllib.parse import urlencode
+
+import aiohttp
+
+# every script folder on the import path (see script_paths.py one folder up)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import script_paths  # noqa: F401
+
+import get_datagov_catalog_async as harvester
+from ndjson_multipart import MultipartNDJSONWriter
+from request_scheduler import AdaptiveScheduler
+from run_metrics import RunMetrics
+
+# %%
+# defining parameters
+concurrency = 16        # Maximum number of package_show requests in flight
+initial_concurrency = 4 # Requests in flight at the start; the scheduler adjusts it from there
+batch_size = 500        # Records handed to the writer at a time
+statistics_folder = "../../data/daily_statistics"
+changes = ["added", "modified"]
+
+show_url = f"{harvester.catalog_api}/package_show"
+
+# %%
+# functions
+
+# the newest daily statistics file
+def get_latest_statistics_file(folder: str = statistics_folder) -> str:
+    files = sorted(glob.glob(os.path.join(folder, "*.json")))
+    if not files:
+        raise FileNotFoundError(f"no daily statistics in {folder}")
+    return files[-1]
+
+# the snapshot a statistics file describes and the ids of its changed datasets; newer files
+# keep the changes in an ndjson file next to them instead of listing them inline
+def get_changed_ids(statistics_file: str, changes: list[str] = changes) -> tuple[str, list[str]]:
+    with open(statistics_file, "r") as file:
+        statistics = json.load(file)
+    day = os.path.basename(os.path.normpath(statistics["current_fileset"]))
+    delta_file = (statistics.get("delta_files") or {}).get("datasets")
+    if delta_file:
+        with open(os.path.join(os.path.dirname(statistics_file), delta_file), "r", encoding="utf-8") as file:
+            records = [json.loads(line) for line in file]
+        ids = sorted({record["id"] for record in records if record["change"] in changes})
+    else:
+        ids = sorted({record["id"] for change in changes for record in statistics["deltas"].get(change) or []})
+    return day, ids
+
+# a fixed pool of workers pulls ids from the queue, so no more than `concurrency` requests
+# (and their responses) are ever held at once; the scheduler lowers that limit under pressure
+async def fetch_details(ids: list[str], writer: MultipartNDJSONWriter, metrics: RunMetrics,
+                        concurrency: int = concurrency, initial_concurrency: int = initial_concurrency) -> dict:
+    scheduler = AdaptiveScheduler(initial_concurrency=min(initial_concurrency, concurrency), max_concurrency=concurrency)
+    id_queue = asyncio.Queue()
+    for dataset_id in ids:
+        id_queue.put_nowait(dataset_id)
+    batch = []
+    counts = {"requested": len(ids), "fetched": 0, "failed": 0}
+    write_lock = asyncio.Lock()
+
+    async def write_batch(force: bool = False):
+        nonlocal batch
+        async with write_lock:
+            if batch and (force or len(batch) >= batch_size):
+                records, batch = batch, []
+                with metrics.timer("serialize"):
+                    written, page_bytes, _ = await asyncio.to_thread(writer.write_records, records)
+                metrics.increment("bytes_written_total", page_bytes)
+                metrics.increment("records_total", written)
+
+    async def worker():
+        while True:
+            try:
+                dataset_id = id_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            fetch_url = f"{show_url}?{urlencode({'id': dataset_id})}"
+            result = await harvester.fetch_result(session, scheduler, fetch_url, f"details_{dataset_id}",
+                                                  {"mode": "details", "id": dataset_id})
+            if result:
+                counts["fetched"] += 1
+                batch.append(result)
+                await write_batch()
+            else:
+                counts["failed"] += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency)
+    timeout = aiohttp.ClientTimeout(total=harvester.request_timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        await asyncio.gather(*[worker() for _ in range(min(concurrency, len(ids)) or 1)])
+    await write_batch(force=True)
+
+    print(f"📈 Scheduler: {scheduler.summary()}")
+    metrics.add_histogram("fetch_seconds", scheduler.histogram)
+    return counts
+
+# fetch the details for one daily statistics file into Catalog/<snapshot>/details/
+async def get_package_details(statistics_file: str, concurrency: int = concurrency,
+                              initial_concurrency: int = initial_concurrency, prometheus: bool = False) -> dict:
+    day, ids = get_changed_ids(statistics_file)
+    details_prefix = f"Catalog/{harvester.output_base}/{day}/details"
+    # errors are logged under details/errors/ so the harvester's --repair never sees them
+    harvester.run_folder = f"{harvester.output_base}/{day}/details"
+    harvester.metrics = metrics = RunMetrics(job="details", run=day)
+    print(f"Fetching details for {len(ids)} changed datasets in {day}")
+
+    started = time.time()
+    writer = MultipartNDJSONWriter(harvester.storage.client, harvester.bucket_name, details_prefix,
+                                   file_prefix="details", metrics=metrics)
+    try:
+        counts = await fetch_details(ids, writer, metrics, concurrency, initial_concurrency)
+        await asyncio.to_thread(writer.close)
+    except BaseException:
+        writer.abort()
+        raise
+
+    details = {
+        "source": os.path.basename(statistics_file),
+        "fetched_at": datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S"),
+        "elapsed_seconds": round(time.time() - started, 3),
+        **counts
+    }
+    harvester.storage.put(f"{details_prefix}/details.json", json.dumps(details, indent=4))
+    for name in ("requested", "fetched", "failed"):
+        metrics.set_gauge(f"details_{name}", counts[name])
+    metrics.write_to_storage(harvester.storage, details_prefix, prometheus)
+    return details
+
+# %%
+# run the detail fetch
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fetch package_show records for the datasets a daily diff found added or modified.")
+    parser.add_argument("--statistics", default=None, help="daily statistics file (default: the newest one)")
+    parser.add_argument("--concurrency", type=int, default=concurrency, help="maximum number of requests in flight")
+    parser.add_argument("--initial-concurrency", type=int, default=initial_concurrency, help="requests in flight before the scheduler adapts")
+    parser.add_argument("--prometheus", action="store_true", help="also save the run metrics in the Prometheus text format")
+    args = parser.parse_args()
+
+    details = asyncio.run(get_package_details(
+        args.statistics or get_latest_statistics_file(),
+        concurrency=args.concurrency,
+        initial_concurrency=args.initial_concurrency,
+        prometheus=args.prometheus
+    ))
+    print(f"✅ Completed: {details['fetched']} of {details['requested']} records fetched, "
+          f"{details['failed']} failed in {details['elapsed_seconds']:.2f} seconds")
+    if details["failed"]:
+        sys.exit(1)
@@ -0,0 +1,117 @@
+# checkpoint manifest for a harvest run
+# records the status, record count, byte count and sha256 of every page so an interrupted
+# run can be resumed and failed pages can be refetched. The manifest is saved to S3 (a single
+# put_object, which is atomic) or to local disk (temp file + rename), never half written.
+
+from datetime import datetime, timezone
+import json
+import os
+import threading
+import time
+
+manifest_file_name = "manifest.json"
+
+# page statuses: fetched -> buffered (multipart only) -> done, or failed
+done_status = "done"
+
+
+class HarvestManifest:
+    def __init__(self, run_folder: str, s3=None, bucket: str = None, key: str = None,
+                 local_path: str = None, save_interval: float = 30.0):
+        self.run_folder = run_folder
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.local_path = local_path
+        self.save_interval = save_interval
+
+        self.data = {"run_folder": run_folder, "settings": {}, "pages": {}, "ranges": {}}
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+
+    # read an existing manifest, or start an empty one if there is none yet
+    def load(self) -> "HarvestManifest":
+        body = None
+        if self.local_path:
+            if os.path.exists(self.local_path):
+                with open(self.local_path, "r") as file:
+                    body = file.read()
+        else:
+            try:
+                body = self.s3.get_object(Bucket=self.bucket, Key=self.key)["Body"].read()
+            except self.s3.exceptions.NoSuchKey:
+                pass
+        if body:
+            self.data = json.loads(body)
+        return self
+
+    def save(self):
+        with self._lock:
+            self.data["updated"] = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+            body = json.dumps(self.data, indent=2)
+            self._last_save = time.monotonic()
+        if self.local_path:
+            os.makedirs(os.path.dirname(self.local_path) or ".", exist_ok=True)
+            temp_path = f"{self.local_path}.tmp"
+            with open(temp_path, "w") as file:
+                file.write(body)
+            os.replace(temp_path, self.local_path)
+        else:
+            self.s3.put_object(Body=body, Bucket=self.bucket, Key=self.key)
+
+    # save at most every save_interval seconds while the run is going
+    def checkpoint(self):
+        if time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    @property
+    def settings(self) -> dict:
+        return self.data["settings"]
+
+    def page(self, page_name: str) -> dict:
+        return self.data["pages"].get(page_name)
+
+    def is_done(self, page_name: str) -> bool:
+        page = self.page(page_name)
+        return page is not None and page["status"] == done_status
+
+    # merge new details into a page's entry
+    def update_page(self, page_name: str, status: str, **details):
+        with self._lock:
+            page = self.data["pages"].setdefault(page_name, {})
+            page.update(details)
+            page["status"] = status
+
+    # mark the pages that landed in a completed multipart object as done
+    def complete_object(self, object_key: str, page_names: list[str]):
+        for page_name in page_names:
+            self.update_page(page_name, done_status, object=object_key)
+
+    def mark_range_exhausted(self, range_name: str):
+        with self._lock:
+            self.data["ranges"][range_name] = {"exhausted": True}
+
+    # keyset pages of one range ordered by page index
+    def range_pages(self, page_prefix: str, range_index: int) -> list[dict]:
+        prefix = f"{page_prefix}_{range_index:02d}_"
+        pages = [p for name, p in self.data["pages"].items() if name.startswith(prefix)]
+        return sorted(pages, key=lambda p: p["page_index"])
+
+    # where a keyset range should pick up again: (cursor, inclusive, page_index), or None if
+    # every page of the range is done and the range was walked to its end
+    def range_resume_point(self, page_prefix: str, range_index: int, lower: str):
+        pages = self.range_pages(page_prefix, range_index)
+        for page in pages:
+            if page["status"] != done_status:
+                return page["cursor"], page["inclusive"], page["page_index"]
+        if self.data["ranges"].get(f"{page_prefix}_{range_index:02d}", {}).get("exhausted"):
+            return None
+        if pages:
+            return pages[-1]["last_id"], False, pages[-1]["page_index"] + 1
+        return lower, True, 0
+
+    def summary(self) -> str:
+        statuses = {}
+        for page in self.data["pages"].values():
+            statuses[page["status"]] = statuses.get(page["status"], 0) + 1
+        return ", ".join(f"{count} {status}" for status, count in sorted(statuses.items())) or "no pages"
@@ -0,0 +1,180 @@
+# streams catalog records into a few large ndjson objects using S3 multipart uploads
+# records are serialized once, checked for stray line breaks on the serialized bytes,
+# optionally compressed and flushed to S3 whenever a part's worth of bytes is buffered
+# NOTE: polars scan_ndjson can't read compressed files; keep compression off for
+#  snapshots the analysis scripts scan directly
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import threading
+import zlib
+
+import zstandard
+
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 rejects smaller parts except for the last one
+
+# compressors expose compress(data) -> bytes and flush() -> bytes like zlib's
+def get_compressor(compression: str = None):
+    if compression is None or compression == "none":
+        return None
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    raise ValueError(f"unknown compression: {compression}")
+
+def get_extension(compression: str = None) -> str:
+    return {"gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}.get(compression, ".ndjson")
+
+
+class MultipartNDJSONWriter:
+    # on_object_complete(key, page_names) is called once an object and its pages are durable
+    def __init__(self, s3, bucket: str, key_prefix: str, part_size: int = 16 * 1024 * 1024,
+                 object_size: int = 512 * 1024 * 1024, compression: str = None, upload_threads: int = 4,
+                 file_prefix: str = "part", on_object_complete=None, metrics=None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key_prefix = key_prefix
+        self.file_prefix = file_prefix
+        self.on_object_complete = on_object_complete
+        self.metrics = metrics  # optional run_metrics.RunMetrics timing each part upload
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.object_size = object_size  # serialized (uncompressed) bytes before rotating to a new object
+        self.compression = compression
+        self.uploads = ThreadPoolExecutor(max_workers=upload_threads)
+        # parts waiting for or in an upload; the writer blocks once this many are held in memory,
+        # so a slow store slows the harvest down instead of piling up finished parts
+        self.max_pending_parts = upload_threads * 2
+        self._pending_parts = threading.BoundedSemaphore(self.max_pending_parts)
+        self.lock = threading.Lock()
+
+        self.object_index = 0
+        self.records_written = 0
+        self.records_rejected = 0
+        self.bytes_written = 0
+        self.objects = []  # keys of completed objects
+
+        self._upload_id = None
+        self._key = None
+        self._parts = []
+        self._pages = []
+        self._buffer = bytearray()
+        self._compressor = None
+        self._object_bytes = 0
+
+    # serialize and buffer a page of records; returns (records accepted, bytes, sha256 of the page's lines)
+    def write_records(self, records: list, page_name: str = None) -> tuple[int, int, str]:
+        accepted = 0
+        page_bytes = 0
+        checksum = hashlib.sha256()
+        with self.lock:
+            if self._upload_id is None:
+                self._start_object()
+            # the whole page lands in the object that is open now, even if it rotates after
+            if page_name is not None:
+                self._pages.append(page_name)
+            for i, record in enumerate(records):
+                line = json.dumps(record).encode("utf-8")
+                # checking for cases where we have invalid newline delimiters
+                if b"\n" in line or b"\r" in line:
+                    print(f'Error in id = {record.get("id")} at line number = {i}')
+                    self.records_rejected += 1
+                    continue
+                line += b"\n"
+                checksum.update(line)
+                page_bytes += len(line)
+                self._append(line)
+                accepted += 1
+            self.records_written += accepted
+            if self._object_bytes >= self.object_size:
+                self._complete_object()
+        return accepted, page_bytes, checksum.hexdigest()
+
+    # finish the current object and wait for every part upload
+    def close(self) -> list:
+        with self.lock:
+            self._complete_object()
+        self.uploads.shutdown(wait=True)
+        return self.objects
+
+    # abandon the open multipart upload so S3 doesn't keep the orphaned parts
+    def abort(self):
+        with self.lock:
+            if self._upload_id:
+                self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self._key, UploadId=self._upload_id)
+                self._upload_id = None
+        self.uploads.shutdown(wait=False, cancel_futures=True)
+
+    def _append(self, line: bytes):
+        if self._upload_id is None:
+            self._start_object()
+        data = self._compressor.compress(line) if self._compressor else line
+        self._buffer += data
+        self._object_bytes += len(line)
+        self.bytes_written += len(line)
+        if len(self._buffer) >= self.part_size:
+            self._upload_buffer()
+
+    def _start_object(self):
+        self._key = f"{self.key_prefix}/{self.file_prefix}_{self.object_index:05d}{get_extension(self.compression)}"
+        self._compressor = get_compressor(self.compression)
+        response = self.s3.create_multipart_upload(Bucket=self.bucket, Key=self._key)
+        self._upload_id = response["UploadId"]
+        self._parts = []
+        self._pages = []
+        self._object_bytes = 0
+
+    # hand the buffered bytes to the upload pool as the next part
+    def _upload_buffer(self):
+        part_number = len(self._parts) + 1
+        body = bytes(self._buffer)
+        self._buffer.clear()
+        self._pending_parts.acquire()
+        future = self.uploads.submit(
+            self._upload_part,
+            Body=body,
+            Bucket=self.bucket,
+            Key=self._key,
+            UploadId=self._upload_id,
+            PartNumber=part_number
+        )
+        self._parts.append((part_number, future))
+
+    def _upload_part(self, **kwargs):
+        try:
+            if self.metrics is None:
+                return self.s3.upload_part(**kwargs)
+            with self.metrics.timer("upload", kind="part"):
+                return self.s3.upload_part(**kwargs)
+        finally:
+            self._pending_parts.release()
+
+    def _complete_object(self):
+        if self._upload_id is None:
+            return
+        # S3 can't complete an upload without parts; drop the empty object
+        if self._object_bytes == 0:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self._key, UploadId=self._upload_id)
+            self._upload_id = None
+            if self.on_object_complete is not None:
+                self.on_object_complete(None, self._pages)
+            return
+        if self._compressor:
+            self._buffer += self._compressor.flush()
+        if self._buffer:
+            self._upload_buffer()
+
+        parts = [{"PartNumber": number, "ETag": future.result()["ETag"]} for number, future in self._parts]
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self._key,
+            UploadId=self._upload_id,
+            MultipartUpload={"Parts": parts}
+        )
+        print(f"📦 Completed {self._key} ({len(parts)} parts, {self._object_bytes} bytes)")
+        self.objects.append(self._key)
+        self.object_index += 1
+        self._upload_id = None
+        if self.on_object_complete is not None:
+            self.on_object_complete(self._key, self._pages)
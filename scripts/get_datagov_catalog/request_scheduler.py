@@ -0,0 +1,155 @@
+# adaptive request scheduler shared by the harvesters
+# the number of requests in flight follows AIMD: it grows by about one slot per round of
+# fast, successful responses and is halved on throttling (429/503), errors or responses slower
+# than the latency target. A Retry-After header pauses every caller until it has passed.
+# async harvesters use slot(), threaded ones (dask, serial) use request_slot().
+
+import asyncio
+import contextlib
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import random
+import threading
+import time
+
+from run_metrics import Histogram
+
+throttle_statuses = (429, 503)
+
+# parse a Retry-After header (delta-seconds or an http date) into seconds
+def parse_retry_after(value: str = None) -> float:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+# request latencies in seconds, bucketed for the range package_search responses take
+class LatencyHistogram(Histogram):
+    default_bounds = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def summary(self) -> str:
+        mean = self.total / self.count if self.count else 0.0
+        return f"{self.count} requests, mean {mean:.2f}s, p50 <= {self.quantile(0.5)}s, p95 <= {self.quantile(0.95)}s"
+
+
+class AdaptiveScheduler:
+    def __init__(self, initial_concurrency: int = 4, min_concurrency: int = 1, max_concurrency: int = 16,
+                 latency_target: float = 15.0, decrease_factor: float = 0.5, max_backoff: float = 300.0):
+        self.limit = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.max_backoff = max_backoff
+
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.histogram = LatencyHistogram()
+        self.throttled = 0
+        self.errors = 0
+        self.peak_limit = self.limit
+
+        self._lock = threading.Lock()
+        self._thread_condition = threading.Condition(self._lock)
+        self._async_condition = None
+        self._last_decrease = 0.0
+
+    @property
+    def concurrency(self) -> int:
+        return max(self.min_concurrency, int(self.limit))
+
+    # seconds left on a Retry-After pause
+    def pause_remaining(self) -> float:
+        return max(0.0, self.paused_until - time.monotonic())
+
+    def on_success(self, latency: float):
+        with self._lock:
+            self.histogram.observe(latency)
+            if latency > self.latency_target:
+                self._decrease()
+            else:
+                # additive increase: about one extra slot per window of successful requests
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+                self.peak_limit = max(self.peak_limit, self.limit)
+
+    def on_throttle(self, retry_after: float = None):
+        with self._lock:
+            self.throttled += 1
+            self._decrease()
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def on_error(self, latency: float = None):
+        with self._lock:
+            self.errors += 1
+            if latency is not None:
+                self.histogram.observe(latency)
+            self._decrease()
+
+    # multiplicative decrease, at most once per latency target so one burst of failures
+    # from the same window doesn't collapse the limit to the minimum
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self.latency_target:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_concurrency), self.limit * self.decrease_factor)
+
+    # how long to wait before retrying: the server's Retry-After if it sent one, otherwise
+    # exponential backoff with jitter
+    def retry_delay(self, attempt: int, retry_after: float = None) -> float:
+        if retry_after is not None:
+            return min(self.max_backoff, retry_after)
+        return min(self.max_backoff, 2 ** attempt) * random.uniform(0.75, 1.25)
+
+    def _can_start(self) -> bool:
+        return self.in_flight < self.concurrency and self.pause_remaining() == 0
+
+    # blocking slot for threaded harvesters
+    @contextlib.contextmanager
+    def request_slot(self):
+        with self._thread_condition:
+            while not self._can_start():
+                self._thread_condition.wait(timeout=self.pause_remaining() or 0.1)
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._thread_condition:
+                self.in_flight -= 1
+                self._thread_condition.notify_all()
+
+    # slot for asyncio harvesters; all callers must share one event loop
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        if self._async_condition is None:
+            self._async_condition = asyncio.Condition()
+        async with self._async_condition:
+            while not self._can_start():
+                try:
+                    await asyncio.wait_for(self._async_condition.wait(), timeout=self.pause_remaining() or 0.1)
+                except asyncio.TimeoutError:
+                    pass
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._async_condition:
+                self.in_flight -= 1
+                self._async_condition.notify_all()
+
+    def summary(self) -> str:
+        return (
+            f"concurrency {self.concurrency} (peak {int(self.peak_limit)}), "
+            f"{self.throttled} throttled, {self.errors} errors; latency: {self.histogram.summary()}"
+        )
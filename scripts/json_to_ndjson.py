@@ -1,51 +1,231 @@
 # given an input and output folder, convert all json files
 #  in the input folder to ndson files in the output folder
 # NOTE: ndson cannot have line breaks in the JSON strings!
+# files are converted in parallel across processes; each json array is split into its
+# elements one at a time (so large page files are never fully materialized), each element is
+# decoded with orjson, and every line is checked to read back as the same record before it's
+# written. The same tree can also be written straight to the parquet snapshot store.
 
 # %%
 # imports and initialization
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import os
-import json
+import re
+
+import orjson
 
 source_dir = '../data/data_gov_catalog'
 target_dir = '../data/data_gov_catalog_ndjson'
+parquet_dir = '../data/data_gov_catalog_parquet'
+
+chunk_size = 1024 * 1024               # bytes read at a time by the incremental parser
+max_element_size = 64 * 1024 * 1024    # an element that grows past this is treated as malformed
+parquet_batch_size = 10000             # records per intermediate parquet part
+
+# the bytes that matter for finding where an element ends, outside and inside strings
+value_tokens = re.compile(rb'[][{}",]')
+string_tokens = re.compile(rb'["\\]')
 
 # %%
-# converts a tree of json files to a tree of ndson files
-def convert_json_to_ndson(source_dir, target_dir):
+# yield the elements of a top-level json array read from a binary file, without reading the
+# whole file; each element's end is found by tracking brackets and strings, then orjson
+# decodes just that element. A malformed element fails right away, and one that never ends
+# fails once it's larger than max_element_size instead of reading the rest of the file
+def iter_json_array(file, chunk_size: int = chunk_size, max_element_size: int = max_element_size):
+    buffer = b''
+    eof = False
+
+    # drop everything before start and read the next chunk; returns how far positions moved
+    def fill(start: int) -> int:
+        nonlocal buffer, eof
+        chunk = file.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[start:] + chunk
+        return start
+
+    def skip(pos: int, characters: bytes) -> int:
+        while True:
+            while pos < len(buffer) and buffer[pos] in characters:
+                pos += 1
+            if pos < len(buffer) or eof:
+                return pos
+            pos -= fill(pos)
+
+    # the end of the element starting at pos, continuing a scan that stopped at the buffer
+    # edge; None (with the state to resume from) if the element goes on past the buffer
+    def find_end(scan: int, depth: int, in_string: bool):
+        while True:
+            if in_string:
+                match = string_tokens.search(buffer, scan)
+                if not match:
+                    return None, len(buffer), depth, in_string
+                if match.group() == b'\\':
+                    # the escaped byte may be in the next chunk
+                    if match.end() == len(buffer):
+                        return None, match.start(), depth, in_string
+                    scan = match.end() + 1
+                    continue
+                in_string = False
+                scan = match.end()
+                if depth == 0:
+                    return scan, scan, depth, in_string
+                continue
+            match = value_tokens.search(buffer, scan)
+            if not match:
+                return None, len(buffer), depth, in_string
+            token = match.group()
+            scan = match.end()
+            if token == b'"':
+                in_string = True
+            elif token in (b'[', b'{'):
+                depth += 1
+            elif depth == 0:
+                # a comma or the array's close ends a number, true, false or null
+                return match.start(), scan, depth, in_string
+            elif token != b',':
+                depth -= 1
+                if depth == 0:
+                    return scan, scan, depth, in_string
+
+    pos = skip(0, b' \t\r\n')
+    if buffer[pos:pos + 1] != b'[':
+        raise ValueError("expected a json array")
+    pos += 1
+
+    while True:
+        pos = skip(pos, b' \t\r\n,')
+        if pos >= len(buffer):
+            raise ValueError("unterminated json array")
+        if buffer[pos:pos + 1] == b']':
+            return
+        end, scan, depth, in_string = find_end(pos, 0, False)
+        while end is None:
+            if eof:
+                raise ValueError("unterminated json array")
+            if len(buffer) - pos > max_element_size:
+                raise ValueError(f"json element larger than {max_element_size} bytes")
+            shift = fill(pos)
+            pos -= shift
+            end, scan, depth, in_string = find_end(scan - shift, depth, in_string)
+        yield orjson.loads(buffer[pos:end])
+        pos = end
+
+# converts one json file; each line must read back as the record it was written from, and
+# the output only replaces an earlier copy once it's complete
+def convert_file(source_path: str, out_path: str) -> tuple[int, int]:
+    written = 0
+    rejected = 0
+    temp_path = f"{out_path}.tmp"
+    with open(source_path, 'rb') as f, open(temp_path, 'wb') as out_f:
+        for i, item in enumerate(iter_json_array(f)):
+            try:
+                line = orjson.dumps(item)
+                valid = orjson.loads(line) == item
+            except orjson.JSONEncodeError:
+                valid = False
+            if not valid:
+                print(f"Record doesn't round-trip in {source_path}, item {i}")
+                rejected += 1
+                continue
+            out_f.write(line + b'\n')
+            written += 1
+    os.replace(temp_path, out_path)
+    return written, rejected
+
+# list (source, target) pairs for every json file in the tree
+def list_conversions(source_dir: str, target_dir: str, extension: str) -> list[tuple[str, str]]:
+    conversions = []
     for root, dirs, files in os.walk(source_dir):
+        # error logs are single objects, not pages of records
+        dirs[:] = [d for d in dirs if d != 'errors']
         for filename in files:
             if filename.endswith('.json'):
-                source_path = os.path.join(root, filename)
-                with open(source_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-
                 rel_path = os.path.relpath(root, source_dir)
                 out_dir = os.path.join(target_dir, rel_path)
                 os.makedirs(out_dir, exist_ok=True)
+                out_name = os.path.splitext(filename)[0] + extension
+                conversions.append((os.path.join(root, filename), os.path.join(out_dir, out_name)))
+    return conversions
 
-                out_name = os.path.splitext(filename)[0] + '.ndjson'
-                out_path = os.path.join(out_dir, out_name)
-                with open(out_path, 'w', encoding='utf-8') as out_f:
-                    for item in data:
-                        out_f.write(json.dumps(item) + '\n')
-
-# scan a folder for ndson files and check for improper line breaks
-def check_ndson_for_line_breaks(folder_path):
-    for root, dirs, files in os.walk(folder_path):
-        for file_name in files:
-            if file_name.endswith('.ndson'):
-                file_path = os.path.join(root, file_name)
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    for i, line in enumerate(f, start=1):
-                        try:
-                            json.loads(line.strip())
-                        except json.JSONDecodeError:
-                            print(f"Invalid line break in {file_path}, line {i}")
+# %%
+# converts a tree of json files to a tree of ndson files
+def convert_json_to_ndson(source_dir, target_dir, workers: int = None):
+    conversions = list_conversions(source_dir, target_dir, '.ndjson')
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(convert_file, *zip(*conversions))) if conversions else []
+    written = sum(r[0] for r in results)
+    rejected = sum(r[1] for r in results)
+    print(f"converted {len(results)} files: {written} records written, {rejected} rejected")
+
+# %%
+# parquet output goes through the snapshot store so it matches what the analysis reads
+def get_snapshot_store():
+    import script_paths  # noqa: F401
+    import snapshot_store
+    return snapshot_store
+
+# converts one json file into one or more parquet parts in the snapshot schema
+def convert_file_to_parquet(source_path: str, out_path: str) -> int:
+    import polars as pl
+    snapshot_store = get_snapshot_store()
+
+    written = 0
+    batch = []
+    part = 0
+
+    def flush():
+        nonlocal batch, part
+        frame = pl.from_dicts(batch, schema=snapshot_store.catalog_schema, strict=False)
+        frame.write_parquet(f"{out_path}.{part:04d}.parquet")
+        batch = []
+        part += 1
+
+    with open(source_path, 'rb') as f:
+        for item in iter_json_array(f):
+            batch.append(item)
+            written += 1
+            if len(batch) >= parquet_batch_size:
+                flush()
+    if batch:
+        flush()
+    return written
+
+# converts a tree of json snapshot folders straight to the parquet snapshot store
+def convert_json_to_parquet(source_dir, parquet_dir, workers: int = None):
+    import polars as pl
+    snapshot_store = get_snapshot_store()
+
+    parts_dir = os.path.join(parquet_dir, '_parts')
+    conversions = list_conversions(source_dir, parts_dir, '')
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        written = list(pool.map(convert_file_to_parquet, *zip(*conversions))) if conversions else []
+
+    # one de-duplicated, organization-sorted snapshot per source folder
+    snapshot_folders = sorted({os.path.dirname(out_path) for _, out_path in conversions})
+    for folder in snapshot_folders:
+        parts = os.path.join(folder, '*.parquet')
+        path = snapshot_store.get_snapshot_path(folder, parquet_dir)
+        catalog = snapshot_store.normalize_catalog(pl.scan_parquet(parts))
+        snapshot_store.write_snapshot_frame(catalog, path)
+        for part in os.listdir(folder):
+            os.remove(os.path.join(folder, part))
+        os.rmdir(folder)
+        print(f"wrote {path}")
+    if os.path.isdir(parts_dir) and not os.listdir(parts_dir):
+        os.rmdir(parts_dir)
+    print(f"converted {len(written)} files: {sum(written)} records written")
 
 # %%
 # run the conversion
 if __name__ == '__main__':
-    convert_json_to_ndson(source_dir, target_dir)
-
+    parser = argparse.ArgumentParser(description="Convert the legacy json catalog tree.")
+    parser.add_argument("--format", choices=["ndjson", "parquet"], default="ndjson", help="output format")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
 
+    if args.format == "parquet":
+        convert_json_to_parquet(source_dir, parquet_dir, workers=args.workers)
+    else:
+        convert_json_to_ndson(source_dir, target_dir, workers=args.workers)
@@ -0,0 +1,344 @@
+# %%
+# content-addressed archive of record versions
+# a full nightly snapshot is mostly records that haven't changed since the day before, so this
+# archive stores every record version once:
+#   <prefix>/chunks/<chunk hash>.ndjson.gz   new record versions, packed into large gzip chunks
+#   <prefix>/days/<timestamp>.tsv.gz         one line per dataset, sorted by id:
+#                                            id, record hash, chunk hash, line in the chunk
+#   <prefix>/changes/<timestamp>.tsv.gz      the day before it was packed against, then the
+#                                            lines of the datasets that were added, changed or
+#                                            removed (with an empty hash) that day, sorted by id
+# a record's hash is the blake2b digest of its canonical json (sorted keys, no whitespace), so a
+# day only adds chunks for the versions the previous day didn't have. Any day can be rebuilt
+# as an ndjson file for the analysis scripts, and a dataset's history is a lookup of its id in
+# each day's (sorted) changes, which are a small fraction of the full listing.
+#
+#   python record_archive.py pack 20250212T070249 [--prune]   pack a harvested ndjson snapshot
+#   python record_archive.py restore 20250212T070249 folder/  rebuild it as folder/records.ndjson
+#   python record_archive.py history <dataset id>             the days each version appeared
+
+import argparse
+import bisect
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+import zstandard
+
+from catalog_storage import get_storage
+
+records_prefix = "Catalog/data_gov_catalog_records"
+ndjson_prefix = "Catalog/data_gov_catalog_ndjson"
+chunk_size = 64 * 1024 * 1024  # uncompressed bytes of new record versions per chunk
+chunk_cache_size = 8           # chunks kept in memory while reading
+download_workers = 4           # chunks downloaded at once; each can be tens of MB
+read_size = 8 * 1024 * 1024    # bytes read at a time while packing a snapshot object
+
+
+# canonical bytes and content hash of one record
+def canonical_record(record: dict) -> bytes:
+    return json.dumps(record, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def record_hash(body: bytes) -> str:
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class RecordArchive:
+    # cache_dir keeps downloaded chunks on disk; chunks never change once written
+    def __init__(self, storage, prefix: str = records_prefix, cache_dir: str = None):
+        self.storage = storage
+        self.prefix = prefix
+        self.cache_dir = cache_dir
+        self._chunks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def day_key(self, day: str) -> str:
+        return f"{self.prefix}/days/{day}.tsv.gz"
+
+    def chunk_key(self, chunk: str) -> str:
+        return f"{self.prefix}/chunks/{chunk}.ndjson.gz"
+
+    def changes_key(self, day: str) -> str:
+        return f"{self.prefix}/changes/{day}.tsv.gz"
+
+    def list_days(self) -> list[str]:
+        keys = self.storage.list_keys(f"{self.prefix}/days/")
+        return sorted(os.path.basename(key)[:-len(".tsv.gz")] for key in keys if key.endswith(".tsv.gz"))
+
+    # [(id, hash, chunk, line)] sorted by id
+    def read_day(self, day: str) -> list[tuple[str, str, str, int]]:
+        body = gzip.decompress(self.storage.get(self.day_key(day))).decode("utf-8")
+        rows = []
+        for line in body.splitlines():
+            dataset_id, version, chunk, position = line.split("\t")
+            rows.append((dataset_id, version, chunk, int(position)))
+        return rows
+
+    def write_day(self, day: str, rows: list[tuple[str, str, str, int]]):
+        body = "".join(f"{dataset_id}\t{version}\t{chunk}\t{position}\n" for dataset_id, version, chunk, position in rows)
+        self.storage.put(self.day_key(day), gzip.compress(body.encode("utf-8")))
+
+    # the day the changes were taken against and [(id, hash, chunk, line)] sorted by id;
+    # removed datasets have an empty hash, chunk and line. None for days packed without changes
+    def read_changes(self, day: str) -> tuple[str, list] | None:
+        try:
+            body = gzip.decompress(self.storage.get(self.changes_key(day))).decode("utf-8")
+        except Exception:
+            return None
+        lines = body.splitlines()
+        rows = []
+        for line in lines[1:]:
+            dataset_id, version, chunk, position = line.split("\t")
+            rows.append((dataset_id, version or None, chunk or None, int(position) if position else None))
+        return lines[0], rows
+
+    def write_changes(self, day: str, since: str, rows: list[tuple[str, str, str, int]]):
+        body = f"{since}\n" + "".join(
+            f"{dataset_id}\t{version or ''}\t{chunk or ''}\t{'' if position is None else position}\n"
+            for dataset_id, version, chunk, position in rows
+        )
+        self.storage.put(self.changes_key(day), gzip.compress(body.encode("utf-8")))
+
+    # the lines of a chunk, from memory, the local cache or the archive
+    def read_chunk(self, chunk: str) -> list[bytes]:
+        with self._lock:
+            if chunk in self._chunks:
+                self._chunks.move_to_end(chunk)
+                return self._chunks[chunk]
+
+        cache_path = os.path.join(self.cache_dir, f"{chunk}.ndjson.gz") if self.cache_dir else None
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, "rb") as file:
+                body = file.read()
+        else:
+            body = self.storage.get(self.chunk_key(chunk))
+            if cache_path:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                temp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+                with open(temp_path, "wb") as file:
+                    file.write(body)
+                os.replace(temp_path, cache_path)
+        lines = gzip.decompress(body).splitlines()
+
+        with self._lock:
+            self._chunks[chunk] = lines
+            while len(self._chunks) > chunk_cache_size:
+                self._chunks.popitem(last=False)
+        return lines
+
+    # one record version by its location
+    def read_record(self, chunk: str, position: int) -> dict:
+        return json.loads(self.read_chunk(chunk)[position])
+
+    # stream a day's records as ndjson lines, a chunk at a time; the next chunks are
+    # downloaded while the current one is being read
+    def iter_day(self, day: str):
+        by_chunk = {}
+        for _, _, chunk, position in self.read_day(day):
+            by_chunk.setdefault(chunk, []).append(position)
+        chunks = sorted(by_chunk)
+        with ThreadPoolExecutor(max_workers=download_workers) as pool:
+            for chunk, lines in zip(chunks, pool.map(self.read_chunk, chunks)):
+                for position in sorted(by_chunk[chunk]):
+                    yield lines[position]
+
+    # rebuild a day as a single ndjson file; returns the number of records written
+    def write_ndjson(self, day: str, path: str) -> int:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        count = 0
+        with open(temp_path, "wb") as file:
+            for line in self.iter_day(day):
+                file.write(line + b"\n")
+                count += 1
+        os.replace(temp_path, path)
+        return count
+
+    # the versions of one dataset in order, with the first day each was seen; days the
+    # dataset was missing from are listed with a null hash. Each day is looked up in its
+    # changes when they were taken against the day before it, and in its full listing otherwise
+    def history(self, dataset_id: str, days: list[str] = None) -> list[dict]:
+        versions = []
+        previous_day = None
+        for day in days or self.list_days():
+            changes = self.read_changes(day) if previous_day else None
+            if changes and changes[0] == previous_day:
+                rows = changes[1]
+                i = bisect.bisect_left(rows, (dataset_id,))
+                if i == len(rows) or rows[i][0] != dataset_id:
+                    previous_day = day
+                    continue
+                found = rows[i] if rows[i][1] else None
+            else:
+                rows = self.read_day(day)
+                i = bisect.bisect_left(rows, (dataset_id,))
+                found = rows[i] if i < len(rows) and rows[i][0] == dataset_id else None
+            previous_day = day
+            version = found[1] if found else None
+            if versions and versions[-1]["hash"] == version:
+                continue
+            if not versions and version is None:
+                continue
+            versions.append({
+                "day": day,
+                "hash": version,
+                "chunk": found[2] if found else None,
+                "line": found[3] if found else None
+            })
+        return versions
+
+    def packer(self, day: str) -> "RecordPacker":
+        previous = [d for d in self.list_days() if d < day]
+        if not previous:
+            return RecordPacker(self, day)
+        return RecordPacker(self, day, self.read_day(previous[-1]), since=previous[-1])
+
+
+# adds one day to the archive; records are added as they're read and only versions the
+# previous day didn't have are written to new chunks. A dataset listed twice keeps its first record
+class RecordPacker:
+    def __init__(self, archive: RecordArchive, day: str, previous_rows: list = [], since: str = ""):
+        self.archive = archive
+        self.day = day
+        self.since = since
+        self.known = {version: (chunk, position) for _, version, chunk, position in previous_rows}
+        self.previous = {dataset_id: version for dataset_id, version, _, _ in previous_rows}
+        self.rows = {}
+        self.records = 0
+        self.new_versions = 0
+        self.chunks = []
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._pending = {}  # hash -> line in the chunk being filled
+
+    def add(self, record: dict):
+        dataset_id = record.get("id")
+        if not dataset_id or dataset_id in self.rows:
+            return
+        body = canonical_record(record)
+        version = record_hash(body)
+        self.records += 1
+        if version in self.known:
+            self.rows[dataset_id] = (version, *self.known[version])
+            return
+        if version not in self._pending:
+            self._pending[version] = len(self._buffer)
+            self._buffer.append(body)
+            self._buffer_bytes += len(body) + 1
+            self.new_versions += 1
+        self.rows[dataset_id] = (version, None, self._pending[version])
+        if self._buffer_bytes >= chunk_size:
+            self.flush()
+
+    # write the chunk being filled; its name is the hash of its content
+    def flush(self):
+        if not self._buffer:
+            return
+        body = b"\n".join(self._buffer) + b"\n"
+        chunk = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.archive.storage.put(self.archive.chunk_key(chunk), gzip.compress(body))
+        self.chunks.append(chunk)
+        for version, position in self._pending.items():
+            self.known[version] = (chunk, position)
+        for dataset_id, (version, row_chunk, position) in self.rows.items():
+            if row_chunk is None:
+                self.rows[dataset_id] = (version, chunk, position)
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._pending = {}
+
+    # flush the last chunk, then write the day's changes and listing (after its chunks, so a
+    # listing never points at a chunk that doesn't exist)
+    def close(self) -> dict:
+        self.flush()
+        rows = [(dataset_id, *row) for dataset_id, row in sorted(self.rows.items())]
+        removed = [(dataset_id, None, None, None) for dataset_id in self.previous if dataset_id not in self.rows]
+        changes = [row for row in rows if self.previous.get(row[0]) != row[1]]
+        self.archive.write_changes(self.day, self.since, sorted(changes + removed))
+        self.archive.write_day(self.day, rows)
+        return {"day": self.day, "records": self.records, "new_versions": self.new_versions, "chunks": len(self.chunks)}
+
+
+# the ndjson objects of a harvested full snapshot (not its errors, id listings or deltas)
+def list_snapshot_keys(storage, day: str) -> list[str]:
+    prefix = f"{ndjson_prefix}/{day}/"
+    keys = storage.list_keys(prefix)
+    return sorted(key for key in keys if "/" not in key[len(prefix):] and ".ndjson" in key)
+
+# the records of an ndjson object, read and decompressed read_size bytes at a time
+def parse_ndjson_object(key: str, body):
+    if key.endswith(".gz"):
+        body = gzip.GzipFile(fileobj=body)
+    elif key.endswith(".zst"):
+        body = zstandard.ZstdDecompressor().stream_reader(body)
+    rest = b""
+    while block := body.read(read_size):
+        lines = (rest + block).split(b"\n")
+        rest = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if rest.strip():
+        yield json.loads(rest)
+
+# pack a harvested ndjson snapshot into the archive, streaming one object at a time (a
+# snapshot object can be hundreds of MB); with prune the full copy is deleted once the
+# day's listing is written
+def pack_snapshot(storage, day: str, prune: bool = False, archive: RecordArchive = None) -> dict:
+    archive = archive or RecordArchive(storage)
+    keys = list_snapshot_keys(storage, day)
+    if not keys:
+        raise ValueError(f"no ndjson snapshot for {day} (incremental runs can't be packed)")
+    packer = archive.packer(day)
+    for key in keys:
+        body = storage.open(key)
+        try:
+            for record in parse_ndjson_object(key, body):
+                packer.add(record)
+        finally:
+            body.close()
+    result = packer.close()
+    if prune:
+        for key in keys:
+            storage.delete(key)
+        result["pruned"] = len(keys)
+    return result
+
+# %%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pack, restore and look up record versions in the content-addressed archive.")
+    parser.add_argument("--storage", default=None, help="storage url (default: CATALOG_STORAGE or the archive bucket)")
+    parser.add_argument("--cache-dir", default=None, help="keep downloaded chunks in this folder")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="add a harvested ndjson snapshot to the archive")
+    pack.add_argument("days", nargs="+", help="snapshot timestamps, oldest first")
+    pack.add_argument("--prune", action="store_true", help="delete the full ndjson copy once it's packed")
+    restore = commands.add_parser("restore", help="rebuild a day as records.ndjson in a folder")
+    restore.add_argument("day")
+    restore.add_argument("folder")
+    history = commands.add_parser("history", help="list the versions of one dataset")
+    history.add_argument("dataset_id")
+    history.add_argument("--records", action="store_true", help="print each version's record too")
+    commands.add_parser("days", help="list the archived days")
+    args = parser.parse_args()
+
+    archive = RecordArchive(get_storage(args.storage), cache_dir=args.cache_dir)
+    if args.command == "pack":
+        for day in args.days:
+            result = pack_snapshot(archive.storage, day, prune=args.prune, archive=archive)
+            print(f"📦 {day}: {result['records']} records, {result['new_versions']} new versions in {result['chunks']} chunks")
+    elif args.command == "restore":
+        path = os.path.join(args.folder, "records.ndjson")
+        print(f"✅ Wrote {archive.write_ndjson(args.day, path)} records to {path}")
+    elif args.command == "history":
+        for version in archive.history(args.dataset_id):
+            print(f"{version['day']}\t{version['hash'] or 'removed'}")
+            if args.records and version["hash"]:
+                print(json.dumps(archive.read_record(version["chunk"], version["line"]), indent=2))
+    else:
+        print("\n".join(archive.list_days()))
@@ -0,0 +1,177 @@
+# run metrics shared by the harvesters and the analysis
+# counters, gauges and histograms keyed by name and labels, with a timer context manager for
+# the stages of a run (fetch, serialize, upload, scan, aggregate, diff). A run's metrics are
+# saved as run_metrics.json next to its output and can also be rendered in the Prometheus
+# text format (run_metrics.prom) for a textfile collector or pushgateway.
+
+import contextlib
+from datetime import datetime, timezone
+import json
+import os
+import threading
+import time
+
+metric_prefix = "datagov_catalog"
+metrics_file_name = "run_metrics.json"
+prometheus_file_name = "run_metrics.prom"
+
+
+# cumulative histogram with fixed bucket bounds (seconds by default)
+class Histogram:
+    default_bounds = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, bounds: tuple = None):
+        self.bounds = tuple(bounds or self.default_bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.total += value
+
+    # approximate quantile: the upper bound of the bucket holding it
+    def quantile(self, q: float) -> float:
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return self.bounds[i] if i < len(self.bounds) else float("inf")
+        return 0.0
+
+    def to_dict(self) -> dict:
+        labels = [f"le_{bound}" for bound in self.bounds] + ["le_inf"]
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "buckets": dict(zip(labels, self.counts))
+        }
+
+    def summary(self) -> str:
+        mean = self.total / self.count if self.count else 0.0
+        return f"{self.count} observations, mean {mean:.2f}, p50 <= {self.quantile(0.5)}, p95 <= {self.quantile(0.95)}"
+
+
+class RunMetrics:
+    # labels are attached to every metric, e.g. {"job": "harvest", "run": timestamp}
+    def __init__(self, **labels):
+        self.labels = labels
+        self.started = datetime.now(timezone.utc)
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def increment(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name: str, value: float, bounds: tuple = None, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(bounds)
+            self.histograms[key].observe(value)
+
+    # attach a histogram kept elsewhere (e.g. the request scheduler's latencies)
+    def add_histogram(self, name: str, histogram: Histogram, **labels):
+        with self._lock:
+            self.histograms[self._key(name, labels)] = histogram
+
+    # time a block into the <name>_seconds histogram
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - started, **labels)
+
+    def to_dict(self) -> dict:
+        def entries(metrics: dict, value):
+            return [{"name": name, "labels": dict(labels), **value(metric)} for (name, labels), metric in sorted(metrics.items())]
+
+        finished = datetime.now(timezone.utc)
+        with self._lock:
+            return {
+                "labels": self.labels,
+                "started": self.started.strftime("%Y%m%dT%H%M%S"),
+                "finished": finished.strftime("%Y%m%dT%H%M%S"),
+                "elapsed_seconds": round((finished - self.started).total_seconds(), 3),
+                "counters": entries(self.counters, lambda value: {"value": value}),
+                "gauges": entries(self.gauges, lambda value: {"value": value}),
+                "histograms": entries(self.histograms, lambda histogram: histogram.to_dict())
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=4)
+
+    def to_prometheus(self) -> str:
+        def label_text(labels: dict, **extra) -> str:
+            labels = {**self.labels, **labels, **extra}
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{k}="{str(v)}"' for k, v in labels.items()) + "}"
+
+        lines = []
+        typed = set()
+
+        def declare(name: str, kind: str):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                metric = f"{metric_prefix}_{name}"
+                declare(metric, "counter")
+                lines.append(f"{metric}{label_text(dict(labels))} {value}")
+            for (name, labels), value in sorted(self.gauges.items()):
+                metric = f"{metric_prefix}_{name}"
+                declare(metric, "gauge")
+                lines.append(f"{metric}{label_text(dict(labels))} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                metric = f"{metric_prefix}_{name}"
+                declare(metric, "histogram")
+                cumulative = 0
+                for bound, count in zip(list(histogram.bounds) + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f"{metric}_bucket{label_text(dict(labels), le=bound)} {cumulative}")
+                lines.append(f"{metric}_sum{label_text(dict(labels))} {histogram.total}")
+                lines.append(f"{metric}_count{label_text(dict(labels))} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    # save run_metrics.json (and run_metrics.prom) into a local folder
+    def write(self, folder: str, prometheus: bool = False) -> str:
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, metrics_file_name)
+        with open(path, "w") as file:
+            file.write(self.to_json())
+        if prometheus:
+            with open(os.path.join(folder, prometheus_file_name), "w") as file:
+                file.write(self.to_prometheus())
+        return path
+
+    # save the same files through a catalog_storage backend
+    def write_to_storage(self, storage, prefix: str, prometheus: bool = False) -> str:
+        key = f"{prefix}/{metrics_file_name}"
+        storage.put(key, self.to_json())
+        if prometheus:
+            storage.put(f"{prefix}/{prometheus_file_name}", self.to_prometheus())
+        return key
@@ -0,0 +1,288 @@
+# %%
+# nightly pipeline: harvest -> normalize -> index -> statistics in one process
+# the stages run side by side, connected by bounded queues:
+#   harvest     the async harvester; every page it saves is also handed to the normalize stage
+#   normalize   pages are parsed into the snapshot schema and written as parquet parts
+#   index       each part's index rows (hashes, organization ids, resource counts) and
+#               organizations are computed as soon as the part is written
+#   statistics  once the harvest is done the parts become catalog.parquet, the index files
+#               are saved from the collected rows and the day is compared with the previous one
+# while the harvest runs, the previous snapshot is synced from the archive and indexed too, so
+# the nightly run takes little longer than the harvest itself. A full queue blocks the stage
+# feeding it, so a slow stage slows the harvest down instead of buffering pages without bound.
+#
+# with an archive (CATALOG_STORAGE) the statistics store is taken from and saved back to it,
+# and the run metrics are saved there too, so a fresh runner keeps adding to the same history.
+#
+#   python scripts/run_pipeline.py [--pagination offset] [--concurrency 16] [--data-folder data]
+
+import argparse
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+
+import polars as pl
+
+from script_paths import scripts_dir
+
+import get_datagov_catalog_async as harvester
+from analysis_engine import collect
+from catalog_statistics import (
+    build_daily_statistics,
+    get_archive,
+    get_recent_catalog_folders,
+    get_recent_snapshots,
+    prepare_delta_snapshots,
+    sync_catalog_folders,
+    write_daily_statistics,
+    write_run_metrics
+)
+from organization_dimension import load_organization_dimension
+from run_metrics import RunMetrics
+from snapshot_index import build_index, build_organizations, load_snapshot_index, save_snapshot_index
+from snapshot_store import catalog_schema, get_snapshot_folder, get_snapshot_path, normalize_catalog, write_snapshot_frame
+from statistics_store import ingest_statistics, open_store
+
+# %%
+# defining parameters
+data_folder = os.path.join(os.path.dirname(scripts_dir), "data")
+page_queue_size = 16     # pages buffered between the harvest and the normalize stage
+part_queue_size = 4      # parts buffered between the normalize and the index stage
+part_records = 10000     # records per parquet part
+parts_folder_name = "_parts"
+statistics_prefix = "Catalog/daily_statistics"  # the statistics store and run metrics in the archive
+store_file_name = "statistics.sqlite"
+
+# %%
+# stages
+
+# a queue put that gives up once another stage has failed, so nothing blocks on a dead consumer
+def put(stage_queue: queue.Queue, item, failed: threading.Event):
+    while not failed.is_set():
+        try:
+            stage_queue.put(item, timeout=1)
+            return
+        except queue.Full:
+            pass
+    raise RuntimeError("a pipeline stage failed")
+
+# run a stage in a thread, flagging failures for the other stages
+def start_stage(name: str, target, failed: threading.Event, errors: list, *args) -> threading.Thread:
+    def run():
+        try:
+            target(*args)
+        except BaseException as e:
+            errors.append((name, e))
+            failed.set()
+            logging.exception(f"{name} stage failed")
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
+
+# pages -> parquet parts in the snapshot schema; hands (part number, path) to the index stage
+def normalize_stage(pages: queue.Queue, parts: queue.Queue, parts_folder: str, metrics: RunMetrics, failed: threading.Event):
+    os.makedirs(parts_folder, exist_ok=True)
+    batch = []
+    part = 0
+
+    def flush():
+        nonlocal batch, part
+        with metrics.timer("normalize"):
+            path = os.path.join(parts_folder, f"part_{part:05d}.parquet")
+            pl.from_dicts(batch, schema=catalog_schema, strict=False).write_parquet(path)
+        put(parts, (part, path), failed)
+        metrics.increment("parts_total")
+        batch = []
+        part += 1
+
+    while True:
+        package_list = pages.get()
+        if package_list is None:
+            break
+        batch.extend(package_list)
+        if len(batch) >= part_records:
+            flush()
+    if batch:
+        flush()
+    put(parts, None, failed)
+
+# parts -> index rows and organizations, kept in part order so duplicates resolve like the
+# snapshot's de-duplication (first part wins)
+def index_stage(parts: queue.Queue, results: dict, metrics: RunMetrics):
+    indexes = {}
+    organizations = []
+    while True:
+        item = parts.get()
+        if item is None:
+            break
+        part, path = item
+        with metrics.timer("index"):
+            catalog = normalize_catalog(pl.scan_parquet(path))
+            indexes[part] = collect(build_index(catalog))
+            organizations.append(collect(build_organizations(catalog)))
+    results["index"] = [indexes[part] for part in sorted(indexes)]
+    results["organizations"] = organizations
+
+# the previous snapshot from the archive, indexed while the harvest runs
+def prepare_previous_stage(ndjson_root: str, parquet_root: str, archive, before: str, metrics: RunMetrics):
+    with metrics.timer("prepare", snapshot="comparison"):
+        if archive:
+            sync_catalog_folders(ndjson_root, archive, cycles=0, before=before)
+        folders = [f for f in get_recent_catalog_folders(ndjson_root, cycles=None) or [] if os.path.basename(f) < before]
+        previous = prepare_delta_snapshots(folders, parquet_root)
+        if previous:
+            load_snapshot_index(previous[0], parquet_root)
+
+# %%
+# the pipeline
+
+# the archived statistics store, unless there's a local one already
+def restore_statistics_store(archive, store_path: str) -> bool:
+    key = f"{statistics_prefix}/{store_file_name}"
+    if os.path.exists(store_path) or not archive.exists(key):
+        return False
+    os.makedirs(os.path.dirname(store_path), exist_ok=True)
+    temp_path = f"{store_path}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(archive.get(key))
+    os.replace(temp_path, store_path)
+    logging.info(f"restored the statistics store from {archive.uri(key)}")
+    return True
+
+# save the statistics store (closed, so it has no pending WAL) back to the archive
+def save_statistics_store(archive, store_path: str) -> str:
+    key = f"{statistics_prefix}/{store_file_name}"
+    with open(store_path, "rb") as file:
+        archive.put(key, file.read())
+    return key
+
+# compare the new snapshot with the one before it and record the day in the statistics store
+def run_statistics(data_folder: str, ndjson_root: str, parquet_root: str, run: str, metrics: RunMetrics,
+                   archive=None) -> str:
+    folders = [f for f in get_recent_snapshots(ndjson_root, parquet_root, cycles=None) if os.path.basename(f) <= run]
+    if len(folders) < 2:
+        logging.warning("no earlier snapshot to compare with; skipping the statistics")
+        return None
+
+    statistics_folder = os.path.join(data_folder, "daily_statistics")
+    os.makedirs(statistics_folder, exist_ok=True)
+    result = build_daily_statistics(folders[0], folders[1], parquet_root, dimension=load_organization_dimension(),
+                                    metrics=metrics, statistics_folder=statistics_folder)
+    store_path = os.path.join(data_folder, store_file_name)
+    with metrics.timer("write"):
+        filename = write_daily_statistics(result, statistics_folder)
+        if archive:
+            restore_statistics_store(archive, store_path)
+        store = open_store(store_path)
+        ingest_statistics(store, result, source=filename, modified=os.path.getmtime(filename))
+        store.close()
+        if archive:
+            save_statistics_store(archive, store_path)
+    logging.info(f"wrote {filename}")
+    return filename
+
+def run_pipeline(data_folder: str = data_folder, harvest_options: dict = {}, statistics: bool = True,
+                 prometheus: bool = False) -> dict:
+    ndjson_root = os.path.join(data_folder, "data_gov_catalog_ndjson")
+    parquet_root = os.path.join(data_folder, "data_gov_catalog_parquet")
+    run = harvester.timestamp
+    # the snapshot's local folder; the records themselves are in the archive and the parquet store
+    snapshot_folder = os.path.join(ndjson_root, run)
+    parquet_folder = get_snapshot_folder(snapshot_folder, parquet_root)
+    parts_folder = os.path.join(parquet_folder, parts_folder_name)
+    metrics = RunMetrics(job="pipeline", run=run)
+    archive = get_archive()
+    # a fresh data folder has no snapshots yet
+    os.makedirs(ndjson_root, exist_ok=True)
+
+    pages = queue.Queue(maxsize=page_queue_size)
+    parts = queue.Queue(maxsize=part_queue_size)
+    failed = threading.Event()
+    errors = []
+    results = {}
+    stages = [
+        start_stage("normalize", normalize_stage, failed, errors, pages, parts, parts_folder, metrics, failed),
+        start_stage("index", index_stage, failed, errors, parts, results, metrics),
+        start_stage("prepare", prepare_previous_stage, failed, errors, ndjson_root, parquet_root, archive, run, metrics)
+    ]
+
+    async def on_records(package_list):
+        await asyncio.to_thread(put, pages, package_list, failed)
+
+    logging.info(f"harvesting {run}...")
+    with metrics.timer("harvest"):
+        stats = asyncio.run(harvester.harvest(on_records=on_records, **harvest_options))
+    logging.info(f"harvest finished: {stats.summary()}")
+    put(pages, None, failed)
+    for stage in stages:
+        stage.join()
+    if errors:
+        raise RuntimeError(f"pipeline stages failed: {', '.join(name for name, _ in errors)}") from errors[0][1]
+
+    # one de-duplicated, organization-sorted snapshot from the parts, then its index files;
+    # both keep a dataset's first record in part order, so the index matches catalog.parquet
+    part_files = sorted(os.path.join(parts_folder, f) for f in os.listdir(parts_folder))
+    if not part_files:
+        raise RuntimeError("the harvest saved no records")
+    with metrics.timer("snapshot"):
+        write_snapshot_frame(normalize_catalog(pl.scan_parquet(part_files)), get_snapshot_path(snapshot_folder, parquet_root))
+        index = pl.concat(results["index"]).unique(subset=["id"], keep="first", maintain_order=True).sort("id")
+        organizations = pl.concat(results["organizations"], how="diagonal_relaxed").unique(subset=["id"], keep="first", maintain_order=True).sort("id")
+        save_snapshot_index(parquet_folder, index, organizations)
+        for part_file in part_files:
+            os.remove(part_file)
+        os.rmdir(parts_folder)
+        os.makedirs(snapshot_folder, exist_ok=True)
+    metrics.set_gauge("records", index.height, snapshot="current")
+
+    summary = {"run": run, "records": index.height, "harvest": stats.summary(), "statistics": None}
+    if statistics and (stats.pages_failed or stats.uploads_failed):
+        # a snapshot with holes would show up as mass removals
+        logging.warning("the harvest had failed pages; skipping the statistics (repair the run, then rerun the analysis)")
+    elif statistics:
+        summary["statistics"] = run_statistics(data_folder, ndjson_root, parquet_root, run, metrics, archive)
+
+    write_run_metrics(metrics, snapshot_folder, parquet_root, prometheus=prometheus)
+    if archive:
+        metrics.write_to_storage(archive, f"{statistics_prefix}/metrics/{run}", prometheus)
+    return summary
+
+# %%
+# run the pipeline
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s.%(msecs)03d %(levelname)-8s| %(message)s",
+        datefmt="%H:%M:%S"
+    )
+    parser = argparse.ArgumentParser(description="Harvest the catalog and compute the daily statistics in one overlapped run.")
+    parser.add_argument("--data-folder", default=data_folder, help="local data folder (snapshots, parquet store, statistics)")
+    parser.add_argument("--concurrency", type=int, default=harvester.concurrency, help="maximum number of requests in flight")
+    parser.add_argument("--pagination", choices=["offset", "keyset"], default=harvester.pagination, help="page with start= offsets or an id cursor")
+    parser.add_argument("--output", choices=["pages", "multipart"], default=harvester.output_mode, help="one object per page or a few large multipart objects")
+    parser.add_argument("--manifest-dir", help="keep the run manifest in this local folder instead of the archive")
+    parser.add_argument("--pack", action="store_true", help="add the snapshot to the content-addressed record archive")
+    parser.add_argument("--skip-statistics", action="store_true", help="only harvest, normalize and index")
+    parser.add_argument("--prometheus", action="store_true", help="also save the run metrics in the Prometheus text format")
+    args = parser.parse_args()
+
+    _script_start = time.time()
+    summary = run_pipeline(
+        data_folder=args.data_folder,
+        harvest_options={
+            "concurrency": args.concurrency,
+            "pagination": args.pagination,
+            "output_mode": args.output,
+            "manifest_dir": args.manifest_dir,
+            "pack": args.pack,
+            "prometheus": args.prometheus
+        },
+        statistics=not args.skip_statistics,
+        prometheus=args.prometheus
+    )
+    elapsed = time.strftime("%H:%M:%S", time.gmtime(time.time() - _script_start))
+    logging.info(f"{summary['records']} records in {summary['run']}; elapsed time {elapsed}")
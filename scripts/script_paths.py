@@ -0,0 +1,22 @@
+# %%
+# the scripts import each other by module name, across folders: the harvesters and the
+# analysis use the shared modules here (catalog_storage, record_archive, run_metrics) and the
+# pipeline and the benchmark use both folders. Every entry point imports this module before
+# anything else, so the lookup doesn't depend on which module happened to be imported first:
+#
+#   sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+#   import script_paths  # noqa: F401
+#
+# (scripts in this folder only need the import)
+
+import os
+import sys
+
+scripts_dir = os.path.dirname(os.path.abspath(__file__))
+harvest_dir = os.path.join(scripts_dir, "get_datagov_catalog")
+analysis_dir = os.path.join(scripts_dir, "analyze_datagov_catalog")
+benchmark_dir = os.path.join(scripts_dir, "benchmark")
+
+for folder in (scripts_dir, harvest_dir, analysis_dir, benchmark_dir):
+    if folder not in sys.path:
+        sys.path.append(folder)
@@ -0,0 +1,6 @@
+# the scripts import their siblings by name, as they do when run from their own folder
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+import script_paths  # noqa: E402,F401
@@ -0,0 +1,100 @@
+# catalog records shaped like catalog.data.gov package_search results
+import copy
+import json
+import os
+
+organizations = {
+    "census": {
+        "id": "7d8a2f3c-1b4e-4c6a-9f0e-2a1b3c4d5e6f",
+        "name": "census-gov",
+        "title": "U.S. Census Bureau, Department of Commerce",
+        "type": "organization",
+        "description": "",
+        "image_url": "https://www.census.gov/logo.png",
+        "created": "2020-11-10T15:10:19.035827",
+        "is_organization": True,
+        "approval_status": "approved",
+        "state": "active"
+    },
+    "noaa": {
+        "id": "e8a9b4e1-4c3d-4a5b-8e2f-6b7c8d9e0f1a",
+        "name": "noaa-gov",
+        "title": "National Oceanic and Atmospheric Administration, Department of Commerce",
+        "type": "organization",
+        "description": "",
+        "image_url": "",
+        "created": "2020-11-10T15:36:13.098184",
+        "is_organization": True,
+        "approval_status": "approved",
+        "state": "active"
+    }
+}
+
+def make_record(dataset_id: str, organization: str = "census", title: str = None, resource_formats: list[str] = ["CSV", "API"]) -> dict:
+    resources = [
+        {
+            "id": f"{dataset_id}-r{position}",
+            "package_id": dataset_id,
+            "name": f"Resource {position}",
+            "description": "",
+            "format": resource_format,
+            "mimetype": None,
+            "url": f"https://www2.census.gov/{dataset_id}/{position}.{resource_format.lower()}",
+            "url_type": None,
+            "size": None,
+            "created": "2023-04-03T11:22:33.123456",
+            "last_modified": None,
+            "metadata_modified": "2024-01-05T08:09:10.111213",
+            "position": position,
+            "state": "active"
+        }
+        for position, resource_format in enumerate(resource_formats)
+    ]
+    return copy.deepcopy({
+        "id": dataset_id,
+        "name": f"dataset-{dataset_id}",
+        "title": title or f"Dataset {dataset_id}",
+        "notes": "American Community Survey 5-year estimates.",
+        "type": "dataset",
+        "state": "active",
+        "private": False,
+        "license_id": "us-pd",
+        "license_title": "us-pd",
+        "maintainer": "Data Dissemination Branch",
+        "maintainer_email": "ask.data@census.gov",
+        "author": None,
+        "author_email": None,
+        "url": None,
+        "version": None,
+        "owner_org": organizations[organization]["id"],
+        "metadata_created": "2023-04-03T11:22:33.123456",
+        "metadata_modified": "2024-01-05T08:09:10.111213",
+        "num_resources": len(resources),
+        "num_tags": 2,
+        "organization": organizations[organization],
+        "resources": resources,
+        "tags": [
+            {"id": "a1b2c3d4-0000-4000-8000-000000000001", "name": "population", "display_name": "population", "state": "active", "vocabulary_id": None},
+            {"id": "a1b2c3d4-0000-4000-8000-000000000002", "name": "income", "display_name": "income", "state": "active", "vocabulary_id": None}
+        ],
+        "groups": [
+            {"id": "b2c3d4e5-0000-4000-8000-000000000001", "name": "local", "title": "Local Government", "display_name": "Local Government",
+             "description": "", "image_display_url": ""}
+        ],
+        "extras": [
+            {"key": "accessLevel", "value": "public"},
+            {"key": "bureauCode", "value": "006:07"},
+            {"key": "publisher", "value": "U.S. Census Bureau"},
+            {"key": "publisher_hierarchy", "value": "U.S. Government > U.S. Department of Commerce > U.S. Census Bureau"},
+            {"key": "harvest_source_title", "value": "Census Data.json"}
+        ]
+    })
+
+# write records as a harvested ndjson snapshot folder
+def write_snapshot_folder(root: str, day: str, records: list[dict]) -> str:
+    folder = os.path.join(root, day)
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, "page_0.ndjson"), "w", encoding="utf-8") as file:
+        for record in records:
+            file.write(json.dumps(record) + "\n")
+    return folder
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import pytest
+
+from catalog_storage import get_storage
+import get_datagov_catalog_async as harvester
+from mock_ckan import MockCKANServer, SyntheticCatalog
+
+# the harvester pointed at a local mock of the package_search api and a local archive
+@pytest.fixture
+def catalog_api(tmp_path, monkeypatch):
+    catalog = SyntheticCatalog(230, seed=3)
+    storage = get_storage(f"file://{tmp_path}/archive")
+    monkeypatch.setattr(harvester, "storage", storage)
+    monkeypatch.setattr(harvester, "bucket_name", storage.bucket)
+    monkeypatch.setattr(harvester, "rows", 50)
+    monkeypatch.setattr(harvester, "end_limit", 300)
+    with MockCKANServer(catalog) as server:
+        monkeypatch.setattr(harvester, "search_url", f"{server.url}/package_search")
+        yield catalog, server, storage
+
+def saved_pages(storage) -> dict[str, list[str]]:
+    prefix = f"Catalog/{harvester.run_folder}/"
+    return {
+        key[len(prefix):]: [json.loads(line)["id"] for line in storage.get(key).decode("utf-8").splitlines()]
+        for key in storage.list_keys(prefix) if key.endswith(".ndjson")
+    }
+
+def test_offset_harvest_saves_every_page(catalog_api, tmp_path):
+    catalog, server, storage = catalog_api
+    stats = asyncio.run(harvester.harvest(concurrency=4, manifest_dir=str(tmp_path / "manifests")))
+
+    assert (stats.pages_fetched, stats.pages_uploaded, stats.pages_failed, stats.records) == (6, 5, 0, 230)
+    pages = saved_pages(storage)
+    assert sorted(pages) == [f"download_{start:06d}_{start + 50:06d}.ndjson" for start in range(0, 250, 50)]
+    assert sorted(dataset_id for ids in pages.values() for dataset_id in ids) == catalog.ids
+    assert storage.exists(harvester.state_key)
+
+def test_failed_pages_are_logged_and_hold_back_the_high_water_mark(catalog_api, tmp_path, monkeypatch):
+    catalog, server, storage = catalog_api
+    server.error_rate = 1.0
+    monkeypatch.setattr(harvester, "max_retries", 1)
+    stats = asyncio.run(harvester.harvest(concurrency=4, manifest_dir=str(tmp_path / "manifests")))
+
+    assert (stats.pages_fetched, stats.pages_failed, stats.records) == (0, 6, 0)
+    assert saved_pages(storage) == {}
+    errors = [details for _, details in harvester.list_error_logs()]
+    assert sorted(details["start"] for details in errors) == list(range(0, 300, 50))
+    assert all(details["mode"] == "offset" for details in errors)
+    assert not storage.exists(harvester.state_key)
+
+def test_split_key_space_covers_every_id_once():
+    assert harvester.split_key_space(1) == [(None, None)]
+    assert harvester.split_key_space(4) == [(None, "40"), ("40", "80"), ("80", "c0"), ("c0", None)]
+    ranges = harvester.split_key_space(16)
+    assert [lower for lower, _ in ranges[1:]] == [upper for _, upper in ranges[:-1]]
+
+def test_keyset_filter_bounds():
+    assert harvester.keyset_filter(None, None, True) == "id:[* TO *]"
+    assert harvester.keyset_filter("40", "80", True) == 'id:["40" TO "80"}'
+    # past the first page the cursor itself was already saved
+    assert harvester.keyset_filter("4f0c", "80", False) == 'id:{"4f0c" TO "80"}'
+    assert harvester.keyset_filter("c0", None, False) == 'id:{"c0" TO *]'
+
+def test_keyset_harvest_walks_every_range(catalog_api, tmp_path):
+    catalog, server, storage = catalog_api
+    stats = asyncio.run(harvester.harvest(concurrency=4, pagination="keyset", key_ranges=4,
+                                          manifest_dir=str(tmp_path / "manifests")))
+
+    assert (stats.pages_failed, stats.records) == (0, 230)
+    pages = saved_pages(storage)
+    assert all(name.startswith("download_keyset_") for name in pages)
+    assert sorted(dataset_id for ids in pages.values() for dataset_id in ids) == catalog.ids
+    # within a range the pages follow the id order
+    for range_index in range(4):
+        ids = [dataset_id for name in sorted(pages) if name.startswith(f"download_keyset_{range_index:02d}_") for dataset_id in pages[name]]
+        assert ids == sorted(ids)
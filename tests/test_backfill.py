@@ -0,0 +1,58 @@
+import json
+
+import polars as pl
+
+import backfill_daily_statistics as backfill
+from catalog_statistics import build_daily_statistics
+from sample_records import make_record, write_snapshot_folder
+
+# stands in for load_snapshot_index, with frames of a given size per folder
+def fake_index(sizes: dict[str, int], loaded: list):
+    def load(folder, parquet_folder):
+        loaded.append(folder)
+        return pl.DataFrame({"id": [0] * sizes[folder]}, schema={"id": pl.Int64}), pl.DataFrame()
+    return load
+
+def test_cache_evicts_the_least_recently_used_snapshot(monkeypatch):
+    loaded = []
+    monkeypatch.setattr(backfill, "load_snapshot_index", fake_index({"a": 10, "b": 10, "c": 10, "d": 50}, loaded))
+    cache = backfill.SnapshotCache(max_bytes=8 * 25)
+
+    for folder in ("a", "b", "a", "c", "a", "b"):
+        cache.load(folder, "parquet")
+    # b was the least recently used when c pushed the cache over budget
+    assert loaded == ["a", "b", "c", "b"]
+    assert (cache.hits, cache.misses) == (2, 4)
+    assert list(cache.entries) == ["a", "b"] and cache.size == 8 * 20
+
+    # a snapshot bigger than the budget is still kept, on its own
+    cache.load("d", "parquet")
+    assert list(cache.entries) == ["d"] and cache.size == 8 * 50
+
+def test_split_pairs_into_contiguous_runs():
+    pairs = list(range(7))
+    assert backfill.split_pairs(pairs, 3) == [[0, 1, 2], [3, 4], [5, 6]]
+    assert backfill.split_pairs(pairs[:2], 4) == [[0], [1]]
+    assert backfill.split_pairs(pairs, 0) == [pairs]
+
+def test_a_run_of_pairs_loads_each_snapshot_once(tmp_path, monkeypatch):
+    root, parquet_folder, statistics_folder = str(tmp_path / "ndjson"), str(tmp_path / "parquet"), str(tmp_path / "statistics")
+    folders = [
+        write_snapshot_folder(root, "20250203T070000", [make_record("a"), make_record("b")]),
+        write_snapshot_folder(root, "20250204T070000", [make_record("a", title="Renamed"), make_record("b")]),
+        write_snapshot_folder(root, "20250205T070000", [make_record("a", title="Renamed"), make_record("c", organization="noaa")]),
+        write_snapshot_folder(root, "20250206T070000", [make_record("c", organization="noaa")])
+    ]
+    pairs = list(zip(folders[1:], folders[:-1]))
+    loaded = []
+    load_snapshot_index = backfill.load_snapshot_index
+    monkeypatch.setattr(backfill, "load_snapshot_index", lambda *args: loaded.append(args[0]) or load_snapshot_index(*args))
+
+    written = backfill.process_pairs(pairs, parquet_folder, statistics_folder, None, cache_bytes=64 * 1024 * 1024)
+    assert sorted(loaded) == sorted(folders)
+
+    for filename, (folder, older_folder) in zip(written, pairs):
+        with open(filename, "r") as file:
+            result = json.load(file)
+        expected = build_daily_statistics(folder, older_folder, parquet_folder, statistics_folder=str(tmp_path / "uncached"))
+        assert (result["counts"], result["deltas"]) == (expected["counts"], expected["deltas"])
@@ -0,0 +1,37 @@
+import polars as pl
+
+from analysis_engine import collect
+from catalog_diff import get_catalog_differences, get_changes, hash_catalog, get_compared_fields
+from snapshot_store import catalog_schema, normalize_catalog
+from sample_records import make_record
+
+def to_catalog(records: list[dict]) -> pl.LazyFrame:
+    return normalize_catalog(pl.from_dicts(records, schema=catalog_schema, strict=False).lazy())
+
+def test_hash_catalog_nested_record():
+    catalog = to_catalog([make_record("a")])
+    hashes = collect(hash_catalog(catalog, get_compared_fields(catalog)))
+    assert hashes.height == 1
+    assert hashes.get_column("resources").dtype == pl.UInt64
+    assert hashes.get_column("record_hash").null_count() == 0
+
+def test_hash_catalog_is_stable_on_the_streaming_engine():
+    catalog = to_catalog([make_record("a"), make_record("b", organization="noaa")])
+    fields = get_compared_fields(catalog)
+    streaming = hash_catalog(catalog, fields).sort("id").collect(engine="streaming")
+    in_memory = hash_catalog(catalog, fields).sort("id").collect()
+    assert streaming.equals(in_memory)
+
+def test_get_changes():
+    older = [make_record("a"), make_record("b"), make_record("c")]
+    newer = [make_record("a"), make_record("b", title="Renamed"), make_record("d", organization="noaa")]
+    newer[0]["resources"][0]["url"] = "https://www2.census.gov/moved.csv"
+
+    changes = collect(get_changes(to_catalog(older), to_catalog(newer))).to_dicts()
+    assert [(c["id"], c["change"]) for c in changes] == [("a", "modified"), ("b", "modified"), ("c", "removed"), ("d", "added")]
+    assert changes[0]["changed_fields"] == ["resources"]
+    assert changes[1]["changed_fields"] == ["title"]
+
+def test_unchanged_catalogs_have_no_differences():
+    records = [make_record("a"), make_record("b", organization="noaa")]
+    assert get_catalog_differences(to_catalog(records), to_catalog(records)) == {"added": [], "removed": [], "modified": []}
@@ -0,0 +1,59 @@
+import polars as pl
+
+from catalog_extras import extras_counts, pivot_extras, publisher_counts
+
+commerce = "U.S. Government > Department of Commerce"
+
+def catalog_with_extras(*datasets: dict) -> pl.LazyFrame:
+    extras_type = pl.List(pl.Struct({"key": pl.String, "value": pl.String}))
+    rows = [[{"key": key, "value": value} for key, value in extras.items()] for extras in datasets]
+    return pivot_extras(pl.LazyFrame({"extras": rows}, schema={"extras": extras_type}))
+
+def test_extras_are_pivoted_into_columns():
+    catalog = catalog_with_extras(
+        {"publisher_hierarchy": f"{commerce} > Census Bureau", "accessLevel": "public", "bureauCode": "006:07"},
+        {"publisher": "NOAA", "accessLevel": "non-public"},
+        {}
+    ).collect()
+    assert catalog.get_column("access_level").to_list() == ["public", "non-public", None]
+    assert catalog.get_column("bureau_code").to_list() == ["006:07", None, None]
+    # without a hierarchy the publisher is the whole path
+    assert catalog.get_column("publisher_path").to_list() == [
+        ["U.S. Government", "Department of Commerce", "Census Bureau"], ["NOAA"], None
+    ]
+
+def test_publisher_counts_roll_up_the_hierarchy():
+    catalog = catalog_with_extras(
+        {"publisher_hierarchy": f"{commerce} > Census Bureau"},
+        {"publisher_hierarchy": f"{commerce} >  > Census Bureau "},
+        {"publisher_hierarchy": commerce},
+        {"publisher_hierarchy": "U.S. Government > Department of the Interior > USGS"},
+        {"publisher": "NOAA"},
+        {"publisher_hierarchy": " > "},
+        {}
+    )
+    assert publisher_counts(catalog) == [
+        {"path": "NOAA", "publisher": "NOAA", "depth": 1, "dataset_count": 1, "direct_count": 1},
+        {"path": "U.S. Government", "publisher": "U.S. Government", "depth": 1, "dataset_count": 4, "direct_count": 0},
+        {"path": commerce, "publisher": "Department of Commerce", "depth": 2, "dataset_count": 3, "direct_count": 1},
+        {"path": f"{commerce} > Census Bureau", "publisher": "Census Bureau", "depth": 3, "dataset_count": 2, "direct_count": 2},
+        {"path": "U.S. Government > Department of the Interior", "publisher": "Department of the Interior", "depth": 2,
+         "dataset_count": 1, "direct_count": 0},
+        {"path": "U.S. Government > Department of the Interior > USGS", "publisher": "USGS", "depth": 3,
+         "dataset_count": 1, "direct_count": 1}
+    ]
+
+def test_extras_counts_by_value():
+    counts = extras_counts(catalog_with_extras(
+        {"accessLevel": "public", "harvest_source_title": "Census"},
+        {"accessLevel": "public"},
+        {"accessLevel": "restricted public"},
+        {}
+    ))
+    assert counts["access_level"] == [
+        {"value": "public", "dataset_count": 2},
+        {"value": "restricted public", "dataset_count": 1},
+        {"value": None, "dataset_count": 1}
+    ]
+    assert counts["harvest_source_title"] == [{"value": None, "dataset_count": 3}, {"value": "Census", "dataset_count": 1}]
+    assert counts["bureau_code"] == [{"value": None, "dataset_count": 4}]
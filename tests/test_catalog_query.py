@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from catalog_query import CatalogQuery, route
+from catalog_statistics import build_daily_statistics, write_daily_statistics
+from sample_records import make_record, organizations, write_snapshot_folder
+from statistics_store import ingest_statistics, open_store
+
+census, noaa = organizations["census"], organizations["noaa"]
+days = ["20250203T070000", "20250204T070000", "20250205T070000"]
+
+# three days of snapshots run through the daily statistics, as the nightly analysis does
+@pytest.fixture
+def query(tmp_path) -> CatalogQuery:
+    root, parquet_root = str(tmp_path / "ndjson"), str(tmp_path / "parquet")
+    statistics_folder, store_path = str(tmp_path / "daily_statistics"), str(tmp_path / "statistics.sqlite")
+    folders = [
+        write_snapshot_folder(root, days[0], [make_record("a"), make_record("b"), make_record("n", organization="noaa")]),
+        write_snapshot_folder(root, days[1], [make_record("a", title="Renamed"), make_record("n", organization="noaa")]),
+        write_snapshot_folder(root, days[2], [make_record("a", title="Renamed"), make_record("b"), make_record("n", organization="noaa")])
+    ]
+    os.makedirs(statistics_folder)
+    store = open_store(store_path)
+    for older, folder in zip(folders, folders[1:]):
+        result = build_daily_statistics(folder, older, parquet_root, statistics_folder=statistics_folder)
+        filename = write_daily_statistics(result, statistics_folder)
+        ingest_statistics(store, result, source=filename, modified=os.path.getmtime(filename))
+    store.close()
+    return CatalogQuery(parquet_root, statistics_folder, store_path=store_path)
+
+def test_snapshots_and_status(query):
+    assert route(query, ["snapshots"], {}) == days
+    assert route(query, ["snapshots"], {"start": "2025-02-04"}) == days[1:]
+    assert route(query, ["status"], {})["latest_snapshot"] == days[2]
+
+def test_changes_from_the_statistics(query):
+    changes = route(query, ["changes"], {})
+    assert [(c["snapshot"], c["change"], c["id"]) for c in changes] == [
+        (days[2], "added", "b"), (days[1], "modified", "a"), (days[1], "removed", "b")
+    ]
+    assert changes[1]["changed_fields"] == ["title"]
+    assert [c["id"] for c in route(query, ["changes"], {"change": "removed", "organization": census["name"]})] == ["b"]
+    assert route(query, ["changes"], {"organization": noaa["id"]}) == []
+    assert len(route(query, ["changes"], {"limit": "1"})) == 1
+
+def test_dataset_record_and_history(query):
+    record = route(query, ["datasets", "a"], {})
+    assert (record["snapshot"], record["title"]) == (days[2], "Renamed")
+    assert route(query, ["datasets", "a"], {"snapshot": days[0]})["title"] != "Renamed"
+    assert route(query, ["datasets", "missing"], {}) is None
+
+    history = route(query, ["datasets", "b", "history"], {})
+    assert (history["first_seen"], history["last_seen"]) == (days[0], days[2])
+    assert [(v["snapshot"], v["record_hash"] is None) for v in history["versions"]] == [
+        (days[0], False), (days[1], True), (days[2], False)
+    ]
+    assert [v["snapshot"] for v in route(query, ["datasets", "a", "history"], {})["versions"]] == days[:2]
+
+def test_organization_datasets_and_metrics(query):
+    assert [d["id"] for d in route(query, ["organizations", census["name"], "datasets"], {})] == ["a", "b"]
+    assert [d["id"] for d in route(query, ["organizations", noaa["id"], "datasets"], {"snapshot": days[1]})] == ["n"]
+    assert [row["value"] for row in route(query, ["metrics", "dataset_count"], {})] == [2, 3]
+    with pytest.raises(LookupError):
+        route(query, ["organizations"], {})
+
+def test_a_new_day_only_adds_its_own_change_log_part(query, tmp_path):
+    written = {day: os.stat(path).st_mtime_ns for day, path in query.change_log.items()}
+    assert list(written) == days[1:]
+
+    new_day = "20250206T070000"
+    folder = write_snapshot_folder(str(tmp_path / "ndjson"), new_day, [make_record("a", title="Renamed"), make_record("n", organization="noaa")])
+    result = build_daily_statistics(folder, str(tmp_path / "ndjson" / days[2]), query.parquet_root,
+                                    statistics_folder=query.statistics_folder)
+    write_daily_statistics(result, query.statistics_folder)
+    assert query.refresh(force=True)
+
+    assert list(query.change_log) == days[1:] + [new_day]
+    assert {day: os.stat(query.change_log[day]).st_mtime_ns for day in days[1:]} == written
+    assert [(c["snapshot"], c["id"]) for c in route(query, ["changes"], {"start": new_day[:8]})] == [(new_day, "b")]
+    assert route(query, ["changes"], {"end": "2025-02-05", "change": "removed"})[0]["snapshot"] == days[1]
@@ -0,0 +1,13 @@
+import os
+
+from catalog_statistics import build_daily_statistics
+from sample_records import make_record, write_snapshot_folder
+
+def test_a_day_without_resource_changes(tmp_path):
+    root, parquet_folder, statistics_folder = str(tmp_path / "ndjson"), str(tmp_path / "parquet"), str(tmp_path / "statistics")
+    older = write_snapshot_folder(root, "20250203T070000", [make_record("a"), make_record("b")])
+    folder = write_snapshot_folder(root, "20250204T070000", [make_record("a", title="Renamed"), make_record("b")])
+
+    result = build_daily_statistics(folder, older, parquet_folder, statistics_folder=statistics_folder)
+    assert result["deltas"] == {"added": 0, "removed": 0, "modified": 1}
+    assert os.path.getsize(os.path.join(statistics_folder, result["delta_files"]["resources"])) == 0
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from catalog_storage import LocalStorage, S3Storage, get_storage
+
+def test_multipart_upload_is_assembled_in_part_order(tmp_path):
+    storage = get_storage(f"file://{tmp_path}/bucket")
+    client = storage.client
+    upload_id = client.create_multipart_upload(Bucket=storage.bucket, Key="Catalog/run/part_0000.ndjson")["UploadId"]
+    # parts can finish in any order; the completed list decides the layout
+    etags = {number: client.upload_part(Body=body, Bucket=storage.bucket, Key="Catalog/run/part_0000.ndjson",
+                                        UploadId=upload_id, PartNumber=number)["ETag"]
+             for number, body in ((2, b"second\n"), (1, b"first\n"), (3, b"third\n"))}
+    assert not storage.exists("Catalog/run/part_0000.ndjson")
+
+    client.complete_multipart_upload(Bucket=storage.bucket, Key="Catalog/run/part_0000.ndjson", UploadId=upload_id,
+                                     MultipartUpload={"Parts": [{"PartNumber": n, "ETag": etags[n]} for n in (1, 2, 3)]})
+    assert storage.get("Catalog/run/part_0000.ndjson") == b"first\nsecond\nthird\n"
+    assert client._uploads == {}
+
+def test_an_aborted_upload_leaves_nothing_behind(tmp_path):
+    storage = get_storage(f"file://{tmp_path}/bucket")
+    client = storage.client
+    upload_id = client.create_multipart_upload(Bucket=storage.bucket, Key="Catalog/run/part_0001.ndjson")["UploadId"]
+    client.upload_part(Body=b"partial\n", Bucket=storage.bucket, Key="Catalog/run/part_0001.ndjson",
+                       UploadId=upload_id, PartNumber=1)
+    client.abort_multipart_upload(Bucket=storage.bucket, Key="Catalog/run/part_0001.ndjson", UploadId=upload_id)
+
+    assert storage.list_keys("Catalog/") == []
+    assert client._uploads == {}
+
+def test_put_many_and_get_many(tmp_path):
+    storage = get_storage(f"file://{tmp_path}/bucket")
+    items = [(f"Catalog/run/errors/error_{i:03d}.json", f'{{"page": {i}}}') for i in range(40)]
+    assert storage.put_many(items, workers=8) == [key for key, _ in items]
+
+    keys = storage.list_keys("Catalog/run/errors/")
+    assert keys == sorted(key for key, _ in items)
+    bodies = storage.get_many(keys, workers=8)
+    assert list(bodies) == keys
+    assert bodies == {key: body.encode("utf-8") for key, body in items}
+    with pytest.raises(storage.client.exceptions.NoSuchKey):
+        storage.get_many(["Catalog/run/errors/missing.json"])
+
+def test_listings_skip_unfinished_writes(tmp_path):
+    storage = get_storage(f"file://{tmp_path}/bucket")
+    storage.put_many([("Catalog/a/1.ndjson", b"1"), ("Catalog/b/2.ndjson", b"2"), ("Catalog/top.json", b"{}")])
+    (tmp_path / "bucket" / "Catalog" / "a" / "3.ndjson.0123.tmp").write_bytes(b"half")
+
+    assert storage.list_keys("Catalog/a/") == ["Catalog/a/1.ndjson"]
+    assert storage.list_folders("Catalog") == ["Catalog/a", "Catalog/b"]
+    assert storage.mirror("Catalog/a", str(tmp_path / "copy")) == [str(tmp_path / "copy" / "1.ndjson")]
+    # an unchanged copy isn't downloaded again
+    assert storage.mirror("Catalog/a", str(tmp_path / "copy")) == []
+
+def test_get_storage_picks_the_backend(tmp_path, monkeypatch):
+    monkeypatch.delenv("CATALOG_STORAGE", raising=False)
+    assert isinstance(get_storage(), S3Storage) and get_storage().bucket == "govex-us-data-archive"
+    monkeypatch.setenv("CATALOG_STORAGE", f"file://{tmp_path}/archive")
+    storage = get_storage()
+    assert isinstance(storage, LocalStorage) and storage.uri("Catalog/x.json") == os.path.join(str(tmp_path), "archive", "Catalog", "x.json")
@@ -0,0 +1,60 @@
+import json
+import os
+import runpy
+from collections import Counter
+
+from sample_records import make_record
+
+script_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "scripts", "analyze_datagov_catalog", "daily_statistics.py")
+
+# the statistics as the original (load everything, then count) version computed them
+def baseline_statistics(pages: list[list[dict]]) -> dict:
+    json_data = [record for page in pages for record in page]
+    first = {}
+    for d in json_data:
+        first.setdefault(d["id"], d)
+    json_data = list(first.values())
+    for entry in json_data:
+        publisher_hierarchy = next((x for x in entry["extras"] if x["key"] == "publisher_hierarchy"), None)
+        if publisher_hierarchy:
+            entry["publisher_hierarchy"] = publisher_hierarchy["value"]
+    groups = [g for d in json_data if "groups" in d for g in d["groups"]]
+    tags = [t for d in json_data if "tags" in d for t in d["tags"]]
+    return {
+        "record_count": len(first),
+        "organization_count": len({d["organization"]["id"] for d in json_data if "organization" in d}),
+        "organization_dataset_count": dict(Counter(d["organization"]["id"] for d in json_data if "organization" in d)),
+        "publisher_count": len({d["publisher_hierarchy"] for d in json_data if "publisher_hierarchy" in d}),
+        "publisher_dataset_count": dict(Counter(d["publisher_hierarchy"] for d in json_data if "publisher_hierarchy" in d)),
+        "group_count": len({g["id"] for g in groups}),
+        "group_dataset_count": dict(Counter(d["groups"][0]["id"] for d in json_data if "groups" in d and len(d["groups"]) > 0)),
+        "tag_count": len({t["id"] for t in tags})
+    }
+
+def with_publisher(record: dict, value) -> dict:
+    record["extras"] = [extra for extra in record["extras"] if extra["key"] != "publisher_hierarchy"]
+    if value is not ...:
+        record["extras"].append({"key": "publisher_hierarchy", "value": value})
+    return record
+
+def test_streamed_statistics_match_the_baseline(tmp_path, monkeypatch):
+    other_group = {"id": "b2c3d4e5-0000-4000-8000-000000000002", "name": "federal"}
+    pages = [
+        [make_record("a"), make_record("b", organization="noaa"), with_publisher(make_record("c"), "")],
+        [with_publisher(make_record("d"), ...), dict(make_record("e"), groups=[]), with_publisher(make_record("a"), "Changed")],
+        [dict(make_record("f", organization="noaa"), groups=[other_group], tags=[]), with_publisher(make_record("g"), "")]
+    ]
+    folder = tmp_path / "data" / "data_gov_catalog" / "20250203T070000"
+    folder.mkdir(parents=True)
+    for number, page in enumerate(pages):
+        (folder / f"download_{number:06d}.json").write_text(json.dumps(page))
+    working_folder = tmp_path / "scripts" / "analyze_datagov_catalog"
+    working_folder.mkdir(parents=True)
+    monkeypatch.chdir(working_folder)
+
+    result = runpy.run_path(script_path)
+    expected = baseline_statistics(pages)
+    assert {name: result[name] for name in expected} == expected
+    assert result["publisher_dataset_count"][""] == 2
+    assert result["statistics"].duplicate_count == 1
@@ -0,0 +1,88 @@
+import json
+import os
+
+import pytest
+
+from catalog_statistics import build_daily_statistics, get_recent_snapshots
+from snapshot_store import get_snapshot_path, scan_snapshot
+from sample_records import make_record, write_snapshot_folder
+
+# an incremental harvest: changed records under delta/ and, optionally, every id under ids/
+def write_delta_folder(root: str, day: str, records: list[dict], ids: list[str] = None) -> str:
+    folder = os.path.join(root, day)
+    os.makedirs(os.path.join(folder, "delta"))
+    with open(os.path.join(folder, "delta", "download_0.ndjson"), "w") as file:
+        file.writelines(json.dumps(record) + "\n" for record in records)
+    if ids is not None:
+        os.makedirs(os.path.join(folder, "ids"))
+        with open(os.path.join(folder, "ids", "ids_00.txt"), "w") as file:
+            file.write("\n".join(ids))
+    return folder
+
+def test_delta_with_id_listing(tmp_path):
+    root, parquet_root = str(tmp_path / "ndjson"), str(tmp_path / "parquet")
+    write_snapshot_folder(root, "20250203T070000", [make_record("a"), make_record("b"), make_record("c")])
+    write_delta_folder(root, "20250204T070000", [make_record("b", title="Renamed"), make_record("d")], ids=["a", "b", "d"])
+
+    folders = get_recent_snapshots(root, parquet_root)
+    assert [os.path.basename(f) for f in folders] == ["20250204T070000", "20250203T070000"]
+
+    result = build_daily_statistics(folders[0], folders[1], parquet_root)
+    assert result["counts"]["total_records"] == 3
+    assert result["incremental"] == {"id_listing": True}
+    assert [r["id"] for r in result["deltas"]["added"]] == ["d"]
+    assert [r["id"] for r in result["deltas"]["removed"]] == ["c"]
+    assert [(r["id"], r["changed_fields"]) for r in result["deltas"]["modified"]] == [("b", ["title"])]
+
+def test_delta_chain_without_id_listing(tmp_path):
+    root, parquet_root = str(tmp_path / "ndjson"), str(tmp_path / "parquet")
+    write_snapshot_folder(root, "20250203T070000", [make_record("a"), make_record("b")])
+    write_delta_folder(root, "20250204T070000", [make_record("c")])
+    write_delta_folder(root, "20250205T070000", [make_record("a", title="Renamed")])
+
+    folders = get_recent_snapshots(root, parquet_root, cycles=None)
+    assert len(folders) == 3
+    result = build_daily_statistics(folders[0], folders[1], parquet_root)
+    # without an id listing nothing is removed; the earlier records are carried over
+    assert result["counts"]["total_records"] == 3
+    assert result["deltas"]["removed"] == []
+    assert [r["id"] for r in result["deltas"]["modified"]] == ["a"]
+
+def test_delta_without_earlier_snapshot_is_skipped(tmp_path):
+    root, parquet_root = str(tmp_path / "ndjson"), str(tmp_path / "parquet")
+    write_delta_folder(root, "20250204T070000", [make_record("c")])
+    write_snapshot_folder(root, "20250205T070000", [make_record("a")])
+    assert [os.path.basename(f) for f in get_recent_snapshots(root, parquet_root)] == ["20250205T070000"]
+
+# a one-cycle run only builds the deltas it compares and the full snapshot they build on
+def test_only_the_requested_cycles_are_prepared(tmp_path):
+    root, parquet_root = str(tmp_path / "ndjson"), str(tmp_path / "parquet")
+    write_snapshot_folder(root, "20250201T070000", [make_record("a")])
+    write_delta_folder(root, "20250202T070000", [make_record("b")])
+    write_snapshot_folder(root, "20250203T070000", [make_record("a"), make_record("b")])
+    write_delta_folder(root, "20250204T070000", [make_record("c")])
+    write_delta_folder(root, "20250205T070000", [make_record("a", title="Renamed")], ids=["a", "c"])
+
+    folders = get_recent_snapshots(root, parquet_root)
+    assert [os.path.basename(f) for f in folders] == ["20250205T070000", "20250204T070000"]
+    built = sorted(f for f in os.listdir(parquet_root) if os.path.exists(os.path.join(parquet_root, f, "catalog.parquet")))
+    assert built == ["20250203T070000", "20250204T070000", "20250205T070000"]
+
+    result = build_daily_statistics(folders[0], folders[1], parquet_root)
+    assert [r["id"] for r in result["deltas"]["removed"]] == ["b"]
+
+def test_unapplied_delta_is_never_current(tmp_path):
+    root, parquet_root = str(tmp_path / "ndjson"), str(tmp_path / "parquet")
+    older = write_snapshot_folder(root, "20250203T070000", [make_record("a")])
+    folder = write_delta_folder(root, "20250204T070000", [make_record("b")])
+    with pytest.raises(ValueError, match="incremental harvest"):
+        scan_snapshot(folder, parquet_root)
+
+    get_recent_snapshots(root, parquet_root)
+    # a newer delta file makes the applied copy stale instead of counting as current
+    delta_file = os.path.join(folder, "delta", "download_0.ndjson")
+    later = os.path.getmtime(get_snapshot_path(folder, parquet_root)) + 10
+    os.utime(delta_file, (later, later))
+    with pytest.raises(ValueError, match="incremental harvest"):
+        scan_snapshot(folder, parquet_root)
+    assert scan_snapshot(older, parquet_root).collect().height == 1
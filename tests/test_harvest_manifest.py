@@ -0,0 +1,38 @@
+from harvest_manifest import HarvestManifest
+
+def keyset_page(manifest, page_index: int, status: str, cursor: str, last_id: str):
+    details = {"range_index": 2, "page_index": page_index, "cursor": cursor, "inclusive": page_index == 0, "last_id": last_id}
+    manifest.update_page(f"keyset_02_{page_index:05d}", status, **details)
+
+def test_a_range_without_pages_starts_at_its_lower_bound():
+    manifest = HarvestManifest("20250203T070000")
+    assert manifest.range_resume_point("keyset", 2, "20") == ("20", True, 0)
+
+def test_a_range_picks_up_after_its_last_done_page():
+    manifest = HarvestManifest("20250203T070000")
+    # page indexes sort numerically, not by insertion
+    for page_index, cursor, last_id in ((1, "2a", "2f"), (0, "20", "2a"), (10, "3c", "3d")):
+        keyset_page(manifest, page_index, "done", cursor, last_id)
+    assert manifest.range_resume_point("keyset", 2, "20") == ("3d", False, 11)
+    # other prefixes and ranges are separate
+    assert manifest.range_resume_point("ids", 2, "20") == ("20", True, 0)
+    assert manifest.range_resume_point("keyset", 3, "30") == ("30", True, 0)
+
+def test_a_range_refetches_its_first_page_that_isnt_done():
+    manifest = HarvestManifest("20250203T070000")
+    keyset_page(manifest, 0, "done", "20", "2a")
+    keyset_page(manifest, 1, "buffered", "2a", "2f")
+    keyset_page(manifest, 2, "failed", "2f", None)
+    assert manifest.range_resume_point("keyset", 2, "20") == ("2a", False, 1)
+
+def test_an_exhausted_range_is_skipped_and_survives_a_reload(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = HarvestManifest("20250203T070000", local_path=path)
+    keyset_page(manifest, 0, "done", "20", "2a")
+    manifest.mark_range_exhausted("keyset_02")
+    manifest.save()
+
+    reloaded = HarvestManifest("20250203T070000", local_path=path).load()
+    assert reloaded.range_resume_point("keyset", 2, "20") is None
+    assert reloaded.is_done("keyset_02_00000")
+    assert reloaded.summary() == "1 done"
@@ -0,0 +1,65 @@
+import io
+import json
+
+import orjson
+import pytest
+
+import json_to_ndjson
+from json_to_ndjson import convert_file, iter_json_array
+from sample_records import make_record
+
+records = [
+    make_record("a"),
+    dict(make_record("b", organization="noaa"), notes="brackets ] and [ commas , \"quotes\" and é"),
+    {"id": "c", "nested": [[1, 2], {"x": None}], "number": 1.5e10}
+]
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1024 * 1024])
+def test_iter_json_array_across_chunk_edges(chunk_size):
+    text = json.dumps(records, indent=2, ensure_ascii=False).encode("utf-8")
+    assert list(iter_json_array(io.BytesIO(text), chunk_size=chunk_size)) == records
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1024])
+def test_iter_json_array_scalars_and_escapes(chunk_size):
+    values = [1, -2.5e3, True, None, "a \\ \" \u00e9 ] , {", [], {}, [["]"]]]
+    text = json.dumps(values).encode("utf-8")
+    assert list(iter_json_array(io.BytesIO(text), chunk_size=chunk_size)) == values
+
+def test_iter_json_array_empty_and_invalid():
+    assert list(iter_json_array(io.BytesIO(b"  [ ]  "), chunk_size=2)) == []
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.BytesIO(b'{"id": "a"}')))
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.BytesIO(b'[{"id": "a"},'), chunk_size=4))
+
+# a malformed element fails as soon as it's read, not after reading the rest of the file
+def test_iter_json_array_fails_fast():
+    file = io.BytesIO(b'[{"id": "a"}, {"id": b}, ' + b'{"id": "c"}, ' * 10000 + b'{"id": "d"}]')
+    elements = iter_json_array(file, chunk_size=64)
+    assert next(elements) == {"id": "a"}
+    with pytest.raises(orjson.JSONDecodeError):
+        next(elements)
+    assert file.tell() < 1024
+
+    # an element that never closes stops at max_element_size
+    file = io.BytesIO(b'[{"id": [' + b'1, ' * 100000 + b']')
+    with pytest.raises(ValueError, match="larger than"):
+        list(iter_json_array(file, chunk_size=64, max_element_size=4096))
+    assert file.tell() < 8192
+
+def test_convert_file(tmp_path):
+    source = tmp_path / "page.json"
+    source.write_text(json.dumps(records), encoding="utf-8")
+    target = tmp_path / "page.ndjson"
+
+    assert convert_file(str(source), str(target)) == (3, 0)
+    lines = target.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == records
+
+def test_convert_file_rejects_lines_that_dont_read_back(tmp_path, monkeypatch):
+    source = tmp_path / "page.json"
+    source.write_text(json.dumps(records), encoding="utf-8")
+    dumps = orjson.dumps
+    monkeypatch.setattr(json_to_ndjson.orjson, "dumps", lambda item: dumps(item).replace(b'"c"', b'"x"'))
+
+    assert convert_file(str(source), str(tmp_path / "page.ndjson")) == (2, 1)
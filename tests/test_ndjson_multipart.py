@@ -0,0 +1,65 @@
+import gzip
+import json
+import time
+
+import zstandard
+
+from ndjson_multipart import MIN_PART_SIZE, MultipartNDJSONWriter
+from sample_records import make_record
+
+# the multipart calls of an S3 client, with slow part uploads
+class SlowS3:
+    def __init__(self, delay: float = 0.1):
+        self.delay = delay
+        self.parts = {}
+        self.objects = {}
+
+    def create_multipart_upload(self, Bucket, Key):
+        self.parts[Key] = {}
+        return {"UploadId": Key}
+
+    def upload_part(self, Body, Bucket, Key, UploadId, PartNumber):
+        time.sleep(self.delay)
+        self.parts[Key][PartNumber] = Body
+        return {"ETag": str(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.objects[Key] = b"".join(self.parts[Key][p["PartNumber"]] for p in MultipartUpload["Parts"])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.parts.pop(Key, None)
+
+def test_writer_round_trip_and_bounded_parts():
+    s3 = SlowS3()
+    writer = MultipartNDJSONWriter(s3, "bucket", "prefix", part_size=MIN_PART_SIZE, upload_threads=2)
+    pending = []
+    original_upload_part = s3.upload_part
+
+    # parts waiting in the pool's queue are held in memory until a thread picks them up
+    def upload_part(**kwargs):
+        pending.append(writer.uploads._work_queue.qsize())
+        return original_upload_part(**kwargs)
+    s3.upload_part = upload_part
+
+    record = make_record("a")
+    record["notes"] = "x" * 100000
+    records = [dict(record, id=f"id-{i:04d}") for i in range(600)]
+    for start in range(0, len(records), 50):
+        writer.write_records(records[start:start + 50])
+    objects = writer.close()
+
+    lines = [json.loads(line) for key in objects for line in s3.objects[key].splitlines()]
+    assert [r["id"] for r in lines] == [r["id"] for r in records]
+    assert len(pending) >= 10
+    # the threads hold some of the pending parts, the rest wait in the queue
+    assert max(pending) <= writer.max_pending_parts - 1
+
+def test_compressed_objects_read_back():
+    for compression, decompress in (("gzip", gzip.decompress), ("zstd", zstandard.ZstdDecompressor().decompressobj().decompress)):
+        s3 = SlowS3(delay=0)
+        writer = MultipartNDJSONWriter(s3, "bucket", "prefix", compression=compression)
+        records = [make_record(f"id-{i}") for i in range(20)]
+        writer.write_records(records)
+        objects = writer.close()
+        assert objects[0].endswith(f".ndjson.{'gz' if compression == 'gzip' else 'zst'}")
+        assert [json.loads(line) for line in decompress(s3.objects[objects[0]]).splitlines()] == records
@@ -0,0 +1,47 @@
+import polars as pl
+
+from catalog_statistics import build_daily_statistics, collect_catalog_info, filter_catalog
+from organization_dimension import add_organizations, get_excluded_ids, load_organization_dimension
+from snapshot_store import scan_snapshot
+from sample_records import make_record, organizations, write_snapshot_folder
+
+census, noaa = organizations["census"], organizations["noaa"]
+
+# organizations.csv lists census under its own title; noaa is only known from the snapshots
+def write_dimension_files(tmp_path, excluded: list[str]) -> tuple[str, str]:
+    organizations_file = tmp_path / "organizations.csv"
+    pl.DataFrame([dict(census, title="Census Bureau")]).write_csv(organizations_file)
+    excluded_file = tmp_path / "excluded_organizations.csv"
+    excluded_file.write_text("\n".join(excluded + [""]))
+    return str(organizations_file), str(excluded_file)
+
+def test_repository_dimension_flags_every_excluded_id():
+    dimension = load_organization_dimension()
+    excluded = get_excluded_ids(dimension)
+    assert len(excluded) == 46
+    assert dimension.get_column("organization_key").to_list() == list(range(dimension.height))
+
+def test_add_organizations_keeps_existing_keys(tmp_path):
+    dimension = load_organization_dimension(*write_dimension_files(tmp_path, ["excluded-only-id"]))
+    extended = add_organizations(dimension, pl.DataFrame([census, noaa]))
+    assert extended.head(dimension.height).equals(dimension)
+    assert extended.filter(pl.col("id") == noaa["id"]).get_column("organization_key").to_list() == [dimension.height]
+    assert get_excluded_ids(extended) == ["excluded-only-id"]
+
+def test_statistics_use_the_dimension(tmp_path):
+    dimension = load_organization_dimension(*write_dimension_files(tmp_path, [noaa["id"]]))
+    root, parquet_root = str(tmp_path / "ndjson"), str(tmp_path / "parquet")
+    older = write_snapshot_folder(root, "20250203T070000", [make_record("a"), make_record("n", organization="noaa")])
+    newer = write_snapshot_folder(root, "20250204T070000",
+                                  [make_record("a"), make_record("b"), make_record("m", organization="noaa")])
+
+    result = build_daily_statistics(newer, older, parquet_root, dimension=dimension)
+    assert result["counts"]["total_records"] == 2
+    assert [(o["id"], o["title"], o["catalog_count"]) for o in result["counts"]["organizations"]] == [(census["id"], "Census Bureau", 2)]
+    assert [r["id"] for r in result["deltas"]["added"]] == ["b"]
+    assert result["deltas"]["removed"] == []
+
+    # the scan-based counts agree with the index-based ones
+    catalog = filter_catalog(scan_snapshot(newer, parquet_root), get_excluded_ids(dimension))
+    info = collect_catalog_info(catalog, dimension)
+    assert info["organizations"] == result["counts"]["organizations"]
@@ -0,0 +1,84 @@
+import gzip
+import json
+
+import zstandard
+
+from catalog_storage import get_storage
+from record_archive import RecordArchive, ndjson_prefix, pack_snapshot
+from sample_records import make_record
+
+# a harvested snapshot in the bucket layout, split over a plain and a gzip object
+def put_snapshot(storage, day: str, records: list[dict]):
+    lines = [json.dumps(record) + "\n" for record in records]
+    half = len(lines) // 2
+    storage.put(f"{ndjson_prefix}/{day}/page_0.ndjson", "".join(lines[:half]))
+    storage.put(f"{ndjson_prefix}/{day}/page_1.ndjson.gz", gzip.compress("".join(lines[half:]).encode("utf-8")))
+
+def pack_days(tmp_path) -> RecordArchive:
+    storage = get_storage(f"file://{tmp_path}/bucket")
+    archive = RecordArchive(storage)
+    put_snapshot(storage, "20250203T070000", [make_record("a"), make_record("b"), make_record("c")])
+    put_snapshot(storage, "20250204T070000", [make_record("a"), make_record("b", title="Renamed"), make_record("d")])
+    put_snapshot(storage, "20250205T070000", [make_record("a"), make_record("b", title="Renamed"), make_record("c"), make_record("d")])
+    for day in ("20250203T070000", "20250204T070000", "20250205T070000"):
+        pack_snapshot(storage, day, archive=archive)
+    return archive
+
+def test_pack_streams_objects_and_restores_a_day(tmp_path):
+    storage = get_storage(f"file://{tmp_path}/bucket")
+    storage.get_many = None  # packing must not download whole objects in batches
+    records = [make_record(f"id-{i}") for i in range(50)] + [make_record("id-0")]
+    put_snapshot(storage, "20250203T070000", records)
+
+    result = pack_snapshot(storage, "20250203T070000", prune=True)
+    assert result["records"] == 50 and result["new_versions"] == 50 and result["pruned"] == 2
+    assert storage.list_keys(f"{ndjson_prefix}/") == []
+
+    path = tmp_path / "restored" / "records.ndjson"
+    assert RecordArchive(storage).write_ndjson("20250203T070000", str(path)) == 50
+    restored = sorted((json.loads(line) for line in path.read_text().splitlines()), key=lambda r: r["id"])
+    assert restored == sorted(records[:50], key=lambda r: r["id"])
+
+def test_unchanged_records_are_not_stored_again(tmp_path):
+    archive = pack_days(tmp_path)
+    assert archive.list_days() == ["20250203T070000", "20250204T070000", "20250205T070000"]
+    since, changes = archive.read_changes("20250204T070000")
+    assert since == "20250203T070000"
+    assert [(dataset_id, version is None) for dataset_id, version, _, _ in changes] == [("b", False), ("c", True), ("d", False)]
+    assert [row[0] for row in archive.read_changes("20250205T070000")[1]] == ["c"]
+
+def test_history_reads_changes_not_listings(tmp_path):
+    archive = pack_days(tmp_path)
+    full_listings = []
+    read_day = archive.read_day
+    archive.read_day = lambda day: full_listings.append(day) or read_day(day)
+
+    history = archive.history("c")
+    assert [(v["day"], v["hash"] is None) for v in history] == [
+        ("20250203T070000", False), ("20250204T070000", True), ("20250205T070000", False)
+    ]
+    assert history[0]["hash"] == history[2]["hash"]
+    assert archive.read_record(history[2]["chunk"], history[2]["line"]) == make_record("c")
+    assert [v["day"] for v in archive.history("b")] == ["20250203T070000", "20250204T070000"]
+    assert archive.read_record(archive.history("b")[1]["chunk"], archive.history("b")[1]["line"])["title"] == "Renamed"
+    assert [v["day"] for v in archive.history("d")] == ["20250204T070000"]
+    # only the first day of each lookup needs its full listing
+    assert set(full_listings) == {"20250203T070000"}
+
+def test_history_falls_back_to_listings_without_changes(tmp_path):
+    archive = pack_days(tmp_path)
+    archive.storage.delete(archive.changes_key("20250204T070000"))
+    assert [(v["day"], v["hash"] is None) for v in archive.history("c")] == [
+        ("20250203T070000", False), ("20250204T070000", True), ("20250205T070000", False)
+    ]
+    # changes taken against a day that isn't the one before in the lookup aren't used
+    assert [v["day"] for v in archive.history("c", days=["20250203T070000", "20250205T070000"])] == ["20250203T070000"]
+
+def test_pack_reads_zstd_objects(tmp_path):
+    storage = get_storage(f"file://{tmp_path}/bucket")
+    records = [make_record("a"), make_record("b")]
+    body = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+    storage.put(f"{ndjson_prefix}/20250203T070000/part_0000.ndjson.zst", zstandard.ZstdCompressor().compress(body))
+
+    assert pack_snapshot(storage, "20250203T070000")["records"] == 2
+    assert [json.loads(line) for line in RecordArchive(storage).iter_day("20250203T070000")] == records
@@ -0,0 +1,55 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+from request_scheduler import AdaptiveScheduler, parse_retry_after
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("120") == 120.0
+    assert parse_retry_after("-5") == 0.0
+    assert parse_retry_after("soon") is None
+    retry_at = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+    assert 55 <= parse_retry_after(retry_at) <= 60
+
+def test_additive_increase_and_multiplicative_decrease():
+    scheduler = AdaptiveScheduler(initial_concurrency=4, max_concurrency=8, latency_target=1.0)
+    # about one slot per window of successes
+    for _ in range(5):
+        scheduler.on_success(0.1)
+    assert scheduler.concurrency == 5
+    scheduler.on_throttle()
+    assert scheduler.concurrency == 2
+    # a second failure from the same window doesn't halve the limit again
+    scheduler.on_error()
+    assert scheduler.concurrency == 2
+    assert (scheduler.throttled, scheduler.errors) == (1, 1)
+
+def test_slow_responses_decrease_the_limit():
+    scheduler = AdaptiveScheduler(initial_concurrency=8, latency_target=1.0)
+    scheduler.on_success(2.0)
+    assert scheduler.concurrency == 4
+
+def test_retry_after_pauses_and_sets_the_delay():
+    scheduler = AdaptiveScheduler()
+    scheduler.on_throttle(retry_after=30)
+    assert 29 < scheduler.pause_remaining() <= 30
+    assert scheduler.retry_delay(1, retry_after=30) == 30
+    assert scheduler.retry_delay(20) <= scheduler.max_backoff * 1.25
+
+def test_async_slots_respect_the_limit():
+    scheduler = AdaptiveScheduler(initial_concurrency=3, max_concurrency=3)
+    peak = 0
+
+    async def request():
+        nonlocal peak
+        async with scheduler.slot():
+            peak = max(peak, scheduler.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*[request() for _ in range(20)])
+
+    asyncio.run(main())
+    assert peak == 3
+    assert scheduler.in_flight == 0
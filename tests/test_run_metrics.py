@@ -0,0 +1,66 @@
+import json
+
+from catalog_storage import get_storage
+from run_metrics import Histogram, RunMetrics
+
+def make_metrics() -> RunMetrics:
+    metrics = RunMetrics(job="harvest", run="20250203T070000")
+    metrics.increment("requests_total", status=200)
+    metrics.increment("requests_total", 2, status=200)
+    metrics.increment("requests_total", status=429)
+    metrics.set_gauge("records", 230)
+    metrics.observe("fetch_seconds", 0.3, bounds=(0.1, 0.5))
+    metrics.observe("fetch_seconds", 0.05, bounds=(0.1, 0.5))
+    metrics.observe("fetch_seconds", 2.0, bounds=(0.1, 0.5))
+    return metrics
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram(bounds=(0.1, 0.5, 1))
+    for value in (0.05, 0.2, 0.3, 0.4, 5):
+        histogram.observe(value)
+    assert histogram.counts == [1, 3, 0, 1]
+    assert (histogram.quantile(0.5), histogram.quantile(0.8), histogram.quantile(1.0)) == (0.5, 0.5, float("inf"))
+    assert histogram.to_dict() == {"count": 5, "sum": 5.95, "buckets": {"le_0.1": 1, "le_0.5": 3, "le_1": 0, "le_inf": 1}}
+    assert Histogram().quantile(0.5) == 0.0
+
+def test_json_keeps_every_metric_with_its_labels():
+    result = json.loads(make_metrics().to_json())
+    assert result["labels"] == {"job": "harvest", "run": "20250203T070000"}
+    assert result["counters"] == [
+        {"name": "requests_total", "labels": {"status": "200"}, "value": 3},
+        {"name": "requests_total", "labels": {"status": "429"}, "value": 1}
+    ]
+    assert result["gauges"] == [{"name": "records", "labels": {}, "value": 230}]
+    assert result["histograms"] == [{"name": "fetch_seconds", "labels": {}, "count": 3, "sum": 2.35,
+                                     "buckets": {"le_0.1": 1, "le_0.5": 1, "le_inf": 1}}]
+
+def test_prometheus_text_has_cumulative_buckets():
+    lines = make_metrics().to_prometheus().splitlines()
+    labels = 'job="harvest",run="20250203T070000"'
+    assert lines == [
+        "# TYPE datagov_catalog_requests_total counter",
+        f'datagov_catalog_requests_total{{{labels},status="200"}} 3',
+        f'datagov_catalog_requests_total{{{labels},status="429"}} 1',
+        "# TYPE datagov_catalog_records gauge",
+        f"datagov_catalog_records{{{labels}}} 230",
+        "# TYPE datagov_catalog_fetch_seconds histogram",
+        f'datagov_catalog_fetch_seconds_bucket{{{labels},le="0.1"}} 1',
+        f'datagov_catalog_fetch_seconds_bucket{{{labels},le="0.5"}} 2',
+        f'datagov_catalog_fetch_seconds_bucket{{{labels},le="+Inf"}} 3',
+        f"datagov_catalog_fetch_seconds_sum{{{labels}}} 2.35",
+        f"datagov_catalog_fetch_seconds_count{{{labels}}} 3"
+    ]
+
+def test_write_locally_and_to_storage(tmp_path):
+    metrics = make_metrics()
+    with metrics.timer("upload", kind="page"):
+        pass
+    path = metrics.write(str(tmp_path / "run"), prometheus=True)
+    assert json.loads(open(path).read())["histograms"][1]["labels"] == {"kind": "page"}
+    assert (tmp_path / "run" / "run_metrics.prom").read_text() == metrics.to_prometheus()
+
+    storage = get_storage(f"file://{tmp_path}/archive")
+    key = metrics.write_to_storage(storage, "Catalog/20250203T070000")
+    assert key == "Catalog/20250203T070000/run_metrics.json"
+    assert json.loads(storage.get(key))["gauges"] == [{"name": "records", "labels": {}, "value": 230}]
+    assert not storage.exists("Catalog/20250203T070000/run_metrics.prom")
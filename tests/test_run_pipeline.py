@@ -0,0 +1,77 @@
+import json
+import os
+
+import polars as pl
+
+from catalog_storage import get_storage
+import run_pipeline
+from run_pipeline import harvester
+from sample_records import make_record, write_snapshot_folder
+from snapshot_index import build_index, load_snapshot_index
+from snapshot_store import get_snapshot_path
+from statistics_store import ingest_statistics, open_store, query_metric
+
+# hands the pages to the pipeline like the harvester does, without the network
+def fake_harvest(pages: list[list[dict]]):
+    async def harvest(on_records=None, **options):
+        stats = harvester.HarvestStats()
+        for page in pages:
+            await on_records(page)
+            stats.pages_fetched += 1
+        return stats
+    return harvest
+
+def test_pipeline_on_a_fresh_data_folder(tmp_path, monkeypatch):
+    monkeypatch.delenv("CATALOG_STORAGE", raising=False)
+    monkeypatch.setattr(run_pipeline, "part_records", 2)
+    # "b" is listed again, changed, in a later part; both outputs keep the first record
+    pages = [
+        [make_record("b"), make_record("a")],
+        [make_record("c", organization="noaa"), make_record("b", title="Listed again")],
+        [make_record("d"), make_record("c", organization="noaa", title="Listed again")]
+    ]
+    monkeypatch.setattr(harvester, "harvest", fake_harvest(pages))
+
+    data_folder = str(tmp_path / "data")
+    summary = run_pipeline.run_pipeline(data_folder=data_folder, statistics=False)
+    assert summary["records"] == 4
+
+    snapshot_folder = os.path.join(data_folder, "data_gov_catalog_ndjson", summary["run"])
+    parquet_root = os.path.join(data_folder, "data_gov_catalog_parquet")
+    catalog = pl.read_parquet(get_snapshot_path(snapshot_folder, parquet_root))
+    assert catalog.filter(pl.col("title") == "Listed again").height == 0
+
+    index, organizations = load_snapshot_index(snapshot_folder, parquet_root)
+    assert index.equals(build_index(catalog.lazy()).collect())
+    assert organizations.height == 2
+
+# with an archive the statistics store is restored from it before the day is ingested, then
+# saved back with the run metrics
+def test_pipeline_keeps_the_store_and_metrics_in_the_archive(tmp_path, monkeypatch):
+    archive_root = tmp_path / "archive"
+    monkeypatch.setenv("CATALOG_STORAGE", f"file://{archive_root}")
+    monkeypatch.setattr(harvester, "harvest", fake_harvest([[make_record("a"), make_record("b")]]))
+    data_folder = str(tmp_path / "data")
+    write_snapshot_folder(os.path.join(data_folder, "data_gov_catalog_ndjson"), "20250203T070000", [make_record("a")])
+
+    archived_store = str(tmp_path / "archived.sqlite")
+    store = open_store(archived_store)
+    ingest_statistics(store, {"date": "20250202T070000", "counts": {
+        "total_records": 1, "total_resources": 2, "organizations": []
+    }, "deltas": {}})
+    store.close()
+    storage = get_storage(f"file://{archive_root}")
+    with open(archived_store, "rb") as file:
+        storage.put(f"{run_pipeline.statistics_prefix}/statistics.sqlite", file.read())
+
+    summary = run_pipeline.run_pipeline(data_folder=data_folder)
+    assert summary["statistics"] is not None
+
+    saved = str(tmp_path / "saved.sqlite")
+    with open(saved, "wb") as file:
+        file.write(storage.get(f"{run_pipeline.statistics_prefix}/statistics.sqlite"))
+    store = open_store(saved)
+    assert [value for _, value in query_metric(store, "dataset_count")] == [1, 2]
+    store.close()
+    metrics = json.loads(storage.get(f"{run_pipeline.statistics_prefix}/metrics/{summary['run']}/run_metrics.json"))
+    assert metrics["labels"]["job"] == "pipeline"
@@ -0,0 +1,33 @@
+import json
+import os
+
+from catalog_statistics import build_daily_statistics
+from organization_dimension import load_organization_dimension
+from sample_records import make_record, organizations, write_snapshot_folder
+from test_organization_dimension import write_dimension_files
+
+# package_show records for some of a day's changes, as get_package_details.py leaves them
+def write_details(folder: str, records: list[dict], summary: dict):
+    os.makedirs(os.path.join(folder, "details"))
+    with open(os.path.join(folder, "details", "details_0.ndjson"), "w") as file:
+        file.writelines(json.dumps(record) + "\n" for record in records)
+    with open(os.path.join(folder, "details", "details.json"), "w") as file:
+        json.dump(summary, file)
+
+def test_statistics_report_the_comparison_filesets_details(tmp_path):
+    root, parquet_root = str(tmp_path / "ndjson"), str(tmp_path / "parquet")
+    older = write_snapshot_folder(root, "20250203T070000", [make_record("a"), make_record("n", organization="noaa")])
+    newer = write_snapshot_folder(root, "20250204T070000", [make_record("a"), make_record("b")])
+
+    assert "details" not in build_daily_statistics(newer, older, parquet_root)
+
+    summary = {"requested": 3, "fetched": 2, "failed": 1}
+    write_details(older, [make_record("a"), make_record("n", organization="noaa")], summary)
+    result = build_daily_statistics(newer, older, parquet_root)
+    assert result["details"] == {"fileset": older, "fetch": summary, "records": 2, "organizations": 2}
+    assert os.path.exists(os.path.join(parquet_root, "20250203T070000", "details.parquet"))
+
+    # excluded organizations are left out of the details too
+    dimension = load_organization_dimension(*write_dimension_files(tmp_path, [organizations["noaa"]["id"]]))
+    result = build_daily_statistics(newer, older, parquet_root, dimension=dimension)
+    assert (result["details"]["records"], result["details"]["organizations"]) == (1, 1)
@@ -0,0 +1,30 @@
+import polars as pl
+
+from snapshot_index import index_changes, is_index_current, load_snapshot_index
+from sample_records import make_record, write_snapshot_folder
+
+def test_build_and_read_back_index(tmp_path):
+    folder = write_snapshot_folder(tmp_path / "ndjson", "20250203T070000",
+                                   [make_record("c"), make_record("a", organization="noaa"), make_record("b")])
+    parquet_root = str(tmp_path / "parquet")
+
+    index, organizations = load_snapshot_index(folder, parquet_root)
+    assert is_index_current(folder, parquet_root)
+    assert index.get_column("id").to_list() == ["a", "b", "c"]
+    assert index.get_column("resource_count").to_list() == [2, 2, 2]
+    assert index.get_column("record_hash").null_count() == 0
+    assert index.get_column("publisher").to_list() == ["U.S. Census Bureau"] * 3
+    assert sorted(organizations.get_column("name").to_list()) == ["census-gov", "noaa-gov"]
+
+    # a second load reads the saved files
+    reloaded, _ = load_snapshot_index(folder, parquet_root)
+    assert reloaded.equals(index)
+
+def test_index_changes(tmp_path):
+    older = write_snapshot_folder(tmp_path / "ndjson", "20250203T070000", [make_record("a"), make_record("b"), make_record("c")])
+    newer = write_snapshot_folder(tmp_path / "ndjson", "20250204T070000",
+                                  [make_record("a"), make_record("b", resource_formats=["CSV"]), make_record("d")])
+    parquet_root = str(tmp_path / "parquet")
+
+    changes = index_changes(load_snapshot_index(older, parquet_root)[0], load_snapshot_index(newer, parquet_root)[0])
+    assert sorted(changes.select("id", "change").iter_rows()) == [("b", "modified"), ("c", "removed"), ("d", "added")]
@@ -0,0 +1,70 @@
+import polars as pl
+
+from sample_records import make_record, organizations, write_snapshot_folder
+from snapshot_resources import diff_resources, load_snapshot_resources, resource_counts, resource_format, url_host
+
+census, noaa = organizations["census"]["id"], organizations["noaa"]["id"]
+
+def resources_frame(rows: list[tuple]) -> pl.LazyFrame:
+    return pl.LazyFrame(rows, schema=["dataset_id", "organization_id", "resource_id", "format", "url", "url_host", "resource_hash"],
+                        orient="row", schema_overrides={"resource_hash": pl.UInt64})
+
+def test_formats_and_hosts_are_normalized():
+    frame = pl.DataFrame({
+        "url": ["https://www.Census.gov/a.csv", "ftp://user@ftp.noaa.gov:21/b", "HTTP://data.gov?x=1", "not a url", None],
+        "format": [" csv", ".JSON", "", "Zip ", None]
+    })
+    assert frame.select(url_host, resource_format).rows() == [
+        ("census.gov", "CSV"), ("ftp.noaa.gov", "JSON"), ("data.gov", None), (None, "ZIP"), (None, None)
+    ]
+
+def test_resources_table_from_a_snapshot(tmp_path):
+    folder = write_snapshot_folder(str(tmp_path / "ndjson"), "20250203T070000", [
+        make_record("b", resource_formats=[" csv", ".Json"]),
+        make_record("a", organization="noaa", resource_formats=[]),
+        make_record("c", resource_formats=[""])
+    ])
+    resources = load_snapshot_resources(folder, str(tmp_path / "parquet")).collect()
+    # datasets without resources have no rows
+    assert resources.select("resource_id", "dataset_id", "format", "url_host").rows() == [
+        ("b-r0", "b", "CSV", "www2.census.gov"), ("b-r1", "b", "JSON", "www2.census.gov"), ("c-r0", "c", None, "www2.census.gov")
+    ]
+    assert resources.get_column("resource_hash").n_unique() == 3
+
+def test_resource_counts():
+    counts = resource_counts(resources_frame([
+        ("a", census, "a-1", "CSV", "https://census.gov/shared.csv", "census.gov", 1),
+        ("a", census, "a-2", "PDF", "https://census.gov/a.pdf", "census.gov", 2),
+        ("b", census, "b-1", "CSV", "https://census.gov/shared.csv", "census.gov", 3),
+        ("n", noaa, "n-1", None, None, None, 4)
+    ]))
+    assert (counts["total_resources"], counts["datasets_with_resources"]) == (4, 3)
+    assert counts["by_format"] == [
+        {"format": "CSV", "resource_count": 2, "dataset_count": 2},
+        {"format": "PDF", "resource_count": 1, "dataset_count": 1},
+        {"format": None, "resource_count": 1, "dataset_count": 1}
+    ]
+    assert counts["by_host"][0] == {"url_host": "census.gov", "resource_count": 3, "dataset_count": 2}
+    assert counts["by_organization"] == [
+        {"organization_id": census, "resource_count": 3, "format_count": 2, "host_count": 1},
+        {"organization_id": noaa, "resource_count": 1, "format_count": 0, "host_count": 0}
+    ]
+    assert (counts["shared_urls"], counts["datasets_sharing_urls"]) == (1, 2)
+
+def test_resource_changes_by_hash():
+    older = resources_frame([
+        ("a", census, "a-1", "CSV", None, None, 1),
+        ("a", census, "a-2", "PDF", None, None, 2),
+        ("b", census, "b-1", "CSV", None, None, 3)
+    ])
+    newer = resources_frame([
+        ("a", census, "a-1", "CSV", None, None, 1),
+        ("a", census, "a-2", "XLSX", None, None, 5),
+        ("c", census, "c-1", "API", None, None, 6)
+    ])
+    assert diff_resources(older, newer) == {
+        "added": [{"resource_id": "c-1", "dataset_id": "c", "format": "API"}],
+        "removed": [{"resource_id": "b-1", "dataset_id": "b", "format": "CSV"}],
+        "modified": [{"resource_id": "a-2", "dataset_id": "a", "format": "XLSX"}]
+    }
+    assert diff_resources(older, older) == {"added": [], "removed": [], "modified": []}
@@ -0,0 +1,71 @@
+import json
+import os
+
+from statistics_store import catalog_key, ingest_statistics, open_store, query_metric, update_store
+
+census_id = "7d8a2f3c-1b4e-4c6a-9f0e-2a1b3c4d5e6f"
+
+# a daily statistics result in the layout write_daily_statistics saves
+def make_result(date: str, datasets: int, added: list[str]) -> dict:
+    return {
+        "date": date,
+        "version": 6,
+        "counts": {
+            "total_records": datasets,
+            "total_resources": datasets * 2,
+            "organizations": [{"id": census_id, "name": "census-gov", "title": "Census Bureau",
+                               "catalog_count": datasets, "resource_count": datasets * 2}]
+        },
+        "deltas": {
+            "added": [{"id": dataset_id, "organization_id": census_id} for dataset_id in added],
+            "removed": [],
+            "modified": []
+        }
+    }
+
+def test_ingest_two_days_and_roll_them_up(tmp_path):
+    store = open_store(str(tmp_path / "statistics.sqlite"))
+    # Tuesday and Thursday of the same week
+    ingest_statistics(store, make_result("20250204T070000", 10, ["a"]))
+    ingest_statistics(store, make_result("20250206T070000", 14, ["b", "c"]))
+
+    assert query_metric(store, "dataset_count") == [("2025-02-04", 10), ("2025-02-06", 14)]
+    assert query_metric(store, "datasets_added", organization="census-gov") == [("2025-02-04", 1), ("2025-02-06", 2)]
+    assert query_metric(store, "dataset_count", start="2025-02-05") == [("2025-02-06", 14)]
+    assert query_metric(store, "dataset_count", period="week") == [("2025-02-03", 14)]
+
+    rollup = store.execute(
+        "SELECT days, last, min, max, mean, sum FROM rollups WHERE period = 'month' AND organization_id = ? AND metric = 'dataset_count'",
+        (catalog_key,)
+    ).fetchone()
+    assert rollup == (2, 14, 10, 14, 12, 24)
+    store.close()
+
+def test_reingesting_a_day_replaces_it(tmp_path):
+    store = open_store(str(tmp_path / "statistics.sqlite"))
+    ingest_statistics(store, make_result("20250204T070000", 10, ["a"]))
+    ingest_statistics(store, make_result("20250206T070000", 14, []))
+    ingest_statistics(store, make_result("20250204T070000", 11, ["a"]))
+    ingest_statistics(store, make_result("20250204T070000", 11, ["a"]))
+
+    assert query_metric(store, "dataset_count") == [("2025-02-04", 11), ("2025-02-06", 14)]
+    assert query_metric(store, "datasets_added", organization=census_id) == [("2025-02-04", 1)]
+    assert store.execute("SELECT min, sum FROM rollups WHERE period = 'week' AND organization_id = ? AND metric = 'dataset_count'",
+                         (catalog_key,)).fetchone() == (11, 25)
+    store.close()
+
+def test_update_store_only_ingests_new_or_changed_files(tmp_path):
+    statistics_folder = tmp_path / "daily_statistics"
+    statistics_folder.mkdir()
+    for date, datasets in (("20250204T070000", 10), ("20250206T070000", 14)):
+        (statistics_folder / f"{date}.json").write_text(json.dumps(make_result(date, datasets, [])))
+    store = open_store(str(tmp_path / "statistics.sqlite"))
+
+    assert update_store(store, str(statistics_folder)) == ["2025-02-04", "2025-02-06"]
+    assert update_store(store, str(statistics_folder)) == []
+    path = statistics_folder / "20250206T070000.json"
+    path.write_text(json.dumps(make_result("20250206T070000", 15, [])))
+    os.utime(path, (os.path.getmtime(path) + 10, os.path.getmtime(path) + 10))
+    assert update_store(store, str(statistics_folder)) == ["2025-02-06"]
+    assert query_metric(store, "dataset_count")[-1] == ("2025-02-06", 15)
+    store.close()